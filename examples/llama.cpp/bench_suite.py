@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite of the llama.cpp packages, with a history of the results.
+
+`run` executes llama-bench in the given pixi environments (`cpu`, `default`)
+over a matrix of prompt/generation lengths, batch sizes and thread counts, and
+appends one record per test to a JSON-lines results file. Each record is keyed
+by the build string of the llama.cpp package and the rocm-core version of the
+environment, so results of different builds can be compared.
+
+`compare` matches the tests of two builds and flags the throughput regressions
+larger than the threshold and the noise (the standard deviation of the runs).
+
+`create-model` writes a tiny llama model with random weights (about 1.5 MB,
+no network needed), the default model of the suite: its numbers are only
+meaningful to compare builds with each other.
+
+Only the standard library is needed, so the suite runs with the python of the
+root workspace (`pixi run benchmark-suite`) while the environments of this
+workspace only provide llama-bench.
+
+    python bench_suite.py create-model tiny-llama.gguf
+    python bench_suite.py run --environment cpu
+    python bench_suite.py compare
+"""
+
+import argparse
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+WORKSPACE_DIR = Path(__file__).resolve().parent
+DEFAULT_MODEL = WORKSPACE_DIR / "tiny-llama.gguf"
+DEFAULT_RESULTS = WORKSPACE_DIR / "bench-results.jsonl"
+
+# llama-bench fields that identify a test, and the ones stored with the results
+TEST_FIELDS = ("model_filename", "n_prompt", "n_gen", "n_batch", "n_ubatch", "n_threads", "n_gpu_layers")
+INFO_FIELDS = ("build_commit", "backends", "cpu_info", "gpu_info", "model_type", "model_size", "avg_ts", "stddev_ts")
+
+# GGUF value types
+GGUF_UINT32, GGUF_INT32, GGUF_FLOAT32, GGUF_STRING, GGUF_ARRAY = 4, 5, 6, 8, 9
+GGUF_ALIGNMENT = 32
+GGML_TYPE_F32 = 0
+# Token types of the llama vocabulary
+TOKEN_UNKNOWN, TOKEN_CONTROL, TOKEN_BYTE = 2, 3, 6
+
+
+def gguf_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("<Q", len(data)) + data
+
+
+def gguf_value(value: object) -> bytes:
+    """Encode a metadata value as <type><value>. Lists must be homogeneous."""
+    if isinstance(value, str):
+        return struct.pack("<I", GGUF_STRING) + gguf_string(value)
+    if isinstance(value, float):
+        return struct.pack("<If", GGUF_FLOAT32, value)
+    if isinstance(value, int):
+        return struct.pack("<II", GGUF_UINT32, value)
+    if isinstance(value, list):
+        if isinstance(value[0], str):
+            items = b"".join(gguf_string(v) for v in value)
+            return struct.pack("<IIQ", GGUF_ARRAY, GGUF_STRING, len(value)) + items
+        if isinstance(value[0], float):
+            return struct.pack("<IIQ", GGUF_ARRAY, GGUF_FLOAT32, len(value)) + array("f", value).tobytes()
+        return struct.pack("<IIQ", GGUF_ARRAY, GGUF_INT32, len(value)) + array("i", value).tobytes()
+    raise TypeError(f"unsupported GGUF value {value!r}")
+
+
+def create_model(path: Path, n_embd: int = 128, n_ff: int = 256, n_layer: int = 2, n_head: int = 4,
+                 seed: int = 0) -> None:
+    """Write a llama model with random F32 weights and a byte-level vocabulary."""
+    tokens = ["<unk>", "<s>", "</s>"] + [f"<0x{byte:02X}>" for byte in range(256)]
+    token_types = [TOKEN_UNKNOWN, TOKEN_CONTROL, TOKEN_CONTROL] + [TOKEN_BYTE] * 256
+    n_vocab = len(tokens)
+    metadata = {
+        "general.architecture": "llama",
+        "general.name": "tiny-llama",
+        "general.file_type": 0,
+        "llama.context_length": 4096,
+        "llama.embedding_length": n_embd,
+        "llama.block_count": n_layer,
+        "llama.feed_forward_length": n_ff,
+        "llama.attention.head_count": n_head,
+        "llama.attention.head_count_kv": n_head,
+        "llama.rope.dimension_count": n_embd // n_head,
+        "llama.attention.layer_norm_rms_epsilon": 1e-5,
+        "tokenizer.ggml.model": "llama",
+        "tokenizer.ggml.tokens": tokens,
+        "tokenizer.ggml.scores": [0.0] * n_vocab,
+        "tokenizer.ggml.token_type": token_types,
+        "tokenizer.ggml.bos_token_id": 1,
+        "tokenizer.ggml.eos_token_id": 2,
+        "tokenizer.ggml.unknown_token_id": 0,
+    }
+
+    # Shapes in GGML order (innermost dimension first)
+    shapes: List[Tuple[str, Tuple[int, ...]]] = [("token_embd.weight", (n_embd, n_vocab))]
+    for layer in range(n_layer):
+        shapes += [
+            (f"blk.{layer}.attn_norm.weight", (n_embd,)),
+            (f"blk.{layer}.attn_q.weight", (n_embd, n_embd)),
+            (f"blk.{layer}.attn_k.weight", (n_embd, n_embd)),
+            (f"blk.{layer}.attn_v.weight", (n_embd, n_embd)),
+            (f"blk.{layer}.attn_output.weight", (n_embd, n_embd)),
+            (f"blk.{layer}.ffn_norm.weight", (n_embd,)),
+            (f"blk.{layer}.ffn_gate.weight", (n_embd, n_ff)),
+            (f"blk.{layer}.ffn_down.weight", (n_ff, n_embd)),
+            (f"blk.{layer}.ffn_up.weight", (n_embd, n_ff)),
+        ]
+    shapes += [("output_norm.weight", (n_embd,)), ("output.weight", (n_embd, n_vocab))]
+
+    rng = random.Random(seed)
+    header = [b"GGUF", struct.pack("<IQQ", 3, len(shapes), len(metadata))]
+    header += [gguf_string(key) + gguf_value(value) for key, value in metadata.items()]
+    tensors = []
+    offset = 0
+    for name, shape in shapes:
+        count = 1
+        for dim in shape:
+            count *= dim
+        if len(shape) == 1:  # norm weights
+            data = array("f", [1.0] * count).tobytes()
+        else:
+            data = array("f", (rng.uniform(-0.05, 0.05) for _ in range(count))).tobytes()
+        header.append(gguf_string(name) + struct.pack(f"<I{len(shape)}QIQ", len(shape), *shape, GGML_TYPE_F32, offset))
+        padding = -len(data) % GGUF_ALIGNMENT
+        tensors.append(data + b"\0" * padding)
+        offset += len(data) + padding
+
+    header_data = b"".join(header)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as handle:
+        handle.write(header_data + b"\0" * (-len(header_data) % GGUF_ALIGNMENT))
+        for data in tensors:
+            handle.write(data)
+    os.replace(tmp_path, path)
+
+
+def environment_packages(environment: str) -> Dict[str, Dict[str, str]]:
+    """Return name -> {version, build} of the llama.cpp and rocm-core packages of a pixi environment."""
+    packages = {}
+    for path in (WORKSPACE_DIR / ".pixi" / "envs" / environment / "conda-meta").glob("*.json"):
+        if not (path.name.startswith("llama.cpp-") or path.name.startswith("rocm-core-")):
+            continue
+        with path.open("r", encoding="utf-8") as handle:
+            meta = json.load(handle)
+        packages[meta["name"]] = {"version": meta["version"], "build": meta["build"]}
+    return packages
+
+
+def build_key(record: Dict[str, object]) -> str:
+    """Results are keyed by the llama.cpp build string and the rocm-core version."""
+    return f"{record['build']}/rocm-core-{record['rocm_core'] or 'none'}"
+
+
+def test_key(record: Dict[str, object]) -> Tuple:
+    return tuple(record[field] for field in TEST_FIELDS)
+
+
+def llama_bench_command(environment: str, model: Path, args: argparse.Namespace) -> List[str]:
+    return [
+        "pixi", "run", "--manifest-path", str(WORKSPACE_DIR / "pixi.toml"), "--environment", environment,
+        "llama-bench", "-m", str(model), "-o", "json", "-r", str(args.repetitions),
+        "-p", args.prompt, "-n", args.gen, "-b", args.batch, "-t", args.threads,
+    ]
+
+
+def run(args: argparse.Namespace) -> int:
+    if not args.model.exists():
+        if args.model != DEFAULT_MODEL:
+            print(f"✗ Model {args.model} not found")
+            return 1
+        create_model(args.model)
+        print(f"✓ Created {args.model.name}")
+
+    timestamp = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    failed = 0
+    for environment in args.environment:
+        command = llama_bench_command(environment, args.model, args)
+        print(f"→ {environment}: {' '.join(command[6:])}", flush=True)
+        result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+        try:
+            tests = json.loads(result.stdout) if result.returncode == 0 else None
+        except ValueError:
+            tests = None
+        if not tests:
+            print(f"✗ {environment}: llama-bench failed (exit code {result.returncode})")
+            failed += 1
+            continue
+
+        # The environment is installed by the pixi run above
+        packages = environment_packages(environment)
+        llama_cpp = packages.get("llama.cpp", {"version": "unknown", "build": "unknown"})
+        rocm_core = packages.get("rocm-core", {}).get("version")
+        args.results.parent.mkdir(parents=True, exist_ok=True)
+        with args.results.open("a", encoding="utf-8") as handle:
+            for test in tests:
+                record = {
+                    "timestamp": timestamp,
+                    "environment": environment,
+                    "version": llama_cpp["version"],
+                    "build": llama_cpp["build"],
+                    "rocm_core": rocm_core,
+                }
+                record.update({field: test.get(field) for field in TEST_FIELDS + INFO_FIELDS})
+                record["model_filename"] = Path(test["model_filename"]).name
+                handle.write(json.dumps(record, sort_keys=True) + "\n")
+        print(f"✓ {environment}: {len(tests)} tests of llama.cpp {llama_cpp['version']} {build_key(record)}")
+        for test in tests:
+            kind = f"pp{test['n_prompt']}" if test["n_prompt"] else f"tg{test['n_gen']}"
+            print(f"  {kind:>7} b{test['n_batch']:<5} t{test['n_threads']:<3} "
+                  f"{test['avg_ts']:10.1f} ± {test['stddev_ts']:.1f} t/s")
+    return 1 if failed else 0
+
+
+def load_results(results: Path) -> List[Dict[str, object]]:
+    if not results.exists():
+        return []
+    records = []
+    with results.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def latest_tests(records: List[Dict[str, object]], key: str) -> Dict[Tuple, Dict[str, object]]:
+    """Return the last result of each test of a build, given its key or just its build string."""
+    return {
+        test_key(r): r for r in records
+        if build_key(r) == key or r["build"] == key
+    }
+
+
+def compare(results: Path, base: Optional[str], new: Optional[str], threshold: float) -> int:
+    """Print the throughput changes from base to new, returning 1 if any test regressed."""
+    records = load_results(results)
+    if not records:
+        print(f"No benchmark recorded in {results}")
+        return 0
+
+    if base is not None and new is not None:
+        pairs = [(base, new)]
+    elif base is None and new is None:
+        # The last two builds benchmarked in each environment
+        pairs = []
+        for environment in sorted({r["environment"] for r in records}):
+            keys: List[str] = []
+            for r in records:
+                if r["environment"] == environment:
+                    key = build_key(r)
+                    if key in keys:
+                        keys.remove(key)
+                    keys.append(key)
+            if len(keys) < 2:
+                print(f"= {environment}: only {keys[0]} benchmarked")
+            else:
+                pairs.append((keys[-2], keys[-1]))
+    else:
+        print("✗ Give both --base and --new, or none of them")
+        return 1
+
+    regressions = 0
+    for base_key, new_key in pairs:
+        base_tests, new_tests = latest_tests(records, base_key), latest_tests(records, new_key)
+        common = sorted(set(base_tests) & set(new_tests))
+        if not common:
+            print(f"✗ No common test between {base_key} and {new_key}")
+            regressions += 1
+            continue
+        print(f"{base_key} -> {new_key}:")
+        for key in common:
+            before, after = base_tests[key], new_tests[key]
+            change = after["avg_ts"] / before["avg_ts"] - 1
+            noise = (before["stddev_ts"] ** 2 + after["stddev_ts"] ** 2) ** 0.5
+            regressed = change < -threshold and before["avg_ts"] - after["avg_ts"] > noise
+            regressions += regressed
+            kind = f"pp{after['n_prompt']}" if after["n_prompt"] else f"tg{after['n_gen']}"
+            print(f"  {'✗' if regressed else ' '} {kind:>7} b{after['n_batch']:<5} t{after['n_threads']:<3} "
+                  f"{before['avg_ts']:10.1f} -> {after['avg_ts']:10.1f} t/s ({change:+.1%})")
+    print()
+    if regressions:
+        print(f"✗ {regressions} throughput regressions above {threshold:.0%}")
+        return 1
+    print(f"✓ No throughput regression above {threshold:.0%}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the llama.cpp packages and compare their builds")
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS,
+                        help="JSON-lines history of the results (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    model_parser = subparsers.add_parser("create-model", help="Write a tiny llama model with random weights")
+    model_parser.add_argument("path", type=Path, nargs="?", default=DEFAULT_MODEL,
+                              help="Output GGUF file (default: %(default)s)")
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmark matrix and record the results")
+    run_parser.add_argument("-e", "--environment", action="append",
+                            help="Pixi environment to benchmark, can be repeated (default: cpu)")
+    run_parser.add_argument("-m", "--model", type=Path, default=DEFAULT_MODEL,
+                            help="GGUF model (default: %(default)s, created if missing)")
+    run_parser.add_argument("-p", "--prompt", default="64,512",
+                            help="Prompt lengths (default: %(default)s)")
+    run_parser.add_argument("-n", "--gen", default="16,128",
+                            help="Generation lengths (default: %(default)s)")
+    run_parser.add_argument("-b", "--batch", default="128,2048",
+                            help="Batch sizes (default: %(default)s)")
+    run_parser.add_argument("-t", "--threads", default=None,
+                            help="Thread counts (default: 1, half and all of the CPUs)")
+    run_parser.add_argument("-r", "--repetitions", type=int, default=5,
+                            help="Repetitions of each test (default: %(default)s)")
+
+    compare_parser = subparsers.add_parser("compare", help="Flag the throughput regressions between two builds")
+    compare_parser.add_argument("--base", help="Build string (or build/rocm-core-version key) of the baseline "
+                                               "(default: the previous build of each environment)")
+    compare_parser.add_argument("--new", help="Build string (or key) to compare (default: the last build)")
+    compare_parser.add_argument("--threshold", type=float, default=0.05,
+                                help="Relative throughput loss reported as regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.action == "create-model":
+        create_model(args.path)
+        print(f"✓ Created {args.path}")
+        return
+    if args.action == "compare":
+        sys.exit(compare(args.results, args.base, args.new, args.threshold))
+
+    args.environment = args.environment or ["cpu"]
+    if args.threads is None:
+        cpus = os.cpu_count() or 1
+        args.threads = ",".join(str(t) for t in sorted({1, max(cpus // 2, 1), cpus}))
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1339 @@
+#!/usr/bin/env python3
+"""
+CMake-free extraction of the subprojects declared by TheRock.
+
+A small evaluator of the CMake language runs `extract_deps_project` against a
+TheRock tree without CMake or a compiler. It parses the CMake files and
+executes the commands that decide which `therock_cmake_subproject_declare()`
+calls are made, and with which arguments:
+- normal and cache variables, `option()`;
+- `if()`/`foreach()`/`while()`;
+- functions and macros, `include()`, `add_subdirectory()`;
+- `list()`, `string()`, `cmake_parse_arguments()`, global properties...
+
+Commands that only matter to an actual build (targets, install rules, tests)
+are ignored. Any other command is skipped and reported, so that a difference
+with the CMake extraction (`extract_the_rock_deps.py --engine both`) can be
+traced back to it.
+"""
+
+import os
+import platform
+import re
+import shutil
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+BRACKET_OPEN_PATTERN = re.compile(r'\[(=*)\[')
+TRUE_CONSTANTS = ('1', 'ON', 'YES', 'TRUE', 'Y')
+FALSE_CONSTANTS = ('0', 'OFF', 'NO', 'FALSE', 'N', 'IGNORE', 'NOTFOUND', '')
+BLOCK_ENDS = {'if': 'endif', 'foreach': 'endforeach', 'while': 'endwhile',
+              'function': 'endfunction', 'macro': 'endmacro', 'block': 'endblock'}
+MAX_LOOP_ITERATIONS = 100000
+
+# Commands without effect on the declarations
+IGNORED_COMMANDS = {
+    'add_compile_definitions', 'add_compile_options', 'add_custom_command', 'add_definitions',
+    'add_dependencies', 'add_link_options', 'add_test', 'cmake_minimum_required', 'cmake_policy',
+    'configure_file', 'define_property', 'enable_language', 'enable_testing', 'export',
+    'include_directories', 'install', 'link_directories', 'link_libraries', 'mark_as_advanced',
+    'set_directory_properties', 'set_source_files_properties', 'set_target_properties',
+    'set_tests_properties', 'source_group', 'target_compile_definitions', 'target_compile_features',
+    'target_compile_options', 'target_include_directories', 'target_link_directories',
+    'target_link_libraries', 'target_link_options', 'target_sources',
+}
+# file() subcommands that only write to the build tree
+IGNORED_FILE_COMMANDS = {'WRITE', 'APPEND', 'MAKE_DIRECTORY', 'COPY', 'INSTALL', 'TOUCH', 'TOUCH_NOCREATE',
+                         'CONFIGURE', 'GENERATE', 'REMOVE', 'REMOVE_RECURSE', 'LOCK', 'CHMOD'}
+
+
+class CMakeError(Exception):
+    """A configure error (message(FATAL_ERROR), parse error, ...)."""
+
+
+class ReturnSignal(Exception):
+    pass
+
+
+class BreakSignal(Exception):
+    pass
+
+
+class ContinueSignal(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Argument:
+    text: str
+    kind: str  # 'unquoted', 'quoted' or 'bracket'
+
+
+@dataclass
+class Command:
+    name: str
+    arguments: List[Argument]
+    path: Path
+    line: int
+
+    @property
+    def location(self) -> str:
+        return f"{self.path}:{self.line}"
+
+
+@dataclass
+class Block:
+    """foreach/while/function/macro/block with its body, or an if with its branches."""
+    head: Command
+    body: List["Node"] = field(default_factory=list)
+    # (condition command, body) of the if/elseif/else branches
+    branches: List[Tuple[Command, List["Node"]]] = field(default_factory=list)
+
+
+Node = Union[Command, Block]
+
+
+def parse_arguments(text: str, i: int, line: int, path: Path) -> Tuple[List[Argument], int, int]:
+    """Parse the arguments of a command after its '(', returning them with the position after ')'."""
+    arguments = []
+    depth = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == '\n':
+            line += 1
+            i += 1
+        elif c in ' \t\r':
+            i += 1
+        elif c == '#':
+            match = BRACKET_OPEN_PATTERN.match(text, i + 1)
+            if match:
+                end = text.find(f"]{match.group(1)}]", match.end())
+                if end == -1:
+                    raise CMakeError(f"{path}:{line}: unterminated bracket comment")
+                line += text.count('\n', i, end)
+                i = end + len(match.group(1)) + 2
+            else:
+                end = text.find('\n', i)
+                i = n if end == -1 else end
+        elif c == '(':
+            depth += 1
+            arguments.append(Argument('(', 'unquoted'))
+            i += 1
+        elif c == ')':
+            if depth == 0:
+                return arguments, i + 1, line
+            depth -= 1
+            arguments.append(Argument(')', 'unquoted'))
+            i += 1
+        elif c == '"':
+            j = i + 1
+            while j < n and text[j] != '"':
+                j += 2 if text[j] == '\\' else 1
+            if j >= n:
+                raise CMakeError(f"{path}:{line}: unterminated quoted argument")
+            arguments.append(Argument(text[i + 1:j], 'quoted'))
+            line += text.count('\n', i, j)
+            i = j + 1
+        elif c == '[' and BRACKET_OPEN_PATTERN.match(text, i):
+            match = BRACKET_OPEN_PATTERN.match(text, i)
+            end = text.find(f"]{match.group(1)}]", match.end())
+            if end == -1:
+                raise CMakeError(f"{path}:{line}: unterminated bracket argument")
+            content = text[match.end():end]
+            arguments.append(Argument(content[1:] if content.startswith('\n') else content, 'bracket'))
+            line += text.count('\n', i, end)
+            i = end + len(match.group(1)) + 2
+        else:
+            j = i
+            while j < n and text[j] not in ' \t\r\n()#':
+                if text[j] == '\\':
+                    j += 2
+                elif text[j] == '"':
+                    # Legacy unquoted argument with a quoted part, e.g. -DFOO="a b"
+                    end = text.find('"', j + 1)
+                    j = n if end == -1 else end + 1
+                else:
+                    j += 1
+            arguments.append(Argument(text[i:j], 'unquoted'))
+            line += text.count('\n', i, j)
+            i = j
+    raise CMakeError(f"{path}:{line}: missing ')'")
+
+
+def parse_commands(text: str, path: Path) -> List[Command]:
+    commands = []
+    i, line, n = 0, 1, len(text)
+    while i < n:
+        c = text[i]
+        if c == '\n':
+            line += 1
+            i += 1
+        elif c in ' \t\r':
+            i += 1
+        elif c == '#':
+            match = BRACKET_OPEN_PATTERN.match(text, i + 1)
+            end = text.find(f"]{match.group(1)}]", match.end()) if match else text.find('\n', i)
+            if match and end == -1:
+                raise CMakeError(f"{path}:{line}: unterminated bracket comment")
+            if end == -1:
+                break
+            line += text.count('\n', i, end)
+            i = end + len(match.group(1)) + 2 if match else end
+        else:
+            match = IDENTIFIER_PATTERN.match(text, i)
+            if not match:
+                raise CMakeError(f"{path}:{line}: unexpected character {c!r}")
+            i = match.end()
+            while i < n and text[i] in ' \t':
+                i += 1
+            if i >= n or text[i] != '(':
+                raise CMakeError(f"{path}:{line}: expected '(' after {match.group(0)}")
+            start_line = line
+            arguments, i, line = parse_arguments(text, i + 1, line, path)
+            commands.append(Command(match.group(0).lower(), arguments, path, start_line))
+    return commands
+
+
+def build_tree(commands: Iterator[Command], end: Optional[str] = None,
+               branch_names: Tuple[str, ...] = ()) -> Tuple[List[Node], Optional[Command]]:
+    """Nest the commands into blocks, returning the nodes up to `end` (or a branch) and the command that stopped them."""
+    nodes: List[Node] = []
+    for command in commands:
+        if command.name == end or command.name in branch_names:
+            return nodes, command
+        if command.name == 'if':
+            block = Block(command)
+            head = command
+            while True:
+                body, stop = build_tree(commands, 'endif', ('elseif', 'else'))
+                if stop is None:
+                    raise CMakeError(f"{command.location}: if() without endif()")
+                block.branches.append((head, body))
+                if stop.name == 'endif':
+                    break
+                head = stop
+            nodes.append(block)
+        elif command.name in BLOCK_ENDS:
+            body, stop = build_tree(commands, BLOCK_ENDS[command.name])
+            if stop is None:
+                raise CMakeError(f"{command.location}: {command.name}() without {BLOCK_ENDS[command.name]}()")
+            nodes.append(Block(command, body))
+        else:
+            nodes.append(command)
+    return nodes, None
+
+
+# ---------------------------------------------------------------------------
+# Values
+# ---------------------------------------------------------------------------
+
+def split_list(value: str, keep_empty: bool = False) -> List[str]:
+    """Split a CMake list on the semicolons that are not escaped or inside square brackets."""
+    if value == '':
+        return []
+    items, current, depth, i = [], [], 0, 0
+    while i < len(value):
+        c = value[i]
+        if c == '\\' and i + 1 < len(value) and value[i + 1] == ';':
+            current.append(';')
+            i += 2
+            continue
+        if c == '[':
+            depth += 1
+        elif c == ']' and depth:
+            depth -= 1
+        elif c == ';' and depth == 0:
+            items.append(''.join(current))
+            current = []
+            i += 1
+            continue
+        current.append(c)
+        i += 1
+    items.append(''.join(current))
+    return items if keep_empty else [item for item in items if item != '']
+
+
+def is_true_constant(value: str) -> bool:
+    if value.upper() in TRUE_CONSTANTS:
+        return True
+    try:
+        return float(value) != 0
+    except ValueError:
+        return False
+
+
+def is_false_constant(value: str) -> bool:
+    upper = value.upper()
+    return upper in FALSE_CONSTANTS or upper.endswith('-NOTFOUND')
+
+
+def version_key(version: str) -> List[int]:
+    parts = []
+    for part in version.split('.'):
+        match = re.match(r'\d*', part)
+        parts.append(int(match.group(0)) if match.group(0) else 0)
+    return parts
+
+
+def compare(left: List[int], right: List[int]) -> int:
+    length = max(len(left), len(right))
+    left, right = left + [0] * (length - len(left)), right + [0] * (length - len(right))
+    return (left > right) - (left < right)
+
+
+def to_number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Evaluation
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Scope:
+    variables: Dict[str, str]
+    parent: Optional["Scope"] = None
+
+    def child(self) -> "Scope":
+        return Scope(dict(self.variables), self)
+
+
+@dataclass
+class Definition:
+    kind: str  # 'function' or 'macro'
+    parameters: List[str]
+    body: List[Node]
+    path: Path
+
+
+class Evaluator:
+    """Execute CMake files, keeping the cache, the global properties and the definitions."""
+
+    def __init__(self, cache: Optional[Dict[str, str]] = None):
+        self.cache: Dict[str, str] = dict(cache or {})
+        self.global_properties: Dict[str, str] = {}
+        self.definitions: Dict[str, Definition] = {}
+        self.targets: Set[str] = set()
+        self.include_guards: Set[Path] = set()
+        self.parsed: Dict[Path, List[Node]] = {}
+        # Arguments of the macros being executed, replaced in their body like ${name}
+        self.macro_arguments: List[Dict[str, str]] = []
+        # Skipped command -> location of its first use
+        self.unsupported: Dict[str, str] = {}
+        self.errors: List[str] = []
+        self.builtins: Dict[str, Callable[[Command, Scope], None]] = {
+            name[len('command_'):]: getattr(self, name) for name in dir(self) if name.startswith('command_')
+        }
+
+    # -- files ---------------------------------------------------------------
+
+    def parse_file(self, path: Path) -> List[Node]:
+        path = path.resolve()
+        if path not in self.parsed:
+            text = path.read_text(encoding='utf-8', errors='replace')
+            self.parsed[path] = build_tree(iter(parse_commands(text, path)))[0]
+        return self.parsed[path]
+
+    def run_file(self, path: Path, scope: Scope) -> None:
+        """Execute a file in `scope`, as include() does."""
+        saved = {name: scope.variables.get(name) for name in ('CMAKE_CURRENT_LIST_FILE', 'CMAKE_CURRENT_LIST_DIR')}
+        scope.variables['CMAKE_CURRENT_LIST_FILE'] = str(path)
+        scope.variables['CMAKE_CURRENT_LIST_DIR'] = str(path.parent)
+        try:
+            self.run(self.parse_file(path), scope)
+        except ReturnSignal:
+            pass
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    scope.variables.pop(name, None)
+                else:
+                    scope.variables[name] = value
+
+    def run_directory(self, source_dir: Path, binary_dir: Path, scope: Scope) -> None:
+        """Execute the CMakeLists.txt of a directory in `scope`, as add_subdirectory() does."""
+        scope.variables.update({
+            'CMAKE_CURRENT_SOURCE_DIR': str(source_dir),
+            'CMAKE_CURRENT_BINARY_DIR': str(binary_dir),
+        })
+        self.run_file(source_dir / 'CMakeLists.txt', scope)
+
+    def run(self, nodes: List[Node], scope: Scope) -> None:
+        for node in nodes:
+            if isinstance(node, Command):
+                self.invoke(node, scope)
+            elif node.head.name == 'if':
+                for head, body in node.branches:
+                    if head.name == 'else' or self.condition(self.evaluate_arguments(head, scope), head, scope):
+                        self.run(body, scope)
+                        break
+            elif node.head.name in ('function', 'macro'):
+                arguments = self.values(node.head, scope)
+                if not arguments:
+                    raise CMakeError(f"{node.head.location}: {node.head.name}() without a name")
+                self.definitions[arguments[0].lower()] = Definition(
+                    node.head.name, arguments[1:], node.body, node.head.path)
+            elif node.head.name == 'foreach':
+                self.run_foreach(node, scope)
+            elif node.head.name == 'while':
+                self.run_while(node, scope)
+            elif node.head.name == 'block':
+                self.run_block(node, scope)
+
+    # -- variables -----------------------------------------------------------
+
+    def lookup(self, kind: str, name: str, scope: Scope) -> str:
+        if kind == 'ENV':
+            return os.environ.get(name, '')
+        if kind == 'CACHE':
+            return self.cache.get(name, '')
+        if self.macro_arguments and name in self.macro_arguments[-1]:
+            return self.macro_arguments[-1][name]
+        if name in scope.variables:
+            return scope.variables[name]
+        return self.cache.get(name, '')
+
+    def is_defined(self, name: str, scope: Scope) -> bool:
+        return name in scope.variables or name in self.cache
+
+    def variable(self, name: str, scope: Scope) -> Optional[str]:
+        if name in scope.variables:
+            return scope.variables[name]
+        return self.cache.get(name)
+
+    def expand(self, text: str, scope: Scope, i: int = 0, in_reference: bool = False) -> Tuple[str, int]:
+        """Replace the variable references and escape sequences of `text`."""
+        out = []
+        n = len(text)
+        while i < n:
+            c = text[i]
+            if in_reference and c == '}':
+                return ''.join(out), i + 1
+            if c == '\\' and i + 1 < n:
+                following = text[i + 1]
+                if following == '\n':
+                    pass
+                elif following in 'ntr':
+                    out.append({'n': '\n', 't': '\t', 'r': '\r'}[following])
+                elif following == ';':
+                    out.append('\\;')
+                else:
+                    out.append(following)
+                i += 2
+                continue
+            if c == '$':
+                for prefix, kind in (('${', ''), ('$ENV{', 'ENV'), ('$CACHE{', 'CACHE')):
+                    if text.startswith(prefix, i):
+                        name, i = self.expand(text, scope, i + len(prefix), True)
+                        out.append(self.lookup(kind, name, scope))
+                        break
+                else:
+                    out.append(c)
+                    i += 1
+                continue
+            out.append(c)
+            i += 1
+        return ''.join(out), i
+
+    def evaluate_arguments(self, command: Command, scope: Scope) -> List[Tuple[str, bool]]:
+        """Return the (value, quoted) arguments of a command, unquoted ones split as lists."""
+        values = []
+        for argument in command.arguments:
+            if argument.kind == 'bracket':
+                values.append((argument.text, True))
+            elif argument.kind == 'quoted':
+                values.append((self.expand(argument.text, scope)[0], True))
+            else:
+                values.extend((item, False) for item in split_list(self.expand(argument.text, scope)[0]))
+        return values
+
+    def values(self, command: Command, scope: Scope) -> List[str]:
+        return [value for value, _ in self.evaluate_arguments(command, scope)]
+
+    def set_variable(self, name: str, value: Optional[str], scope: Scope) -> None:
+        if value is None:
+            scope.variables.pop(name, None)
+        else:
+            scope.variables[name] = value
+
+    # -- commands ------------------------------------------------------------
+
+    def invoke(self, command: Command, scope: Scope) -> None:
+        definition = self.definitions.get(command.name)
+        if definition is not None:
+            self.call(definition, command, self.values(command, scope), scope)
+        elif command.name in self.builtins:
+            try:
+                self.builtins[command.name](command, scope)
+            except (IndexError, ValueError, re.error) as e:
+                raise CMakeError(f"{command.location}: cannot evaluate {command.name}(): {e}") from e
+        elif command.name not in IGNORED_COMMANDS:
+            self.unsupported.setdefault(f"{command.name}()", command.location)
+
+    def call(self, definition: Definition, command: Command, arguments: List[str], scope: Scope) -> None:
+        bindings = {'ARGC': str(len(arguments)), 'ARGV': ';'.join(arguments),
+                    'ARGN': ';'.join(arguments[len(definition.parameters):])}
+        bindings.update({f"ARGV{i}": value for i, value in enumerate(arguments)})
+        if len(arguments) < len(definition.parameters):
+            raise CMakeError(f"{command.location}: {command.name}() called with too few arguments")
+        bindings.update(zip(definition.parameters, arguments))
+
+        if definition.kind == 'macro':
+            self.macro_arguments.append(bindings)
+            try:
+                self.run(definition.body, scope)
+            finally:
+                self.macro_arguments.pop()
+            return
+
+        function_scope = scope.child()
+        function_scope.variables.update(bindings)
+        function_scope.variables.update({
+            'CMAKE_CURRENT_FUNCTION': command.name,
+            'CMAKE_CURRENT_FUNCTION_LIST_FILE': str(definition.path),
+            'CMAKE_CURRENT_FUNCTION_LIST_DIR': str(definition.path.parent),
+        })
+        self.macro_arguments.append({})
+        try:
+            self.run(definition.body, function_scope)
+        except ReturnSignal:
+            pass
+        finally:
+            self.macro_arguments.pop()
+
+    def run_foreach(self, block: Block, scope: Scope) -> None:
+        arguments = self.values(block.head, scope)
+        if not arguments:
+            return
+        name, rest = arguments[0], arguments[1:]
+        if rest[:1] == ['RANGE']:
+            numbers = [int(value) for value in rest[1:]]
+            start, stop, step = (0, numbers[0], 1) if len(numbers) == 1 else (numbers + [1])[:3]
+            items = [str(value) for value in range(start, stop + 1, step)]
+        elif rest[:1] == ['IN']:
+            items, mode = [], None
+            for value in rest[1:]:
+                if value in ('LISTS', 'ITEMS'):
+                    mode = value
+                elif mode == 'LISTS':
+                    items.extend(split_list(self.lookup('', value, scope), keep_empty=True))
+                elif mode == 'ITEMS':
+                    items.append(value)
+                else:
+                    self.unsupported.setdefault(f"foreach(IN {value})", block.head.location)
+        else:
+            items = rest
+
+        saved = scope.variables.get(name)
+        try:
+            for item in items:
+                scope.variables[name] = item
+                try:
+                    self.run(block.body, scope)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+        finally:
+            self.set_variable(name, saved, scope)
+
+    def run_while(self, block: Block, scope: Scope) -> None:
+        for _ in range(MAX_LOOP_ITERATIONS):
+            if not self.condition(self.evaluate_arguments(block.head, scope), block.head, scope):
+                return
+            try:
+                self.run(block.body, scope)
+            except ContinueSignal:
+                continue
+            except BreakSignal:
+                return
+        raise CMakeError(f"{block.head.location}: while() did not terminate")
+
+    def run_block(self, block: Block, scope: Scope) -> None:
+        arguments = self.values(block.head, scope)
+        propagate = arguments[arguments.index('PROPAGATE') + 1:] if 'PROPAGATE' in arguments else []
+        block_scope = scope.child()
+        self.run(block.body, block_scope)
+        for name in propagate:
+            self.set_variable(name, block_scope.variables.get(name), scope)
+
+    def command_return(self, command: Command, scope: Scope) -> None:
+        raise ReturnSignal()
+
+    def command_break(self, command: Command, scope: Scope) -> None:
+        raise BreakSignal()
+
+    def command_continue(self, command: Command, scope: Scope) -> None:
+        raise ContinueSignal()
+
+    def command_set(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if not arguments:
+            return
+        name, values = arguments[0], arguments[1:]
+        if name.startswith('ENV{') and name.endswith('}'):
+            return
+        if 'CACHE' in values:
+            index = values.index('CACHE')
+            force = 'FORCE' in values[index + 3:]
+            if name not in self.cache or force:
+                self.cache[name] = ';'.join(values[:index])
+            return
+        if values[-1:] == ['PARENT_SCOPE']:
+            if scope.parent is not None:
+                self.set_variable(name, ';'.join(values[:-1]) if len(values) > 1 else None, scope.parent)
+            return
+        self.set_variable(name, ';'.join(values) if values else None, scope)
+
+    def command_unset(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if 'CACHE' in arguments[1:]:
+            self.cache.pop(arguments[0], None)
+        elif 'PARENT_SCOPE' in arguments[1:]:
+            if scope.parent is not None:
+                scope.parent.variables.pop(arguments[0], None)
+        elif arguments:
+            scope.variables.pop(arguments[0], None)
+
+    def command_option(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        name = arguments[0]
+        if name in scope.variables or name in self.cache:
+            return
+        self.cache[name] = 'ON' if len(arguments) > 2 and is_true_constant(arguments[2]) else 'OFF'
+
+    def command_cmake_dependent_option(self, command: Command, scope: Scope) -> None:
+        name, _, default, depends, force = self.values(command, scope)[:5]
+        if all(self.condition([(token, False) for token in re.split(r' +', item.strip())], command, scope)
+               for item in split_list(depends)):
+            if name not in self.cache:
+                self.cache[name] = default
+        else:
+            scope.variables[name] = force
+
+    def command_list(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        operation, name, rest = arguments[0].upper(), arguments[1], arguments[2:]
+        items = split_list(self.lookup('', name, scope), keep_empty=True)
+        result: Optional[List[str]] = None
+        if operation == 'APPEND':
+            result = items + rest
+        elif operation == 'PREPEND':
+            result = rest + items
+        elif operation == 'INSERT':
+            index = int(rest[0])
+            result = items[:index] + rest[1:] + items[index:]
+        elif operation == 'REMOVE_ITEM':
+            result = [item for item in items if item not in rest]
+        elif operation == 'REMOVE_AT':
+            indexes = {int(value) % len(items) for value in rest} if items else set()
+            result = [item for i, item in enumerate(items) if i not in indexes]
+        elif operation == 'REMOVE_DUPLICATES':
+            result = list(dict.fromkeys(items))
+        elif operation == 'REVERSE':
+            result = items[::-1]
+        elif operation == 'SORT':
+            result = sorted(items)
+        elif operation in ('POP_BACK', 'POP_FRONT'):
+            popped = items[-1:] if operation == 'POP_BACK' else items[:1]
+            result = items[:-1] if operation == 'POP_BACK' else items[1:]
+            if rest and popped:
+                scope.variables[rest[0]] = popped[0]
+        elif operation == 'LENGTH':
+            scope.variables[rest[0]] = str(len(items))
+        elif operation == 'GET':
+            scope.variables[rest[-1]] = ';'.join(items[int(i)] for i in rest[:-1])
+        elif operation == 'FIND':
+            scope.variables[rest[1]] = str(items.index(rest[0]) if rest[0] in items else -1)
+        elif operation == 'JOIN':
+            scope.variables[rest[1]] = rest[0].join(items)
+        elif operation == 'SUBLIST':
+            begin, length = int(rest[0]), int(rest[1])
+            scope.variables[rest[2]] = ';'.join(items[begin:] if length == -1 else items[begin:begin + length])
+        elif operation == 'FILTER' and len(rest) >= 3 and rest[1] == 'REGEX':
+            pattern = re.compile(rest[2])
+            keep = rest[0] == 'INCLUDE'
+            result = [item for item in items if bool(pattern.search(item)) == keep]
+        elif operation == 'TRANSFORM':
+            output = rest[rest.index('OUTPUT_VARIABLE') + 1] if 'OUTPUT_VARIABLE' in rest else name
+            action = rest[0].upper() if rest else ''
+            transforms = {
+                'APPEND': lambda item: item + rest[1],
+                'PREPEND': lambda item: rest[1] + item,
+                'TOLOWER': str.lower,
+                'TOUPPER': str.upper,
+                'STRIP': str.strip,
+                'REPLACE': lambda item: re.sub(rest[1], cmake_replacement(rest[2]), item),
+            }
+            if action not in transforms:
+                self.unsupported.setdefault(f"list(TRANSFORM {action})", command.location)
+                return
+            scope.variables[output] = ';'.join(transforms[action](item) for item in items)
+        else:
+            self.unsupported.setdefault(f"list({operation})", command.location)
+        if result is not None:
+            scope.variables[name] = ';'.join(result)
+
+    def command_string(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        operation = arguments[0].upper()
+        rest = arguments[1:]
+        if operation in ('TOLOWER', 'TOUPPER', 'STRIP', 'LENGTH', 'MAKE_C_IDENTIFIER', 'GENEX_STRIP'):
+            value = rest[0] if len(rest) > 1 else ''
+            functions = {
+                'TOLOWER': str.lower, 'TOUPPER': str.upper, 'STRIP': str.strip,
+                'LENGTH': lambda text: str(len(text)),
+                'MAKE_C_IDENTIFIER': lambda text: re.sub(r'\W', '_', text if not text[:1].isdigit() else '_' + text),
+                'GENEX_STRIP': lambda text: re.sub(r'\$<[^<>]*>', '', text),
+            }
+            scope.variables[rest[-1]] = functions[operation](value)
+        elif operation in ('APPEND', 'PREPEND'):
+            current = self.lookup('', rest[0], scope)
+            addition = ''.join(rest[1:])
+            scope.variables[rest[0]] = current + addition if operation == 'APPEND' else addition + current
+        elif operation == 'CONCAT':
+            scope.variables[rest[0]] = ''.join(rest[1:])
+        elif operation == 'JOIN':
+            scope.variables[rest[1]] = rest[0].join(rest[2:])
+        elif operation == 'REPLACE':
+            scope.variables[rest[2]] = ''.join(rest[3:]).replace(rest[0], rest[1])
+        elif operation == 'SUBSTRING':
+            begin, length = int(rest[1]), int(rest[2])
+            scope.variables[rest[3]] = rest[0][begin:] if length == -1 else rest[0][begin:begin + length]
+        elif operation == 'FIND':
+            reverse = 'REVERSE' in rest[3:]
+            scope.variables[rest[2]] = str(rest[0].rfind(rest[1]) if reverse else rest[0].find(rest[1]))
+        elif operation == 'COMPARE':
+            left, right = rest[1], rest[2]
+            results = {'EQUAL': left == right, 'NOTEQUAL': left != right, 'LESS': left < right,
+                       'GREATER': left > right, 'LESS_EQUAL': left <= right, 'GREATER_EQUAL': left >= right}
+            scope.variables[rest[3]] = '1' if results.get(rest[0].upper()) else '0'
+        elif operation == 'REGEX' and rest:
+            mode, pattern = rest[0].upper(), re.compile(rest[1])
+            text = ''.join(rest[4 if mode == 'REPLACE' else 3:])
+            if mode == 'MATCH':
+                match = pattern.search(text)
+                scope.variables[rest[2]] = match.group(0) if match else ''
+                self.set_matches(match, scope)
+            elif mode == 'MATCHALL':
+                scope.variables[rest[2]] = ';'.join(m.group(0) for m in pattern.finditer(text))
+            elif mode == 'REPLACE':
+                scope.variables[rest[3]] = pattern.sub(cmake_replacement(rest[2]), text)
+            else:
+                self.unsupported.setdefault(f"string(REGEX {mode})", command.location)
+        else:
+            self.unsupported.setdefault(f"string({operation})", command.location)
+
+    def command_math(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if arguments[0] != 'EXPR':
+            self.unsupported.setdefault(f"math({arguments[0]})", command.location)
+            return
+        value = MathParser(arguments[2], command).evaluate()
+        hexadecimal = arguments[3:5] == ['OUTPUT_FORMAT', 'HEXADECIMAL']
+        scope.variables[arguments[1]] = hex(value & INT64_MASK) if hexadecimal else str(value)
+
+    def command_cmake_parse_arguments(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if arguments[0] == 'PARSE_ARGV':
+            start, (prefix, options, single, multi) = int(arguments[1]), arguments[2:6]
+            count = int(self.lookup('', 'ARGC', scope) or 0)
+            values = [self.lookup('', f"ARGV{i}", scope) for i in range(start, count)]
+        else:
+            (prefix, options, single, multi), values = arguments[:4], arguments[4:]
+        options, single, multi = split_list(options), split_list(single), split_list(multi)
+        keywords = set(options) | set(single) | set(multi)
+        parsed: Dict[str, List[str]] = {}
+        unparsed: List[str] = []
+        missing: List[str] = []
+        # Keyword waiting for its values, and whether it got any
+        current, received = None, False
+        for value in values:
+            if value in keywords:
+                if current is not None and not received:
+                    missing.append(current)
+                # A repeated single-value keyword replaces its value, a multi-value one extends it
+                parsed[value] = parsed.get(value, []) if value in multi else []
+                current, received = (None, True) if value in options else (value, False)
+            elif current is None:
+                unparsed.append(value)
+            else:
+                parsed[current].append(value)
+                received = True
+                if current in single:
+                    current = None
+        if current is not None and not received:
+            missing.append(current)
+
+        for name in options:
+            scope.variables[f"{prefix}_{name}"] = 'TRUE' if name in parsed else 'FALSE'
+        for name in single + multi:
+            self.set_variable(f"{prefix}_{name}", ';'.join(parsed[name]) if parsed.get(name) else None, scope)
+        self.set_variable(f"{prefix}_UNPARSED_ARGUMENTS", ';'.join(unparsed) if unparsed else None, scope)
+        self.set_variable(f"{prefix}_KEYWORDS_MISSING_VALUES", ';'.join(missing) if missing else None, scope)
+
+    def command_get_filename_component(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        name, value, mode = arguments[0], arguments[1] if len(arguments) > 1 else '', arguments[2:3]
+        path = Path(value)
+        mode = mode[0] if mode else 'DIRECTORY'
+        if mode in ('ABSOLUTE', 'REALPATH'):
+            base = Path(arguments[arguments.index('BASE_DIR') + 1]) if 'BASE_DIR' in arguments else \
+                Path(self.lookup('', 'CMAKE_CURRENT_SOURCE_DIR', scope))
+            result = os.path.normpath(str(base / path))
+            if mode == 'REALPATH':
+                result = os.path.realpath(result)
+        elif mode in ('DIRECTORY', 'PATH'):
+            result = str(path.parent) if '/' in value else ''
+        elif mode == 'NAME':
+            result = path.name
+        elif mode in ('EXT', 'LAST_EXT'):
+            result = ''.join(path.suffixes) if mode == 'EXT' else path.suffix
+        elif mode in ('NAME_WE', 'NAME_WLE'):
+            result = path.name.split('.')[0] if mode == 'NAME_WE' else path.stem
+        else:
+            self.unsupported.setdefault(f"get_filename_component({mode})", command.location)
+            return
+        if 'CACHE' in arguments[3:]:
+            self.cache.setdefault(name, result)
+        else:
+            scope.variables[name] = result
+
+    def command_file(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        operation = arguments[0].upper() if arguments else ''
+        current_dir = Path(self.lookup('', 'CMAKE_CURRENT_SOURCE_DIR', scope))
+        if operation in IGNORED_FILE_COMMANDS:
+            return
+        if operation in ('GLOB', 'GLOB_RECURSE'):
+            name, rest = arguments[1], arguments[2:]
+            relative = None
+            patterns = []
+            skip = False
+            for i, value in enumerate(rest):
+                if skip:
+                    skip = False
+                elif value == 'RELATIVE':
+                    relative, skip = Path(rest[i + 1]), True
+                elif value == 'LIST_DIRECTORIES':
+                    skip = True
+                elif value not in ('CONFIGURE_DEPENDS', 'FOLLOW_SYMLINKS'):
+                    patterns.append(value)
+            matches = set()
+            for pattern in patterns:
+                base = Path(pattern) if os.path.isabs(pattern) else current_dir / pattern
+                root, glob = base.parent, base.name
+                found = root.rglob(glob) if operation == 'GLOB_RECURSE' else root.glob(glob)
+                matches.update(str(p.relative_to(relative) if relative else p) for p in found)
+            scope.variables[name] = ';'.join(sorted(matches))
+        elif operation in ('READ', 'STRINGS'):
+            path = Path(arguments[1]) if os.path.isabs(arguments[1]) else current_dir / arguments[1]
+            text = path.read_text(encoding='utf-8', errors='replace') if path.is_file() else ''
+            scope.variables[arguments[2]] = text if operation == 'READ' else \
+                ';'.join(line.replace(';', '\\;') for line in text.splitlines() if line)
+        elif operation in ('TO_CMAKE_PATH', 'REAL_PATH'):
+            path = arguments[1] if operation == 'TO_CMAKE_PATH' else os.path.realpath(current_dir / arguments[1])
+            scope.variables[arguments[2]] = str(path).replace('\\', '/')
+        elif operation == 'RELATIVE_PATH':
+            scope.variables[arguments[1]] = os.path.relpath(arguments[3], arguments[2])
+        else:
+            self.unsupported.setdefault(f"file({operation})", command.location)
+
+    def command_include(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        name = arguments[0]
+        result_variable = arguments[arguments.index('RESULT_VARIABLE') + 1] if 'RESULT_VARIABLE' in arguments else None
+        if name.endswith('.cmake') or '/' in name:
+            candidates = [Path(name) if os.path.isabs(name)
+                          else Path(self.lookup('', 'CMAKE_CURRENT_SOURCE_DIR', scope)) / name]
+        else:
+            candidates = [Path(d) / f"{name}.cmake"
+                          for d in split_list(self.lookup('', 'CMAKE_MODULE_PATH', scope))]
+        path = next((p for p in candidates if p.is_file()), None)
+        if result_variable:
+            scope.variables[result_variable] = str(path) if path else 'NOTFOUND'
+        if path is None:
+            # The modules of CMake itself: those that matter are built in (cmake_dependent_option)
+            if not ('OPTIONAL' in arguments or name.endswith('.cmake') or '/' in name):
+                return
+            if 'OPTIONAL' not in arguments:
+                self.errors.append(f"{command.location}: include could not find {name}")
+            return
+        self.run_file(path.resolve(), scope)
+
+    def command_include_guard(self, command: Command, scope: Scope) -> None:
+        path = Path(self.lookup('', 'CMAKE_CURRENT_LIST_FILE', scope))
+        if path in self.include_guards:
+            raise ReturnSignal()
+        self.include_guards.add(path)
+
+    def command_add_subdirectory(self, command: Command, scope: Scope) -> None:
+        arguments = [value for value in self.values(command, scope) if value not in ('EXCLUDE_FROM_ALL', 'SYSTEM')]
+        current_source = Path(self.lookup('', 'CMAKE_CURRENT_SOURCE_DIR', scope))
+        current_binary = Path(self.lookup('', 'CMAKE_CURRENT_BINARY_DIR', scope))
+        source_dir = Path(arguments[0]) if os.path.isabs(arguments[0]) else current_source / arguments[0]
+        binary_dir = current_binary / arguments[0] if len(arguments) < 2 else \
+            Path(arguments[1]) if os.path.isabs(arguments[1]) else current_binary / arguments[1]
+        if not (source_dir / 'CMakeLists.txt').is_file():
+            self.errors.append(f"{command.location}: add_subdirectory given source {source_dir} "
+                               f"which is not an existing directory with a CMakeLists.txt")
+            return
+        self.run_directory(source_dir.resolve(), binary_dir, scope.child())
+
+    def command_project(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        name = arguments[0]
+        source_dir = self.lookup('', 'CMAKE_CURRENT_SOURCE_DIR', scope)
+        binary_dir = self.lookup('', 'CMAKE_CURRENT_BINARY_DIR', scope)
+        scope.variables.update({
+            'PROJECT_NAME': name, 'PROJECT_SOURCE_DIR': source_dir, 'PROJECT_BINARY_DIR': binary_dir,
+            f"{name}_SOURCE_DIR": source_dir, f"{name}_BINARY_DIR": binary_dir,
+        })
+        self.cache.setdefault('CMAKE_PROJECT_NAME', name)
+        if 'VERSION' in arguments:
+            version = arguments[arguments.index('VERSION') + 1]
+            scope.variables['PROJECT_VERSION'] = scope.variables[f"{name}_VERSION"] = version
+            for part, value in zip(('MAJOR', 'MINOR', 'PATCH', 'TWEAK'), version.split('.')):
+                scope.variables[f"PROJECT_VERSION_{part}"] = value
+
+    def command_message(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if arguments[:1] == ['FATAL_ERROR']:
+            raise CMakeError(f"{command.location}: {''.join(arguments[1:])}")
+        if arguments[:1] == ['SEND_ERROR']:
+            self.errors.append(f"{command.location}: {''.join(arguments[1:])}")
+
+    def command_add_custom_target(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if arguments[0] in self.targets:
+            self.errors.append(f"{command.location}: another target with the name {arguments[0]} already exists")
+        self.targets.add(arguments[0])
+
+    command_add_library = command_add_executable = command_add_custom_target
+
+    def command_set_property(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if arguments[:1] != ['GLOBAL'] or 'PROPERTY' not in arguments:
+            return
+        index = arguments.index('PROPERTY')
+        name, values = arguments[index + 1], arguments[index + 2:]
+        current = self.global_properties.get(name, '')
+        if 'APPEND' in arguments[:index]:
+            self.global_properties[name] = ';'.join(split_list(current) + values)
+        elif 'APPEND_STRING' in arguments[:index]:
+            self.global_properties[name] = current + ''.join(values)
+        else:
+            self.global_properties[name] = ';'.join(values)
+
+    def command_get_property(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        name = arguments[0]
+        if arguments[1:2] != ['GLOBAL'] or 'PROPERTY' not in arguments:
+            scope.variables[name] = ''
+            return
+        index = arguments.index('PROPERTY')
+        prop = arguments[index + 1]
+        if arguments[index + 2:index + 3] in (['SET'], ['DEFINED']):
+            scope.variables[name] = '1' if prop in self.global_properties else '0'
+        else:
+            scope.variables[name] = self.global_properties.get(prop, '')
+
+    def command_get_cmake_property(self, command: Command, scope: Scope) -> None:
+        name, prop = self.values(command, scope)[:2]
+        if prop == 'VARIABLES':
+            scope.variables[name] = ';'.join(sorted(set(scope.variables) | set(self.cache)))
+        elif prop == 'CACHE_VARIABLES':
+            scope.variables[name] = ';'.join(sorted(self.cache))
+        else:
+            scope.variables[name] = self.global_properties.get(prop, 'NOTFOUND')
+
+    def command_get_directory_property(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if 'DEFINITION' in arguments:
+            scope.variables[arguments[0]] = self.lookup('', arguments[arguments.index('DEFINITION') + 1], scope)
+        else:
+            scope.variables[arguments[0]] = ''
+
+    def command_get_target_property(self, command: Command, scope: Scope) -> None:
+        name = self.values(command, scope)[0]
+        scope.variables[name] = f"{name}-NOTFOUND"
+
+    def command_find_program(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        name = arguments[0]
+        current = self.variable(name, scope)
+        if current is not None and not is_false_constant(current):
+            return
+        names = arguments[arguments.index('NAMES') + 1:] if 'NAMES' in arguments else arguments[1:2]
+        keywords = {'HINTS', 'PATHS', 'PATH_SUFFIXES', 'DOC', 'NAMES_PER_DIR', 'REQUIRED', 'NO_DEFAULT_PATH',
+                    'NO_CACHE', 'ENV'}
+        found = None
+        for candidate in names:
+            if candidate in keywords:
+                break
+            found = shutil.which(candidate)
+            if found:
+                break
+        self.cache[name] = found or f"{name}-NOTFOUND"
+
+    def command_find_package(self, command: Command, scope: Scope) -> None:
+        name = self.values(command, scope)[0]
+        if name in ('Python3', 'Python', 'PythonInterp'):
+            scope.variables[f"{name}_FOUND"] = 'TRUE'
+            scope.variables[f"{name}_EXECUTABLE"] = sys.executable
+            scope.variables['PYTHON_EXECUTABLE'] = sys.executable
+            return
+        self.unsupported.setdefault(f"find_package({name})", command.location)
+
+    def command_separate_arguments(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        text = arguments[-1] if len(arguments) > 1 else self.lookup('', arguments[0], scope)
+        scope.variables[arguments[0]] = ';'.join(text.split())
+
+    def command_cmake_language(self, command: Command, scope: Scope) -> None:
+        arguments = self.values(command, scope)
+        if arguments[:1] == ['CALL']:
+            call = Command(arguments[1].lower(), [Argument(v, 'quoted') for v in arguments[2:]],
+                           command.path, command.line)
+            self.invoke(call, scope)
+        elif arguments[:2] == ['EVAL', 'CODE']:
+            self.run(build_tree(iter(parse_commands(''.join(arguments[2:]), command.path)))[0], scope)
+        elif arguments[:1] != ['DEFER']:
+            self.unsupported.setdefault(f"cmake_language({arguments[0] if arguments else ''})", command.location)
+
+    # -- conditions ----------------------------------------------------------
+
+    def condition(self, arguments: List[Tuple[str, bool]], command: Command, scope: Scope) -> bool:
+        parser = ConditionParser(self, arguments, command, scope)
+        result = parser.parse_or()
+        if parser.position != len(arguments):
+            raise CMakeError(f"{command.location}: unknown arguments in condition "
+                             f"{' '.join(value for value, _ in arguments)}")
+        return result
+
+    def set_matches(self, match: Optional[re.Match], scope: Scope) -> None:
+        for i in range(10):
+            scope.variables.pop(f"CMAKE_MATCH_{i}", None)
+        if match:
+            for i in range(min(match.re.groups, 9) + 1):
+                scope.variables[f"CMAKE_MATCH_{i}"] = match.group(i) or ''
+            scope.variables['CMAKE_MATCH_COUNT'] = str(match.re.groups)
+
+
+def cmake_replacement(replacement: str) -> str:
+    """Translate the \\1 references of a CMake regex replacement for re.sub."""
+    return re.sub(r'\\(\d)', r'\\g<\1>', replacement.replace('\\\\', '\\'))
+
+
+UNARY_TESTS = ('EXISTS', 'COMMAND', 'DEFINED', 'TARGET', 'IS_DIRECTORY', 'IS_ABSOLUTE', 'POLICY',
+               'TEST', 'IS_SYMLINK', 'IS_READABLE', 'IS_WRITABLE', 'IS_EXECUTABLE')
+BINARY_TESTS = ('EQUAL', 'LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL', 'STREQUAL', 'STRLESS',
+                'STRGREATER', 'STRLESS_EQUAL', 'STRGREATER_EQUAL', 'VERSION_EQUAL', 'VERSION_LESS',
+                'VERSION_GREATER', 'VERSION_LESS_EQUAL', 'VERSION_GREATER_EQUAL', 'MATCHES', 'IN_LIST',
+                'PATH_EQUAL', 'IS_NEWER_THAN')
+
+
+class ConditionParser:
+    """Evaluate the arguments of if()/elseif()/while(), with the precedence of CMake."""
+
+    def __init__(self, evaluator: Evaluator, arguments: List[Tuple[str, bool]], command: Command, scope: Scope):
+        self.evaluator = evaluator
+        self.arguments = arguments
+        self.command = command
+        self.scope = scope
+        self.position = 0
+
+    def peek(self, *keywords: str) -> bool:
+        if self.position >= len(self.arguments):
+            return False
+        value, quoted = self.arguments[self.position]
+        return not quoted and value in keywords
+
+    def next(self) -> Tuple[str, bool]:
+        if self.position >= len(self.arguments):
+            raise CMakeError(f"{self.command.location}: incomplete condition")
+        self.position += 1
+        return self.arguments[self.position - 1]
+
+    def parse_or(self) -> bool:
+        result = self.parse_and()
+        while self.peek('OR'):
+            self.next()
+            right = self.parse_and()
+            result = result or right
+        return result
+
+    def parse_and(self) -> bool:
+        result = self.parse_not()
+        while self.peek('AND'):
+            self.next()
+            right = self.parse_not()
+            result = result and right
+        return result
+
+    def parse_not(self) -> bool:
+        if self.peek('NOT'):
+            self.next()
+            return not self.parse_not()
+        return self.parse_predicate()
+
+    def parse_predicate(self) -> bool:
+        evaluator = self.evaluator
+        scope = self.scope
+        if self.peek('('):
+            self.next()
+            result = self.parse_or()
+            if not self.peek(')'):
+                raise CMakeError(f"{self.command.location}: mismatched parenthesis in condition")
+            self.next()
+            return result
+        if self.peek(*UNARY_TESTS) and self.position + 1 < len(self.arguments):
+            test = self.next()[0]
+            value = self.next()[0]
+            if test == 'DEFINED':
+                if value.startswith('ENV{') and value.endswith('}'):
+                    return value[4:-1] in os.environ
+                if value.startswith('CACHE{') and value.endswith('}'):
+                    return value[6:-1] in evaluator.cache
+                return evaluator.is_defined(value, scope)
+            if test == 'COMMAND':
+                name = value.lower()
+                return name in evaluator.definitions or name in evaluator.builtins or name in IGNORED_COMMANDS \
+                    or name in BLOCK_ENDS or name in ('else', 'elseif') or name in BLOCK_ENDS.values()
+            if test == 'TARGET':
+                return value in evaluator.targets
+            if test == 'POLICY':
+                return True
+            if test == 'TEST':
+                return False
+            if test == 'IS_ABSOLUTE':
+                return os.path.isabs(value)
+            if test == 'IS_DIRECTORY':
+                return os.path.isdir(value)
+            if test == 'IS_SYMLINK':
+                return os.path.islink(value)
+            return os.path.exists(value)
+
+        left = self.next()
+        if self.peek(*BINARY_TESTS) and self.position + 1 < len(self.arguments):
+            test = self.next()[0]
+            right = self.next()
+            return self.binary(test, left, right, scope)
+        return self.truth(left, scope)
+
+    def operand(self, argument: Tuple[str, bool], scope: Scope) -> str:
+        """An unquoted operand naming a variable stands for its value."""
+        value, quoted = argument
+        if not quoted:
+            variable = self.evaluator.variable(value, scope)
+            if variable is not None:
+                return variable
+        return value
+
+    def truth(self, argument: Tuple[str, bool], scope: Scope) -> bool:
+        value, quoted = argument
+        if is_true_constant(value):
+            return True
+        if is_false_constant(value):
+            return False
+        if quoted:
+            return False
+        variable = self.evaluator.variable(value, scope)
+        return variable is not None and not is_false_constant(variable)
+
+    def binary(self, test: str, left: Tuple[str, bool], right: Tuple[str, bool], scope: Scope) -> bool:
+        if test == 'IN_LIST':
+            return self.operand(left, scope) in split_list(self.evaluator.lookup('', right[0], scope))
+        a, b = self.operand(left, scope), self.operand(right, scope)
+        if test == 'MATCHES':
+            match = re.search(b, a)
+            self.evaluator.set_matches(match, scope)
+            return match is not None
+        if test in ('EQUAL', 'LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL'):
+            x, y = to_number(a), to_number(b)
+            if x is None or y is None:
+                return False
+            order = (x > y) - (x < y)
+        elif test.startswith('VERSION_'):
+            order = compare(version_key(a), version_key(b))
+            test = test[len('VERSION_'):]
+        elif test in ('STREQUAL', 'PATH_EQUAL'):
+            return a == b if test == 'STREQUAL' else os.path.normpath(a) == os.path.normpath(b)
+        elif test.startswith('STR'):
+            order = (a > b) - (a < b)
+            test = test[len('STR'):]
+        else:  # IS_NEWER_THAN
+            try:
+                return os.path.getmtime(a) >= os.path.getmtime(b)
+            except OSError:
+                return True
+        return {'EQUAL': order == 0, 'LESS': order < 0, 'GREATER': order > 0,
+                'LESS_EQUAL': order <= 0, 'GREATER_EQUAL': order >= 0}[test]
+
+
+MATH_TOKEN_PATTERN = re.compile(r'(0[xX][0-9a-fA-F]+)|([0-9]+)|(<<|>>|[-+*/%|^&~()])')
+# Binary operators of math(EXPR), from the lowest to the highest precedence
+MATH_OPERATORS = (('|',), ('^',), ('&',), ('<<', '>>'), ('+', '-'), ('*', '/', '%'))
+INT64_MASK = (1 << 64) - 1
+
+
+def to_int64(value: int) -> int:
+    """Wrap an integer around like the 64-bit signed arithmetic of CMake."""
+    value &= INT64_MASK
+    return value - (1 << 64) if value >> 63 else value
+
+
+class MathParser:
+    """
+    Evaluate a math(EXPR) expression with the grammar of CMake: 64-bit signed
+    integers, decimal or 0x hexadecimal numbers, and the C operators (`/` and
+    `%` truncate toward zero). Raises CMakeError like CMake reports a bad
+    expression. Other characters are skipped, as CMake does with a warning.
+    """
+
+    def __init__(self, expression: str, command: Command):
+        self.expression = expression
+        self.command = command
+        self.tokens: List[Union[str, int]] = []
+        for match in MATH_TOKEN_PATTERN.finditer(expression):
+            hexadecimal, decimal, operator = match.groups()
+            if operator:
+                self.tokens.append(operator)
+                continue
+            value = int(hexadecimal, 16) if hexadecimal else int(decimal)
+            if value >> 63:
+                self.fail('evaluate', "a numeric value is out of range")
+            self.tokens.append(value)
+        self.position = 0
+
+    def fail(self, stage: str, reason: str) -> None:
+        raise CMakeError(f"{self.command.location}: math cannot {stage} the expression: "
+                         f"\"{self.expression}\": {reason}.")
+
+    def peek(self, operators: Tuple[str, ...]) -> Optional[str]:
+        if self.position < len(self.tokens):
+            token = self.tokens[self.position]
+            if isinstance(token, str) and token in operators:
+                return token
+        return None
+
+    def evaluate(self) -> int:
+        result = self.parse_binary(0)
+        if self.position < len(self.tokens):
+            self.fail('parse', f"syntax error, unexpected {self.tokens[self.position]!r}")
+        return result
+
+    def parse_binary(self, level: int) -> int:
+        if level == len(MATH_OPERATORS):
+            return self.parse_unary()
+        result = self.parse_binary(level + 1)
+        while (operator := self.peek(MATH_OPERATORS[level])) is not None:
+            self.position += 1
+            result = self.apply(operator, result, self.parse_binary(level + 1))
+        return result
+
+    def parse_unary(self) -> int:
+        if self.position >= len(self.tokens):
+            self.fail('parse', "syntax error, unexpected end of expression")
+        token = self.tokens[self.position]
+        self.position += 1
+        if isinstance(token, int):
+            return token
+        if token == '(':
+            result = self.parse_binary(0)
+            if self.peek((')',)) is None:
+                self.fail('parse', "syntax error, mismatched parenthesis")
+            self.position += 1
+            return result
+        if token in ('+', '-', '~'):
+            value = self.parse_unary()
+            return {'+': value, '-': to_int64(-value), '~': ~value}[token]
+        self.fail('parse', f"syntax error, unexpected {token!r}")
+
+    def apply(self, operator: str, left: int, right: int) -> int:
+        if operator in ('/', '%'):
+            if right == 0:
+                self.fail('evaluate', "divide by zero")
+            quotient = abs(left) // abs(right) * (1 if (left < 0) == (right < 0) else -1)
+            return to_int64(quotient if operator == '/' else left - right * quotient)
+        if operator in ('<<', '>>'):
+            # x86-64 only uses the 6 low bits of the count
+            return to_int64(left << (right & 63) if operator == '<<' else left >> (right & 63))
+        return to_int64({'|': left | right, '^': left ^ right, '&': left & right,
+                         '+': left + right, '-': left - right, '*': left * right}[operator])
+
+
+
+# ---------------------------------------------------------------------------
+# Extraction
+# ---------------------------------------------------------------------------
+
+PROJECT_DIR = Path(__file__).parent / "extract_deps_project"
+# Version reported to the CMake files, for their CMAKE_VERSION checks, when the
+# CMake extraction does not give the one of its cmake: the cmake of pixi.lock
+CMAKE_VERSION = "4.1.1"
+
+
+def initial_variables(project_dir: Path, binary_dir: Path, cmake_version: str = CMAKE_VERSION) -> Dict[str, str]:
+    """The variables CMake defines before reading the top-level CMakeLists.txt."""
+    system = platform.system()
+    variables = {
+        'CMAKE_SOURCE_DIR': str(project_dir), 'CMAKE_BINARY_DIR': str(binary_dir),
+        'CMAKE_VERSION': cmake_version, 'CMAKE_COMMAND': shutil.which('cmake') or 'cmake',
+        'CMAKE_SYSTEM_NAME': system, 'CMAKE_HOST_SYSTEM_NAME': system,
+        'CMAKE_SYSTEM_PROCESSOR': platform.machine(), 'CMAKE_HOST_SYSTEM_PROCESSOR': platform.machine(),
+        'CMAKE_C_COMPILER_ID': 'GNU', 'CMAKE_CXX_COMPILER_ID': 'GNU', 'CMAKE_SIZEOF_VOID_P': '8',
+    }
+    for part, value in zip(('MAJOR', 'MINOR', 'PATCH'), cmake_version.split('.')):
+        variables[f"CMAKE_{part}_VERSION"] = value
+    if system == 'Windows':
+        variables.update({'WIN32': '1', 'CMAKE_HOST_WIN32': '1'})
+    else:
+        variables.update({'UNIX': '1', 'CMAKE_HOST_UNIX': '1'})
+        if system == 'Linux':
+            variables.update({'LINUX': '1', 'CMAKE_HOST_LINUX': '1'})
+    return variables
+
+
+def extract_declarations(source_dir: Path, amdgpu_families: str,
+                         project_dir: Path = PROJECT_DIR,
+                         binary_dir: Path = Path("build_extract_deps"),
+                         cmake_version: str = CMAKE_VERSION
+                         ) -> Tuple[List[Tuple[str, Dict[str, List[str]]]], Evaluator]:
+    """
+    Evaluate `extract_deps_project` against TheRock, as its CMake configure would.
+
+    Returns the `(project, {'build': [...], 'runtime': [...]})` pairs of the
+    declared subprojects and the evaluator (for its `unsupported` commands and
+    parsed files). Raises CMakeError when the configure would fail.
+    `cmake_version` is the CMAKE_VERSION the CMake files see.
+    """
+    project_dir = project_dir.resolve()
+    binary_dir = binary_dir.absolute()
+    evaluator = Evaluator({
+        'THEROCK_SOURCE_DIR': str(source_dir.absolute()),
+        'THEROCK_AMDGPU_FAMILIES': amdgpu_families,
+        'CMAKE_INSTALL_PREFIX': '/usr/local',
+        'CMAKE_BUILD_TYPE': '',
+    })
+    evaluator.run_directory(project_dir, binary_dir, Scope(initial_variables(project_dir, binary_dir, cmake_version)))
+    if evaluator.errors:
+        raise CMakeError('\n'.join(evaluator.errors))
+
+    pairs = []
+    for name in split_list(evaluator.global_properties.get('ALL_PROJECTS', '')):
+        deps = {kind: split_list(evaluator.global_properties.get(f"{prefix}_DEPS_{name}", ''))
+                for kind, prefix in (('build', 'BUILD'), ('runtime', 'RUNTIME'))}
+        pairs.append((name, deps))
+    return pairs, evaluator
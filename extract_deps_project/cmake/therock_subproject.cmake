@@ -8,34 +8,25 @@ function(therock_cmake_subproject_declare PROJECT_NAME)
     )
     
     message(STATUS "therock_cmake_subproject_declare with ${PROJECT_NAME} ARG_BUILD_DEPS: ${ARG_BUILD_DEPS} ARG_RUNTIME_DEPS: ${ARG_RUNTIME_DEPS}")
-    # Collect all dependencies (both BUILD_DEPS and RUNTIME_DEPS)
-    set(ALL_PROJECT_DEPS "")
-    if(ARG_BUILD_DEPS)
-        list(APPEND ALL_PROJECT_DEPS ${ARG_BUILD_DEPS})
-    endif()
-    if(ARG_RUNTIME_DEPS)
-        list(APPEND ALL_PROJECT_DEPS ${ARG_RUNTIME_DEPS})
-    endif()
-    
+    # Keep BUILD_DEPS and RUNTIME_DEPS apart: only the former serialize builds
+    set(PROJECT_BUILD_DEPS "${ARG_BUILD_DEPS}")
+    set(PROJECT_RUNTIME_DEPS "${ARG_RUNTIME_DEPS}")
+
     # Remove duplicates
-    if(ALL_PROJECT_DEPS)
-        list(REMOVE_DUPLICATES ALL_PROJECT_DEPS)
+    if(PROJECT_BUILD_DEPS)
+        list(REMOVE_DUPLICATES PROJECT_BUILD_DEPS)
     endif()
-    
-    # Format as: PROJECT_NAME:dep1,dep2,dep3
-    set(DEPS_STRING "${PROJECT_NAME}:")
-    if(ALL_PROJECT_DEPS)
-        string(REPLACE ";" "," DEPS_LIST "${ALL_PROJECT_DEPS}")
-        set(DEPS_STRING "${DEPS_STRING}${DEPS_LIST}")
+    if(PROJECT_RUNTIME_DEPS)
+        list(REMOVE_DUPLICATES PROJECT_RUNTIME_DEPS)
     endif()
-    
-    # Add to global list using global property
-    get_property(CURRENT_ALL_DEPS GLOBAL PROPERTY ALL_DEPS)
-    list(APPEND CURRENT_ALL_DEPS "${DEPS_STRING}")
-    set_property(GLOBAL PROPERTY ALL_DEPS "${CURRENT_ALL_DEPS}")
-    
+
+    # Add to global lists using global properties
+    set_property(GLOBAL APPEND PROPERTY ALL_PROJECTS "${PROJECT_NAME}")
+    set_property(GLOBAL PROPERTY BUILD_DEPS_${PROJECT_NAME} "${PROJECT_BUILD_DEPS}")
+    set_property(GLOBAL PROPERTY RUNTIME_DEPS_${PROJECT_NAME} "${PROJECT_RUNTIME_DEPS}")
+
     # Optional: print for debugging
-    message(STATUS "Found project: ${PROJECT_NAME} with deps: ${ALL_PROJECT_DEPS}")
+    message(STATUS "Found project: ${PROJECT_NAME} with build deps: ${PROJECT_BUILD_DEPS} runtime deps: ${PROJECT_RUNTIME_DEPS}")
 
     # Add dummy target to ensure that add_dependencies works fine
     add_custom_target(${PROJECT_NAME})
@@ -9,13 +9,30 @@ Create a dependency graph of sub‑projects declared in AMD ROCm *TheRock*.
 Features
 ~~~~~~~~
 * Uses CMake to properly extract `therock_cmake_subproject_declare()` calls with variable expansion.
-* Collects BUILD_DEPS and RUNTIME_DEPS by overriding the CMake function.
+* Optionally extracts them without CMake (`--engine fast`), evaluating the same
+  extraction project with a small CMake evaluator in milliseconds, and checks
+  the two extractions against each other (`--engine both`).
+* Collects BUILD_DEPS and RUNTIME_DEPS by overriding the CMake function, keeping
+  the two kinds apart as a `dep_types` edge attribute (runtime-only edges are gray).
+* Exports the graph with all its attributes as JSON, GraphML or plain DOT.
+* Reports topological levels, level widths, the critical path (weighted by the
+  optional `build_time` of prj_info.yaml) and transitive fan-in/fan-out.
+* Answers which subprojects are transitively impacted by a change (`--impacted-by`).
+* Checks prj_info.yaml against the subprojects and the local recipes (`--check-project-info`).
+* Diffs the graphs of two TheRock revisions (`--diff OLD NEW`), checked out in
+  temporary worktrees and extracted concurrently, with the changes highlighted
+  in a DOT/PNG; extractions are cached per commit.
 * Filters external dependencies (starting with 'therock-') by default for cleaner graphs.
 * Groups projects by GitHub repository using colored background boxes.
 * External dependencies are grouped in a gray "External Dependencies" box.
 * Generates a NetworkX DiGraph with root dependencies at top, leaves at bottom.
 * Writes a Graphviz .dot file with repository-based subgraphs.
-* Renders a PNG/SVG with Graphviz's `dot` (hierarchical layout).
+* Renders a PNG/SVG with Graphviz's `dot` (hierarchical layout), in a single
+  layout pass, skipping Graphviz entirely when the graph did not change.
+* Caches extraction results keyed on a fingerprint of the CMake inputs, so
+  re-running on an unchanged TheRock tree does not configure CMake again.
+* Extracts several AMDGPU families concurrently and merges them in one graph,
+  recording which families declare each node and edge.
 
 Usage
 ~~~~~
@@ -27,22 +44,42 @@ Or directly with Python (requires manual dependency installation):
     python3 extract_the_rock_deps.py TheRock                    # Exclude external deps
     python3 extract_the_rock_deps.py TheRock --include-external # Include external deps
     python3 extract_the_rock_deps.py TheRock --project-info custom_prj_info.yaml  # Custom project info
+    python3 extract_the_rock_deps.py TheRock --no-cache         # Always run the CMake configure
+    python3 extract_the_rock_deps.py TheRock --engine fast      # No CMake configure at all
+    python3 extract_the_rock_deps.py TheRock --amdgpu-families gfx1100,gfx942,gfx90a --jobs 3
+    python3 extract_the_rock_deps.py TheRock --export the_rock_deps.json --format json
+    python3 extract_the_rock_deps.py TheRock --analyze
+    python3 extract_the_rock_deps.py TheRock --impacted-by amd-comgr,rocprim
+    python3 extract_the_rock_deps.py --graph the_rock_deps.json --impacted-by rocprim --impacted-depth 1
+    python3 extract_the_rock_deps.py TheRock --check-project-info
+    python3 extract_the_rock_deps.py TheRock --diff rocm-7.0.0 HEAD --diff-png the_rock_deps_diff.png
 
 Requires:  Python 3.8+, networkx, pydot (optional but recommended), PyYAML,
            CMake, and Graphviz binaries (`dot`) on your PATH for rendering.
 """
 
 import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib.util
+import json
+import os
 import re
+import shutil
 import subprocess
 import sys
+import tempfile
+import time
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional, Union
 
 import networkx as nx
 from networkx.drawing.nx_pydot import write_dot
 import yaml
 
+import extract_deps_fast as fast_engine
+
 
 # ---------------------------------------------------------------------------
 # 1.  CMake-based dependency extraction
@@ -80,33 +117,164 @@ def load_project_repo_info(yaml_path: Path) -> Dict[str, Dict[str, str]]:
     return project_info_map
 
 
-def extract_deps_with_cmake(source_dir: Path) -> List[Tuple[str, List[str]]]:
+DEFAULT_AMDGPU_FAMILIES = "gfx1100"
+DEP_KINDS = ('build', 'runtime')
+
+# (project, {'build': [...], 'runtime': [...]}) pairs, as extracted from TheRock
+ProjectDeps = List[Tuple[str, Dict[str, List[str]]]]
+DEFAULT_CACHE_DIR = Path(__file__).parent / ".extract_deps_cache"
+# 'both' extracts with CMake and checks the result against the fast engine
+ENGINES = ('cmake', 'fast', 'both')
+
+
+def get_cmake_version() -> Optional[str]:
+    """Return the first line of `cmake --version`, or None if CMake is not usable."""
+    try:
+        result = subprocess.run(
+            ["cmake", "--version"], check=True, capture_output=True, text=True
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+    lines = result.stdout.splitlines()
+    return lines[0].strip() if lines else None
+
+
+def cmake_version_number(cmake_version: Optional[str]) -> str:
     """
-    Use CMake to extract dependencies by overriding therock_cmake_subproject_declare.
-    This approach handles variable expansion and catches all declarations.
+    Return the x.y.z of a `cmake --version` line, the CMAKE_VERSION the CMake
+    extraction sees. Without CMake, the one the fast engine assumes.
+    """
+    match = re.search(r'\d+\.\d+\.\d+', cmake_version or '')
+    return match.group(0) if match else fast_engine.CMAKE_VERSION
+
+
+def hash_file(path: Path) -> str:
+    """Return the sha256 of a file's content, or 'missing' if it does not exist."""
+    if not path.is_file():
+        return "missing"
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def compute_extraction_context(amdgpu_families: str, cmake_version: Optional[str]) -> str:
+    """
+    Hash everything that influences the extraction besides TheRock itself:
+    the CMake version, the AMDGPU families and the files of `extract_deps_project`
+    (including the `therock_subproject.cmake` override).
     """
-    # Create a temporary build directory
-    build_dir = Path(__file__).parent / "build_extract_deps"
     project_dir = Path(__file__).parent / "extract_deps_project"
-    deps_file = build_dir / "therock_deps.txt"
-    
+    hasher = hashlib.sha256()
+    hasher.update(f"cmake={cmake_version}\n".encode())
+    hasher.update(f"amdgpu_families={amdgpu_families}\n".encode())
+    for path in sorted(p for p in project_dir.rglob('*') if p.is_file()):
+        rel = path.relative_to(project_dir).as_posix()
+        hasher.update(f"{rel}={hash_file(path)}\n".encode())
+    return hasher.hexdigest()
+
+
+def compute_extraction_fingerprint(source_dir: Path, context: str, input_files: List[str]) -> str:
+    """
+    Combine the extraction context with the content of the TheRock files read by CMake.
+
+    `input_files` are paths relative to `source_dir`, as recorded by a previous
+    configure (see `collect_cmake_inputs`).
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"context={context}\n".encode())
+    for rel in sorted(input_files):
+        hasher.update(f"{rel}={hash_file(source_dir / rel)}\n".encode())
+    return hasher.hexdigest()
+
+
+def collect_cmake_inputs(build_dir: Path, source_dir: Path) -> List[str]:
+    """
+    Return the TheRock files (relative to `source_dir`) read during the configure,
+    using the `cmakeFiles` object of the CMake file API.
+
+    Falls back to every CMakeLists.txt and *.cmake file of the tree if the
+    file API reply is not available.
+    """
+    source_root = source_dir.resolve()
+    inputs = set()
+    replies = sorted((build_dir / ".cmake" / "api" / "v1" / "reply").glob("cmakeFiles-v1-*.json"))
+    if replies:
+        with open(replies[-1], 'r') as f:
+            data = json.load(f)
+        top_source = Path(data.get('paths', {}).get('source', ''))
+        for entry in data.get('inputs', []):
+            if entry.get('isGenerated'):
+                continue
+            path = Path(entry['path'])
+            if not path.is_absolute():
+                path = top_source / path
+            try:
+                inputs.add(path.resolve().relative_to(source_root).as_posix())
+            except ValueError:
+                # Not part of TheRock (our own project or CMake's modules)
+                continue
+        return sorted(inputs)
+
+    print("Warning: CMake file API reply not found, fingerprinting all CMake files of the tree")
+    for pattern in ("CMakeLists.txt", "*.cmake"):
+        for path in source_root.rglob(pattern):
+            if '.git' not in path.parts:
+                inputs.add(path.relative_to(source_root).as_posix())
+    return sorted(inputs)
+
+
+def parse_deps_file(deps_file: Path) -> ProjectDeps:
+    """
+    Parse the `therock_deps.json` file written by the CMake extraction project.
+
+    Returns `(project, deps)` pairs where `deps` maps each dependency kind
+    ('build' for BUILD_DEPS, 'runtime' for RUNTIME_DEPS) to its list of projects.
+    """
+    with open(deps_file, 'r') as f:
+        data = json.load(f)
+
+    results = []
+    for entry in data.get('projects', []):
+        deps = {kind: list(entry.get(f"{kind}_deps", [])) for kind in DEP_KINDS}
+        results.append((entry['name'], deps))
+    return results
+
+
+def run_cmake_extraction(source_dir: Path, build_dir: Path,
+                         amdgpu_families: str = DEFAULT_AMDGPU_FAMILIES
+                         ) -> Tuple[ProjectDeps, List[str]]:
+    """
+    Configure `extract_deps_project` against TheRock in `build_dir`.
+
+    Returns the extracted `(project, deps)` pairs and the list of TheRock files
+    read by CMake (relative to `source_dir`). On failure the pairs are empty.
+    """
+    project_dir = Path(__file__).parent / "extract_deps_project"
+    deps_file = build_dir / "therock_deps.json"
+
     # Clean up any existing build directory
     if build_dir.exists():
-        import shutil
         shutil.rmtree(build_dir)
-    
-    build_dir.mkdir(exist_ok=True)
-    
+
+    build_dir.mkdir(parents=True, exist_ok=True)
+
+    # Ask CMake to report the files it reads, used to fingerprint the cache entry
+    query_dir = build_dir / ".cmake" / "api" / "v1" / "query"
+    query_dir.mkdir(parents=True, exist_ok=True)
+    (query_dir / "cmakeFiles-v1").touch()
+
     print(f"Running CMake extraction from {source_dir}...")
     print(f"Using build directory: {build_dir}")
-    
+
     try:
         # Configure the CMake project
         result = subprocess.run(
             [
                 "cmake", 
                 f"-DTHEROCK_SOURCE_DIR={source_dir.absolute()}",
-                "-DTHEROCK_AMDGPU_FAMILIES=gfx1100",
+                f"-DTHEROCK_AMDGPU_FAMILIES={amdgpu_families}",
                 str(project_dir)
             ],
             cwd=build_dir,
@@ -124,36 +292,237 @@ def extract_deps_with_cmake(source_dir: Path) -> List[Tuple[str, List[str]]]:
         print(f"CMake configuration failed: {e}")
         print(f"stdout: {e.stdout}")
         print(f"stderr: {e.stderr}")
-        return []
+        return [], []
     except FileNotFoundError:
         print("Error: CMake not found on PATH")
-        return []
+        return [], []
     
     # Parse the output file
     if not deps_file.exists():
         print("Error: Dependencies file was not created")
-        return []
+        return [], []
     
-    results = []
     try:
-        with open(deps_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or ':' not in line:
-                    continue
-                
-                project_name, deps_str = line.split(':', 1)
-                deps = [d.strip() for d in deps_str.split(',') if d.strip()]
-                results.append((project_name, deps))
-                
+        results = parse_deps_file(deps_file)
     except Exception as e:
         print(f"Error parsing dependencies file: {e}")
-        return []
-    
+        return [], []
+
+    return results, collect_cmake_inputs(build_dir, source_dir)
+
+
+def extract_deps_with_cmake(source_dir: Path,
+                            amdgpu_families: str = DEFAULT_AMDGPU_FAMILIES,
+                            cache_dir: Optional[Path] = DEFAULT_CACHE_DIR,
+                            build_dir: Optional[Path] = None) -> ProjectDeps:
+    """
+    Use CMake to extract dependencies by overriding therock_cmake_subproject_declare.
+    This approach handles variable expansion and catches all declarations.
+
+    Results are cached in `cache_dir` (pass None to disable the cache), keyed on a
+    fingerprint of the TheRock files read by CMake, the `extract_deps_project`
+    files, the AMDGPU families and the CMake version. On a hit CMake is not run.
+    """
+    if build_dir is None:
+        build_dir = Path(__file__).parent / "build_extract_deps"
+
+    start = time.perf_counter()
+    context = compute_extraction_context(amdgpu_families, get_cmake_version())
+    inputs_path = entry_path = None
+    input_files: List[str] = []
+
+    if cache_dir is not None:
+        inputs_path = cache_dir / "inputs" / f"{context}.json"
+        if inputs_path.exists():
+            with open(inputs_path, 'r') as f:
+                input_files = json.load(f)
+            fingerprint = compute_extraction_fingerprint(source_dir, context, input_files)
+            entry_path = cache_dir / "entries" / f"{fingerprint}.json"
+            if entry_path.exists():
+                with open(entry_path, 'r') as f:
+                    entry = json.load(f)
+                results = [(name, deps) for name, deps in entry['pairs']]
+                elapsed = time.perf_counter() - start
+                print(f"Extraction cache hit ({fingerprint[:12]}): "
+                      f"loaded {len(results)} projects in {elapsed:.3f}s")
+                return results
+
+    results, read_files = run_cmake_extraction(source_dir, build_dir, amdgpu_families)
+    elapsed = time.perf_counter() - start
+    if cache_dir is not None:
+        print(f"Extraction cache miss: CMake extraction took {elapsed:.1f}s")
+
+    if cache_dir is not None and results:
+        # Remember every file read so far for this context: a file that starts being
+        # read can only do so because an already tracked file changed.
+        input_files = sorted(set(input_files) | set(read_files))
+        fingerprint = compute_extraction_fingerprint(source_dir, context, input_files)
+        entry_path = cache_dir / "entries" / f"{fingerprint}.json"
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        inputs_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(inputs_path, 'w') as f:
+            json.dump(input_files, f, indent=1)
+        with open(entry_path, 'w') as f:
+            json.dump({
+                'amdgpu_families': amdgpu_families,
+                'pairs': [[name, deps] for name, deps in results],
+            }, f, indent=1)
+        print(f"Stored extraction in cache ({fingerprint[:12]}, {len(input_files)} input files)")
+
     print(f"Extracted {len(results)} projects with dependencies")
     return results
 
 
+def extract_deps_fast(source_dir: Path,
+                      amdgpu_families: str = DEFAULT_AMDGPU_FAMILIES,
+                      build_dir: Optional[Path] = None,
+                      cmake_version: str = fast_engine.CMAKE_VERSION) -> ProjectDeps:
+    """
+    Extract the dependencies without CMake, evaluating `extract_deps_project`
+    and the TheRock CMake files with the evaluator of extract_deps_fast.py.
+
+    It takes milliseconds, so the results are not cached. The commands the
+    evaluator does not support are skipped and reported: when in doubt, check
+    against CMake with `--engine both`. On failure the pairs are empty.
+    `cmake_version` is the CMAKE_VERSION the CMake files see.
+    """
+    if build_dir is None:
+        build_dir = Path(__file__).parent / "build_extract_deps"
+
+    start = time.perf_counter()
+    try:
+        results, evaluator = fast_engine.extract_declarations(source_dir, amdgpu_families, binary_dir=build_dir,
+                                                              cmake_version=cmake_version)
+    except (fast_engine.CMakeError, OSError) as e:
+        print(f"Fast extraction failed: {e}")
+        return []
+    elapsed = time.perf_counter() - start
+
+    print(f"Fast extraction of {len(results)} projects from {len(evaluator.parsed)} CMake files "
+          f"took {elapsed * 1000:.0f}ms")
+    if evaluator.unsupported:
+        print(f"Warning: skipped {len(evaluator.unsupported)} unsupported CMake commands:")
+        for command, location in sorted(evaluator.unsupported.items()):
+            print(f"  {command} at {location}")
+    return results
+
+
+def diff_extractions(reference: ProjectDeps, other: ProjectDeps,
+                     names: Tuple[str, str] = ('cmake', 'fast')) -> List[str]:
+    """Describe the differences between two extractions of the same tree, one line each."""
+    reference_deps, other_deps = dict(reference), dict(other)
+    lines = []
+    for project in reference_deps:
+        if project not in other_deps:
+            lines.append(f"{project}: only declared by {names[0]}")
+    for project in other_deps:
+        if project not in reference_deps:
+            lines.append(f"{project}: only declared by {names[1]}")
+    for project, deps in reference_deps.items():
+        if project not in other_deps:
+            continue
+        for kind in DEP_KINDS:
+            missing = [d for d in deps.get(kind, []) if d not in other_deps[project].get(kind, [])]
+            extra = [d for d in other_deps[project].get(kind, []) if d not in deps.get(kind, [])]
+            if missing:
+                lines.append(f"{project}: {kind} deps only in {names[0]}: {', '.join(missing)}")
+            if extra:
+                lines.append(f"{project}: {kind} deps only in {names[1]}: {', '.join(extra)}")
+    return lines
+
+
+def extract_deps(source_dir: Path,
+                 amdgpu_families: str = DEFAULT_AMDGPU_FAMILIES,
+                 engine: str = 'cmake',
+                 cache_dir: Optional[Path] = DEFAULT_CACHE_DIR,
+                 build_dir: Optional[Path] = None) -> ProjectDeps:
+    """
+    Extract the dependencies with one of ENGINES. With 'both' the CMake results
+    are returned, after reporting how the fast engine differs from them.
+    """
+    if engine == 'fast':
+        return extract_deps_fast(source_dir, amdgpu_families, build_dir)
+
+    results = extract_deps_with_cmake(source_dir, amdgpu_families, cache_dir, build_dir)
+    if engine == 'both' and results:
+        # Same CMAKE_VERSION as the cmake that gave the results
+        cmake_version = cmake_version_number(get_cmake_version())
+        differences = diff_extractions(results, extract_deps_fast(source_dir, amdgpu_families, build_dir,
+                                                                  cmake_version))
+        if differences:
+            print(f"Warning: the fast engine differs from CMake for {amdgpu_families}:")
+            for line in differences:
+                print(f"  {line}")
+        else:
+            print(f"The fast engine agrees with CMake on the {len(results)} projects of {amdgpu_families}")
+    return results
+
+
+def parse_amdgpu_families(value: str) -> List[str]:
+    """Split a comma separated `--amdgpu-families` value, dropping duplicates."""
+    families = []
+    for family in value.split(','):
+        family = family.strip()
+        if family and family not in families:
+            families.append(family)
+    return families
+
+
+def extract_deps_for_families(source_dir: Path, amdgpu_families: List[str],
+                              jobs: Optional[int] = None,
+                              cache_dir: Optional[Path] = DEFAULT_CACHE_DIR,
+                              engine: str = 'cmake',
+                              build_root: Optional[Path] = None
+                              ) -> Dict[str, ProjectDeps]:
+    """
+    Run one extraction per AMDGPU family, concurrently in a process pool of at
+    most `jobs` workers, each family using its own build directory in `build_root`.
+
+    Returns a dictionary mapping each family to its `(project, deps)` pairs, in
+    the order of `amdgpu_families`.
+    """
+    if build_root is None:
+        build_root = Path(__file__).parent / "build_extract_deps"
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(amdgpu_families)))
+
+    start = time.perf_counter()
+    if jobs == 1:
+        results = {
+            family: extract_deps(source_dir, family, engine, cache_dir, build_root / family)
+            for family in amdgpu_families
+        }
+    else:
+        print(f"Extracting dependencies for {len(amdgpu_families)} AMDGPU families with {jobs} jobs")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                family: executor.submit(extract_deps, source_dir, family, engine,
+                                        cache_dir, build_root / family)
+                for family in amdgpu_families
+            }
+            results = {family: future.result() for family, future in futures.items()}
+
+    elapsed = time.perf_counter() - start
+    for family, pairs in results.items():
+        print(f"  {family}: {len(pairs)} projects")
+    print(f"Extracted {len(amdgpu_families)} AMDGPU families in {elapsed:.1f}s")
+    return results
+
+
+def extract_pairs(source_dir: Path, families: List[str], args: argparse.Namespace,
+                  build_root: Optional[Path] = None) -> Union[ProjectDeps, Dict[str, ProjectDeps]]:
+    """
+    Extract the pairs of a TheRock tree with the options given on the command
+    line: a list for a single AMDGPU family, else a dictionary by family.
+    """
+    cache_dir = None if args.no_cache else args.cache_dir
+    if len(families) == 1:
+        build_dir = None if build_root is None else build_root / families[0]
+        return extract_deps(source_dir, families[0], args.engine, cache_dir, build_dir)
+    return extract_deps_for_families(source_dir, families, args.jobs, cache_dir, args.engine, build_root)
+
+
 # ---------------------------------------------------------------------------
 # 2.  Graph construction & DOT rendering
 # ---------------------------------------------------------------------------
@@ -172,80 +541,100 @@ def should_exclude_external_node(node_name: str, include_external: bool) -> bool
     return not include_external and node_name.startswith('therock-')
 
 
-def build_graph(pairs: List[Tuple[str, List[str]]], include_external: bool = False, 
+def make_node_attrs(node: str, project_info_map: Dict[str, Dict[str, str]]) -> dict:
+    """Return the attributes (repository and project metadata) of a graph node."""
+    # Get project information
+    project_info = project_info_map.get(node, {})
+
+    # Determine the repository for this node
+    github_repo = project_info.get('github_repo', 'unknown')
+    if isinstance(github_repo, list):
+        github_repo = github_repo[0]  # Use first repo as primary
+
+    if node.startswith('therock-'):
+        repo = "external"
+    else:
+        repo = github_repo
+
+    # Store all project info as node attributes
+    node_attrs = {'repository': repo}
+    node_attrs.update(project_info)
+    return node_attrs
+
+
+def build_graph(pairs: Union[ProjectDeps, Dict[str, ProjectDeps]],
+                include_external: bool = False,
                 project_info_map: Optional[Dict[str, Dict[str, str]]] = None) -> nx.DiGraph:
+    """
+    Build the dependency graph from the extracted `(project, deps)` pairs.
+
+    Every edge goes from the dependency to the dependent and has a `dep_types`
+    attribute listing the kinds of the dependency ('build' and/or 'runtime').
+
+    `pairs` can also be a dictionary mapping each AMDGPU family to the pairs
+    extracted for it: the graphs are merged, and every node and edge gets an
+    `amdgpu_families` attribute listing the families that declare it.
+    """
     g = nx.DiGraph()
     
     if project_info_map is None:
         project_info_map = {}
-    
-    # First pass: add main project nodes (filter external projects too)
-    for node, deps in pairs:
-        # Skip external projects (starting with 'therock-') unless explicitly included
-        if should_exclude_external_node(node, include_external):
-            continue
-        
-        # Get project information
-        project_info = project_info_map.get(node, {})
-        
-        # Determine the repository for this node
-        github_repo = project_info.get('github_repo', 'unknown')
-        if isinstance(github_repo, list):
-            github_repo = github_repo[0]  # Use first repo as primary
-        
-        if node.startswith('therock-'):
-            repo = "external"
-        else:
-            repo = github_repo
-        
-        # Store all project info as node attributes
-        node_attrs = {'repository': repo}
-        node_attrs.update(project_info)
-        
-        g.add_node(node, **node_attrs)
-    
-    # Second pass: add edges and dependency nodes
-    for node, deps in pairs:
-        # Skip external projects (starting with 'therock-') unless explicitly included
-        if should_exclude_external_node(node, include_external):
-            continue
-            
-        for d in deps:
-            # Skip external dependencies (starting with 'therock-') unless explicitly included
-            if should_exclude_external_node(d, include_external):
+
+    pairs_by_family = pairs if isinstance(pairs, dict) else {None: pairs}
+    if isinstance(pairs, dict):
+        g.graph['amdgpu_families'] = list(pairs)
+
+    def record_family(attrs: dict, family: Optional[str]) -> None:
+        if family is not None and family not in attrs.setdefault('amdgpu_families', []):
+            attrs['amdgpu_families'].append(family)
+
+    for family, family_pairs in pairs_by_family.items():
+        # First pass: add main project nodes (filter external projects too)
+        for node, deps in family_pairs:
+            # Skip external projects (starting with 'therock-') unless explicitly included
+            if should_exclude_external_node(node, include_external):
                 continue
-            
-            # Add the dependency node if it doesn't exist yet
-            if not g.has_node(d):
-                # Get project information for dependency
-                project_info = project_info_map.get(d, {})
-                
-                # Determine the repository for this dependency
-                github_repo = project_info.get('github_repo', 'unknown')
-                if isinstance(github_repo, list):
-                    github_repo = github_repo[0]  # Use first repo as primary
-                
-                if d.startswith('therock-'):
-                    repo = "external"
-                else:
-                    repo = github_repo
-                
-                # Store all project info as node attributes
-                node_attrs = {'repository': repo}
-                node_attrs.update(project_info)
-                
-                g.add_node(d, **node_attrs)
-            
-            # Reverse the edge direction: dependency -> dependent
-            # This makes dependencies appear at the top, dependents at the bottom
-            g.add_edge(d, node)
+
+            if not g.has_node(node):
+                g.add_node(node, **make_node_attrs(node, project_info_map))
+            record_family(g.nodes[node], family)
+
+        # Second pass: add edges and dependency nodes
+        for node, deps in family_pairs:
+            # Skip external projects (starting with 'therock-') unless explicitly included
+            if should_exclude_external_node(node, include_external):
+                continue
+
+            for kind, kind_deps in deps.items():
+                for d in kind_deps:
+                    # Skip external dependencies (starting with 'therock-') unless explicitly included
+                    if should_exclude_external_node(d, include_external):
+                        continue
+
+                    # Add the dependency node if it doesn't exist yet
+                    if not g.has_node(d):
+                        g.add_node(d, **make_node_attrs(d, project_info_map))
+                    record_family(g.nodes[d], family)
+
+                    # Reverse the edge direction: dependency -> dependent
+                    # This makes dependencies appear at the top, dependents at the bottom
+                    if not g.has_edge(d, node):
+                        g.add_edge(d, node, dep_types=[])
+                    edge_attrs = g.edges[d, node]
+                    if kind not in edge_attrs['dep_types']:
+                        edge_attrs['dep_types'] = sorted(edge_attrs['dep_types'] + [kind])
+                    record_family(edge_attrs, family)
     return g
 
 
-def create_colored_dot_with_subgraphs(g: nx.DiGraph, dot_path: Path) -> None:
+def generate_colored_dot(g: nx.DiGraph) -> str:
     """
-    Create a DOT file with repository-based subgraphs and colored backgrounds.
+    Generate the DOT text with repository-based subgraphs and colored backgrounds.
     Include additional metadata in node labels.
+
+    The output is deterministic: clusters, nodes and edges are sorted and the
+    cluster ids are derived from the repository names, so the same graph always
+    gives the same text.
     """
     # Group nodes by repository
     repo_nodes = {}
@@ -279,6 +668,8 @@ def create_colored_dot_with_subgraphs(g: nx.DiGraph, dot_path: Path) -> None:
         'unknown': '#F0F0F0',              # Light gray for unknown repos
     }
     
+    all_families = g.graph.get('amdgpu_families', [])
+
     def create_node_label(node_name: str, node_attrs: dict) -> str:
         """Create an enhanced label for a node with additional metadata."""
         # Start with "therock: " followed by the node name
@@ -292,6 +683,15 @@ def create_colored_dot_with_subgraphs(g: nx.DiGraph, dot_path: Path) -> None:
         # Always add conda-forge feedstock info, even if MISSING
         conda_feedstock = node_attrs.get('conda_forge_feedstock', 'MISSING')
         label_parts.append(f"conda: {conda_feedstock}")
+
+        # Mention the AMDGPU families only for nodes not declared by all of them
+        node_families = node_attrs.get('amdgpu_families')
+        if node_families and len(node_families) < len(all_families):
+            label_parts.append(f"families: {', '.join(node_families)}")
+
+        # Attributes changed between the two graphs of a --diff
+        if node_attrs.get('diff_changes'):
+            label_parts.append(f"changed: {', '.join(node_attrs['diff_changes'])}")
         
         # Join all parts with newlines
         return "\\n".join(label_parts)
@@ -303,8 +703,7 @@ def create_colored_dot_with_subgraphs(g: nx.DiGraph, dot_path: Path) -> None:
     lines.append('')
     
     # Create subgraphs for each repository
-    cluster_id = 0
-    for repo, nodes in repo_nodes.items():
+    for repo, nodes in sorted(repo_nodes.items()):
         if not nodes:
             continue
             
@@ -318,6 +717,7 @@ def create_colored_dot_with_subgraphs(g: nx.DiGraph, dot_path: Path) -> None:
         else:
             cluster_name = f"github: {repo}"
             
+        cluster_id = re.sub(r'[^0-9A-Za-z]+', '_', repo).strip('_')
         lines.append(f'\tsubgraph cluster_{cluster_id} {{')
         lines.append(f'\t\tlabel="{cluster_name}";')
         lines.append(f'\t\tstyle=filled;')
@@ -326,24 +726,51 @@ def create_colored_dot_with_subgraphs(g: nx.DiGraph, dot_path: Path) -> None:
         lines.append('')
         
         # Add nodes to this subgraph with enhanced labels
-        for node in nodes:
+        for node in sorted(nodes):
             node_attrs = g.nodes[node]
             enhanced_label = create_node_label(node, node_attrs)
-            lines.append(f'\t\t"{node}" [label="{enhanced_label}"];')
+            node_style = ''.join(f', {attr}' for attr in diff_style(node_attrs.get('diff_status')))
+            lines.append(f'\t\t"{node}" [label="{enhanced_label}"{node_style}];')
         
         lines.append('\t}')
         lines.append('')
-        cluster_id += 1
     
     # Add edges
     lines.append('\t// Edges')
-    for edge in g.edges():
-        lines.append(f'\t"{edge[0]}" -> "{edge[1]}";')
+    for edge in sorted(g.edges()):
+        edge_attrs = []
+        # Edges not declared by all the AMDGPU families are dashed
+        edge_families = g.edges[edge].get('amdgpu_families')
+        if edge_families and len(edge_families) < len(all_families):
+            edge_attrs.append('style=dashed')
+        # Runtime-only edges do not serialize builds, draw them in gray
+        if g.edges[edge].get('dep_types') == ['runtime']:
+            edge_attrs.append('color="#888888"')
+        # Edges added, removed or changed by a --diff take the color of their change
+        status_style = diff_style(g.edges[edge].get('diff_status'))
+        if status_style:
+            edge_attrs = [a for a in edge_attrs if not a.startswith('color=') and a not in status_style]
+            edge_attrs += status_style
+        if edge_attrs:
+            lines.append(f'\t"{edge[0]}" -> "{edge[1]}" [{", ".join(edge_attrs)}];')
+        else:
+            lines.append(f'\t"{edge[0]}" -> "{edge[1]}";')
     
     lines.append('}')
-    
-    with open(dot_path, 'w') as f:
-        f.write('\n'.join(lines))
+    return '\n'.join(lines)
+
+
+def create_colored_dot_with_subgraphs(g: nx.DiGraph, dot_path: Path) -> str:
+    """
+    Create a DOT file with repository-based subgraphs and colored backgrounds.
+
+    The file is only rewritten if its content changed. Returns the DOT text.
+    """
+    text = generate_colored_dot(g)
+    if not dot_path.exists() or dot_path.read_text() != text:
+        with open(dot_path, 'w') as f:
+            f.write(text)
+    return text
 
 
 def render_with_dot(
@@ -351,66 +778,799 @@ def render_with_dot(
     dot_path: Path,
     png_path: Path | None = None,
     svg_path: Path | None = None,
+    force: bool = False,
 ) -> None:
+    """
+    Write the DOT file and render it to PNG and/or SVG with Graphviz.
+
+    The hash of the DOT text used for each output is stored in a stamp file next
+    to the DOT file: outputs that exist and were rendered from the same text are
+    reused without running Graphviz (unless `force` is set). The outputs to
+    (re)generate are all produced by a single `dot` invocation, so the graph
+    layout is computed only once.
+    """
     # Create the DOT file with repository-based subgraphs
-    create_colored_dot_with_subgraphs(g, dot_path)
-    
-    for out, flag in ((png_path, "-Tpng"), (svg_path, "-Tsvg")):
+    text = create_colored_dot_with_subgraphs(g, dot_path)
+    digest = hashlib.sha256(text.encode()).hexdigest()
+
+    stamp_path = dot_path.with_name(dot_path.name + ".stamp")
+    stamps: Dict[str, str] = {}
+    if stamp_path.exists():
+        try:
+            with open(stamp_path, 'r') as f:
+                stamps = json.load(f)
+        except (OSError, ValueError):
+            stamps = {}
+
+    command = ["dot", str(dot_path)]
+    pending = []
+    for out, fmt in ((png_path, "png"), (svg_path, "svg")):
         if out is None:
             continue
+        if not force and out.exists() and stamps.get(str(out)) == digest:
+            print(f"↺ reused {out} (graph unchanged)")
+            continue
+        command += [f"-T{fmt}", "-o", str(out)]
+        pending.append(out)
+
+    if not pending:
+        return
+
+    start = time.perf_counter()
+    try:
+        subprocess.run(
+            command,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        print("⚠ Graphviz 'dot' not found on PATH – cannot render.", file=sys.stderr)
+        return
+    except subprocess.CalledProcessError as e:
+        print(f"⚠ dot failed: {e.stderr.decode()}", file=sys.stderr)
+        return
+
+    elapsed = time.perf_counter() - start
+    for out in pending:
+        stamps[str(out)] = digest
+        print(f"✔ wrote {out}")
+    print(f"Graphviz rendering took {elapsed:.1f}s")
+    with open(stamp_path, 'w') as f:
+        json.dump(stamps, f, indent=1, sort_keys=True)
+
+
+EXPORT_FORMATS = ('json', 'graphml', 'dot')
+
+
+def flatten_graph_attrs(g: nx.DiGraph) -> nx.DiGraph:
+    """Return a copy of the graph with list attributes joined as comma separated strings."""
+    def flatten(attrs: dict) -> dict:
+        return {k: ','.join(str(x) for x in v) if isinstance(v, list) else v
+                for k, v in attrs.items()}
+
+    flat = nx.DiGraph()
+    flat.graph.update(flatten(g.graph))
+    for node, attrs in g.nodes(data=True):
+        flat.add_node(node, **flatten(attrs))
+    for u, v, attrs in g.edges(data=True):
+        flat.add_edge(u, v, **flatten(attrs))
+    return flat
+
+
+def export_graph(g: nx.DiGraph, path: Path, fmt: str = 'json') -> None:
+    """
+    Write the graph with all its node and edge attributes (including the
+    `dep_types` of each edge) in a machine readable format.
+
+    JSON uses the networkx node-link layout and can be loaded back with
+    `load_graph`. GraphML and DOT cannot store lists, so list attributes are
+    written there as comma separated strings.
+    """
+    if fmt == 'json':
+        with open(path, 'w') as f:
+            json.dump(nx.node_link_data(g, edges="edges"), f, indent=1, sort_keys=True)
+    elif fmt == 'graphml':
+        nx.write_graphml(flatten_graph_attrs(g), path)
+    elif fmt == 'dot':
+        write_dot(flatten_graph_attrs(g), path)
+    else:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
+    print(f"✔ wrote {path}")
+
+
+def load_graph(path: Path) -> nx.DiGraph:
+    """Load a graph written by `export_graph` in JSON format."""
+    with open(path, 'r') as f:
+        return nx.node_link_graph(json.load(f), directed=True, edges="edges")
+
+
+def extract_graph(args: argparse.Namespace) -> nx.DiGraph:
+    """Extract the dependency graph from the TheRock tree given on the command line."""
+    # Load project repository mappings
+    project_info_map = load_project_repo_info(args.project_info)
+
+    pairs = extract_pairs(args.source_dir, parse_amdgpu_families(args.amdgpu_families), args, args.build_dir)
+    if isinstance(pairs, dict):
+        all_pairs = [pair for family_pairs in pairs.values() for pair in family_pairs]
+    else:
+        all_pairs = pairs
+    
+    # Filter and report on external dependencies
+    external_deps = len({(node, d) for node, deps in all_pairs
+                         for kind_deps in deps.values() for d in kind_deps if d.startswith('therock-')})
+    
+    if external_deps > 0:
+        if args.include_external:
+            print(f"Including {external_deps} external dependencies (therock-*) in the graph")
+        else:
+            print(f"Excluding {external_deps} external dependencies (therock-*) from the graph")
+            print("Use --include-external to include them")
+    
+    g = build_graph(pairs, args.include_external, project_info_map)
+
+    build_edges = sum(1 for _, _, types in g.edges(data='dep_types') if 'build' in types)
+    print(f"Graph has {g.number_of_nodes()} projects, {g.number_of_edges()} edges "
+          f"({build_edges} build, {g.number_of_edges() - build_edges} runtime-only)")
+    return g
+
+
+# ---------------------------------------------------------------------------
+# 3.  Scheduling analysis
+# ---------------------------------------------------------------------------
+
+# Optional per-project key of prj_info.yaml with the build time (in minutes)
+BUILD_TIME_KEY = 'build_time'
+
+
+def build_order_graph(g: nx.DiGraph) -> nx.DiGraph:
+    """
+    Return the subgraph of the edges that serialize builds (BUILD_DEPS).
+
+    Edges without a `dep_types` attribute are considered build edges.
+    """
+    order = nx.DiGraph()
+    order.add_nodes_from(g.nodes(data=True))
+    order.add_edges_from(
+        (u, v) for u, v, types in g.edges(data='dep_types') if types is None or 'build' in types
+    )
+    return order
+
+
+def analyze_schedule(g: nx.DiGraph, default_weight: float = 1.0) -> Dict[str, object]:
+    """
+    Compute scheduling information on the build edges of the dependency graph.
+
+    Returns a dictionary with:
+      * `levels`: project -> topological level (longest path, in edges, from a root)
+      * `level_widths`: list with the number of projects of each level
+      * `critical_path`: list of projects of the longest path weighted by build time
+      * `critical_path_weight`: sum of the weights along the critical path
+      * `total_weight`: sum of the weights of all projects
+      * `fan_in` / `fan_out`: project -> number of transitive dependencies / dependents
+      * `weights`: project -> weight used (the `build_time` of prj_info.yaml,
+        or `default_weight` if missing)
+    """
+    order = build_order_graph(g)
+    if not nx.is_directed_acyclic_graph(order):
+        cycle = nx.find_cycle(order)
+        raise ValueError(f"Build dependency cycle: {' -> '.join(u for u, _ in cycle)}")
+
+    weights = {}
+    for node, attrs in order.nodes(data=True):
+        try:
+            weights[node] = float(attrs.get(BUILD_TIME_KEY, default_weight))
+        except (TypeError, ValueError):
+            weights[node] = default_weight
+
+    levels: Dict[str, int] = {}
+    finish: Dict[str, float] = {}
+    best_pred: Dict[str, Optional[str]] = {}
+    for node in nx.topological_sort(order):
+        preds = list(order.predecessors(node))
+        levels[node] = max((levels[p] + 1 for p in preds), default=0)
+        best_pred[node] = max(preds, key=lambda p: finish[p], default=None)
+        finish[node] = weights[node] + (finish[best_pred[node]] if best_pred[node] else 0.0)
+
+    level_widths = [0] * (max(levels.values(), default=-1) + 1)
+    for level in levels.values():
+        level_widths[level] += 1
+
+    critical_path: List[str] = []
+    node = max(finish, key=finish.get, default=None)
+    while node is not None:
+        critical_path.append(node)
+        node = best_pred[node]
+    critical_path.reverse()
+
+    return {
+        'levels': levels,
+        'level_widths': level_widths,
+        'critical_path': critical_path,
+        'critical_path_weight': finish[critical_path[-1]] if critical_path else 0.0,
+        'total_weight': sum(weights.values()),
+        'fan_in': {n: len(nx.ancestors(order, n)) for n in order.nodes()},
+        'fan_out': {n: len(nx.descendants(order, n)) for n in order.nodes()},
+        'weights': weights,
+    }
+
+
+def annotate_schedule(g: nx.DiGraph, analysis: Dict[str, object]) -> None:
+    """Store the per-project results of `analyze_schedule` as node attributes."""
+    for node in g.nodes():
+        g.nodes[node]['level'] = analysis['levels'][node]
+        g.nodes[node]['fan_in'] = analysis['fan_in'][node]
+        g.nodes[node]['fan_out'] = analysis['fan_out'][node]
+
+
+def print_schedule_report(analysis: Dict[str, object]) -> None:
+    levels = analysis['levels']
+    print("\nScheduling analysis (build dependencies only)")
+    print("Level widths (projects that can build in parallel once the previous levels are done):")
+    for level, width in enumerate(analysis['level_widths']):
+        members = sorted(n for n, lvl in levels.items() if lvl == level)
+        print(f"  level {level}: {width:3d}  {', '.join(members)}")
+
+    critical_path = analysis['critical_path']
+    critical_weight = analysis['critical_path_weight']
+    total_weight = analysis['total_weight']
+    print(f"Critical path ({len(critical_path)} projects, weight {critical_weight:g}):")
+    print(f"  {' -> '.join(critical_path)}")
+    if critical_weight:
+        print(f"Total weight {total_weight:g}, maximum useful speedup {total_weight / critical_weight:.2f}x "
+              f"with {max(analysis['level_widths'], default=0)} parallel builds")
+
+    print(f"{'project':<32} {'level':>5} {'fan-in':>6} {'fan-out':>7} {'weight':>7}")
+    for node in sorted(levels, key=lambda n: (levels[n], n)):
+        print(f"{node:<32} {levels[node]:>5} {analysis['fan_in'][node]:>6} "
+              f"{analysis['fan_out'][node]:>7} {analysis['weights'][node]:>7g}")
+
+
+# ---------------------------------------------------------------------------
+# 4.  Impact queries
+# ---------------------------------------------------------------------------
+
+def impacted_by(g: nx.DiGraph, names: List[str], max_depth: Optional[int] = None,
+                dep_types: Optional[Tuple[str, ...]] = None) -> List[str]:
+    """
+    Return the projects affected by a change in any of `names`, in topological order.
+
+    The result contains `names` themselves and every project that transitively
+    depends on them. `max_depth` limits how many dependency edges are followed
+    (0 returns only `names`). `dep_types` restricts the edges followed to the
+    given kinds (e.g. `('build',)`); by default both build and runtime
+    dependencies are followed, as both require rebuilding or retesting.
+
+    Raises KeyError if one of `names` is not in the graph.
+    """
+    missing = [name for name in names if name not in g]
+    if missing:
+        raise KeyError(f"Unknown project(s): {', '.join(missing)}")
+
+    def follows(u: str, v: str) -> bool:
+        types = g.edges[u, v].get('dep_types')
+        return dep_types is None or types is None or any(t in dep_types for t in types)
+
+    depth = {name: 0 for name in names}
+    frontier = list(names)
+    while frontier:
+        next_frontier = []
+        for node in frontier:
+            if max_depth is not None and depth[node] >= max_depth:
+                continue
+            for dependent in g.successors(node):
+                if dependent not in depth and follows(node, dependent):
+                    depth[dependent] = depth[node] + 1
+                    next_frontier.append(dependent)
+        frontier = next_frontier
+
+    affected = g.subgraph(depth)
+    try:
+        return list(nx.lexicographical_topological_sort(affected))
+    except nx.NetworkXUnfeasible:
+        # Runtime dependencies can form cycles: fall back to the distance from the change
+        return sorted(depth, key=lambda n: (depth[n], n))
+
+
+# ---------------------------------------------------------------------------
+# 5.  Project info consistency
+# ---------------------------------------------------------------------------
+
+DEFAULT_RECIPES_DIR = Path(__file__).parent / "recipes"
+# Values of prj_info.yaml meaning that there is no such package
+PLACEHOLDER_VALUES = ('MISSING', 'NOT_A_SEPARATE_DEB_PACKAGE')
+PROJECT_INFO_KEY_PATTERN = re.compile(r'^([^\s#:-][^:]*):\s*(?:#.*)?$')
+
+
+def scan_project_info_keys(yaml_path: Path) -> Dict[str, List[int]]:
+    """
+    Return the line numbers of the top-level keys of a project info file.
+
+    PyYAML silently keeps only the last of duplicated keys, so they are looked
+    for in the text.
+    """
+    keys: Dict[str, List[int]] = {}
+    with open(yaml_path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            match = PROJECT_INFO_KEY_PATTERN.match(line)
+            if match:
+                keys.setdefault(match.group(1).strip(), []).append(number)
+    return keys
+
+
+def normalize_project_name(name: str) -> str:
+    """Subprojects are CamelCase/underscored (rocBLAS, composable_kernel), packages are lower-dashed."""
+    return name.lower().replace('_', '-')
+
+
+def project_package_names(project: str, info: Dict[str, str]) -> List[str]:
+    """Return the (normalized) package names a subproject may be packaged as."""
+    names = [normalize_project_name(project)]
+    debian_package = info.get('debian_package')
+    if isinstance(debian_package, str) and debian_package not in PLACEHOLDER_VALUES:
+        names.append(normalize_project_name(debian_package))
+    feedstock = info.get('conda_forge_feedstock')
+    if isinstance(feedstock, str) and feedstock not in PLACEHOLDER_VALUES:
+        names.append(normalize_project_name(feedstock[:-len('-feedstock')]
+                                            if feedstock.endswith('-feedstock') else feedstock))
+    return names
+
+
+def local_recipe_packages(recipes_dir: Path) -> Dict[str, str]:
+    """
+    Return a (normalized) package name -> recipe directory map of the local
+    recipes, as listed by the recipe_model.py module of the recipes directory.
+    """
+    script = recipes_dir / "recipe_model.py"
+    if not script.exists():
+        print(f"Warning: {script} not found, the local recipes are not checked")
+        return {}
+    spec = importlib.util.spec_from_file_location("recipe_model", script)
+    recipe_model = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(recipe_model)
+        names = recipe_model.recipe_packages(recipes_dir)
+    except Exception as e:
+        print(f"Warning: cannot list the packages of {recipes_dir}: {e}")
+        return {}
+    packages = {}
+    for name, recipe in names.items():
+        packages.setdefault(normalize_project_name(name), recipe)
+    return packages
+
+
+def check_project_info(g: nx.DiGraph, yaml_path: Path, recipes_dir: Path) -> int:
+    """
+    Cross-reference the project info file with the subprojects of the graph and
+    the local recipes, printing the inconsistencies. Returns their number.
+    """
+    start = time.perf_counter()
+    project_info_map = load_project_repo_info(yaml_path)
+    key_lines = scan_project_info_keys(yaml_path) if yaml_path.exists() else {}
+    recipe_packages = local_recipe_packages(recipes_dir)
+    subprojects = sorted(node for node in g if not should_exclude_external_node(node, False))
+
+    unmapped = [node for node in subprojects if node not in project_info_map]
+    # Only a warning: the entry may be a subproject of the AMDGPU families not extracted
+    stale = sorted(name for name in project_info_map if name not in g)
+    duplicated = sorted((name, lines) for name, lines in key_lines.items() if len(lines) > 1)
+    no_repo = sorted(name for name, info in project_info_map.items() if not info.get('github_repo'))
+    built_locally = []
+    mapped_recipes = set()
+    for name, info in sorted(project_info_map.items()):
+        recipes = [recipe_packages[n] for n in project_package_names(name, info) if n in recipe_packages]
+        mapped_recipes.update(recipes)
+        if recipes and info.get('conda_forge_feedstock') == 'MISSING':
+            built_locally.append((name, recipes[0]))
+    unmapped_recipes = sorted(set(recipe_packages.values()) - mapped_recipes)
+
+    issues = [
+        ("Subprojects missing from the project info (drawn in the 'unknown' cluster)", unmapped),
+        ("Duplicated entries (only the last one is used)",
+         [f"{name} (lines {', '.join(map(str, lines))})" for name, lines in duplicated]),
+        ("Entries without github_repo (drawn in the 'unknown' cluster)", no_repo),
+    ]
+    count = sum(len(items) for _, items in issues)
+    for title, items in issues:
+        if items:
+            print(f"{title}:")
+            for item in items:
+                print(f"  {item}")
+    if stale:
+        families = ", ".join(g.graph.get('amdgpu_families') or []) or "the extracted AMDGPU families"
+        print(f"Warning: entries that are not subprojects of TheRock for {families} "
+              f"(stale, or declared for other families only): {', '.join(stale)}")
+    if built_locally:
+        print(f"Entries with conda_forge_feedstock: MISSING built in {recipes_dir.name}/: "
+              f"{', '.join(f'{name} ({recipe})' for name, recipe in built_locally)}")
+    if unmapped_recipes:
+        print(f"Local recipes that are not TheRock subprojects: {', '.join(unmapped_recipes)}")
+
+    elapsed = time.perf_counter() - start
+    summary = f"{count} inconsistencies" if count else "consistent"
+    print(f"Checked {yaml_path} ({len(project_info_map)} entries) against {len(subprojects)} subprojects "
+          f"and {len(set(recipe_packages.values()))} recipes in {elapsed:.3f}s: {summary}")
+    return count
+
+
+# ---------------------------------------------------------------------------
+# 6.  Revision diffs
+# ---------------------------------------------------------------------------
+
+# Node attributes computed by --analyze, that change with any rewiring
+DERIVED_NODE_ATTRS = ('level', 'fan_in', 'fan_out')
+DIFF_COLORS = {'added': '#2E7D32', 'removed': '#C62828', 'changed': '#EF6C00'}
+
+
+def diff_style(status: Optional[str]) -> List[str]:
+    """Return the DOT attributes highlighting a node or edge added, removed or changed by a diff."""
+    if status not in DIFF_COLORS:
+        return []
+    style = [f'color="{DIFF_COLORS[status]}"', f'fontcolor="{DIFF_COLORS[status]}"', 'penwidth=3']
+    if status == 'removed':
+        style.append('style=dashed')
+    return style
+
+
+def attribute_changes(old_attrs: dict, new_attrs: dict) -> Dict[str, Dict[str, object]]:
+    """Return `{attribute: {'old': ..., 'new': ...}}` for the attributes that differ."""
+    return {
+        key: {'old': old_attrs.get(key), 'new': new_attrs.get(key)}
+        for key in sorted(set(old_attrs) | set(new_attrs))
+        if key not in DERIVED_NODE_ATTRS and old_attrs.get(key) != new_attrs.get(key)
+    }
+
+
+def diff_graphs(old: nx.DiGraph, new: nx.DiGraph) -> Dict[str, object]:
+    """
+    Compare two graphs from `build_graph()`.
+
+    Returns the added and removed nodes, the added and removed edges (with their
+    `dep_types`), and the attribute changes of the nodes and edges found in both
+    graphs: prj_info.yaml metadata, `dep_types` and `amdgpu_families`.
+    """
+    def edge_entry(g: nx.DiGraph, u: str, v: str) -> Dict[str, object]:
+        return {'from': u, 'to': v, 'dep_types': g.edges[u, v].get('dep_types', [])}
+
+    changed_nodes = {}
+    for node in sorted(set(old) & set(new)):
+        changes = attribute_changes(old.nodes[node], new.nodes[node])
+        if changes:
+            changed_nodes[node] = changes
+    changed_edges = []
+    for u, v in sorted(set(old.edges) & set(new.edges)):
+        changes = attribute_changes(old.edges[u, v], new.edges[u, v])
+        if changes:
+            changed_edges.append({'from': u, 'to': v, 'changes': changes})
+
+    return {
+        'added_nodes': sorted(set(new) - set(old)),
+        'removed_nodes': sorted(set(old) - set(new)),
+        'changed_nodes': changed_nodes,
+        'added_edges': [edge_entry(new, u, v) for u, v in sorted(set(new.edges) - set(old.edges))],
+        'removed_edges': [edge_entry(old, u, v) for u, v in sorted(set(old.edges) - set(new.edges))],
+        'changed_edges': changed_edges,
+    }
+
+
+def format_attribute(value: object) -> str:
+    if value is None:
+        return "(none)"
+    if isinstance(value, list):
+        return ','.join(str(v) for v in value) or "(empty)"
+    return str(value)
+
+
+def print_graph_diff(diff: Dict[str, object], old_label: str, new_label: str) -> None:
+    """Print a diff from `diff_graphs`, one change per line."""
+    print(f"Graph diff {old_label} -> {new_label}: "
+          f"{len(diff['added_nodes'])} added, {len(diff['removed_nodes'])} removed, "
+          f"{len(diff['changed_nodes'])} changed projects; "
+          f"{len(diff['added_edges'])} added, {len(diff['removed_edges'])} removed, "
+          f"{len(diff['changed_edges'])} changed edges")
+    for node in diff['added_nodes']:
+        print(f"  + {node}")
+    for node in diff['removed_nodes']:
+        print(f"  - {node}")
+    for node, changes in diff['changed_nodes'].items():
+        for attr, change in changes.items():
+            print(f"  ~ {node}: {attr} {format_attribute(change['old'])} -> {format_attribute(change['new'])}")
+    for sign, key in (('+', 'added_edges'), ('-', 'removed_edges')):
+        for edge in diff[key]:
+            print(f"  {sign} {edge['from']} -> {edge['to']} ({format_attribute(edge['dep_types'])})")
+    for edge in diff['changed_edges']:
+        for attr, change in edge['changes'].items():
+            print(f"  ~ {edge['from']} -> {edge['to']}: {attr} "
+                  f"{format_attribute(change['old'])} -> {format_attribute(change['new'])}")
+
+
+def diff_union_graph(old: nx.DiGraph, new: nx.DiGraph, diff: Dict[str, object]) -> nx.DiGraph:
+    """
+    Return the new graph plus the removed nodes and edges of the old one, with a
+    `diff_status` attribute ('added', 'removed' or 'changed') on the elements
+    touched by the diff, for `generate_colored_dot`.
+    """
+    g = new.copy()
+    for node in diff['removed_nodes']:
+        g.add_node(node, **old.nodes[node], diff_status='removed')
+    for edge in diff['removed_edges']:
+        g.add_edge(edge['from'], edge['to'], **old.edges[edge['from'], edge['to']], diff_status='removed')
+    for node in diff['added_nodes']:
+        g.nodes[node]['diff_status'] = 'added'
+    for node, changes in diff['changed_nodes'].items():
+        g.nodes[node].update(diff_status='changed', diff_changes=list(changes))
+    for edge in diff['added_edges']:
+        g.edges[edge['from'], edge['to']]['diff_status'] = 'added'
+    for edge in diff['changed_edges']:
+        g.edges[edge['from'], edge['to']]['diff_status'] = 'changed'
+    return g
+
+
+def resolve_commit(repo_dir: Path, revision: str) -> str:
+    """Return the commit hash of a git revision of the TheRock checkout."""
+    result = subprocess.run(
+        ["git", "-C", str(repo_dir), "rev-parse", "--verify", "--quiet", f"{revision}^{{commit}}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise ValueError(f"'{revision}' is not a TheRock tree, an exported graph or a git revision of {repo_dir}")
+    return result.stdout.strip()
+
+
+def populate_submodules(repo_dir: Path, worktree: Path) -> None:
+    """
+    Check out in a worktree the submodules checked out in the main TheRock tree
+    (e.g. rocm-systems), at the commits recorded by the worktree revision.
+
+    They are cloned from the local submodule repositories (sharing their
+    objects), without touching the configuration of the main checkout.
+    """
+    result = subprocess.run(["git", "-C", str(worktree), "submodule", "status"],
+                            capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        fields = line[1:].split()
+        if len(fields) < 2 or not (repo_dir / fields[1] / ".git").exists():
+            continue
+        commit, path = fields[0], fields[1]
         try:
-            subprocess.run(
-                ["dot", flag, dot_path, "-o", out],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            print(f"✔ wrote {out}")
-        except FileNotFoundError:
-            print("⚠ Graphviz 'dot' not found on PATH – cannot render.", file=sys.stderr)
-            return
+            subprocess.run(["git", "clone", "--quiet", "--shared", "--no-checkout",
+                            str(repo_dir / path), str(worktree / path)],
+                           check=True, capture_output=True, text=True)
+            subprocess.run(["git", "-C", str(worktree / path), "checkout", "--quiet", "--detach", commit],
+                           check=True, capture_output=True, text=True)
         except subprocess.CalledProcessError as e:
-            print(f"⚠ dot failed: {e.stderr.decode()}", file=sys.stderr)
-            return
+            print(f"Warning: cannot check out submodule {path} at {commit[:12]}: {e.stderr.strip()}")
+
+
+@contextlib.contextmanager
+def revision_worktree(repo_dir: Path, commit: str) -> Iterator[Path]:
+    """Check out a commit of the TheRock checkout in a temporary worktree, removed on exit."""
+    worktree = Path(tempfile.mkdtemp(prefix=f"therock-{commit[:12]}-"))
+    subprocess.run(["git", "-C", str(repo_dir), "worktree", "add", "--quiet", "--detach", str(worktree), commit],
+                   check=True, capture_output=True, text=True)
+    try:
+        populate_submodules(repo_dir, worktree)
+        yield worktree
+    finally:
+        subprocess.run(["git", "-C", str(repo_dir), "worktree", "remove", "--force", str(worktree)],
+                       capture_output=True)
+        shutil.rmtree(worktree, ignore_errors=True)
+
+
+def revision_cache_path(cache_dir: Path, commit: str, families: List[str], engine: str) -> Path:
+    """
+    Return the cache entry of the extraction of a commit. A commit never changes,
+    so the entry only depends on it and on the extraction context.
+    """
+    hasher = hashlib.sha256()
+    cmake_version = get_cmake_version() if engine != 'fast' else None
+    hasher.update(f"context={compute_extraction_context(','.join(families), cmake_version)}\n".encode())
+    hasher.update(f"engine={engine}\n".encode())
+    if engine != 'cmake':
+        hasher.update(f"fast={hash_file(Path(fast_engine.__file__))}\n".encode())
+    return cache_dir / "revisions" / f"{commit}-{hasher.hexdigest()[:16]}.json"
+
+
+def extract_revision_pairs(repo_dir: Path, revision: str, families: List[str],
+                           args: argparse.Namespace, build_root: Path
+                           ) -> Union[ProjectDeps, Dict[str, ProjectDeps]]:
+    """
+    Extract the pairs of a git revision of the TheRock checkout in a temporary
+    worktree. The results are cached per commit: a revision already extracted
+    does not need a worktree again.
+    """
+    commit = resolve_commit(repo_dir, revision)
+    cache_path = None
+    if not args.no_cache:
+        cache_path = revision_cache_path(args.cache_dir, commit, families, args.engine)
+        if cache_path.exists():
+            with open(cache_path, 'r') as f:
+                entry = json.load(f)
+            print(f"Revision cache hit for {revision} ({commit[:12]})")
+            pairs = entry['pairs']
+            if isinstance(pairs, dict):
+                return {family: [(name, deps) for name, deps in p] for family, p in pairs.items()}
+            return [(name, deps) for name, deps in pairs]
+
+    print(f"Checking out {revision} ({commit[:12]}) in a temporary worktree")
+    with revision_worktree(repo_dir, commit) as worktree:
+        pairs = extract_pairs(worktree, families, args, build_root)
+
+    complete = all(pairs.values()) if isinstance(pairs, dict) else bool(pairs)
+    if cache_path is not None and complete:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({'revision': revision, 'commit': commit, 'pairs': pairs}, f, indent=1)
+        os.replace(tmp_path, cache_path)
+    return pairs
+
+
+def load_diff_side(spec: str, args: argparse.Namespace, label: str, build_root: Path) -> nx.DiGraph:
+    """
+    Return the graph of one side of --diff: an exported JSON graph, a TheRock
+    tree, or a git revision of the TheRock checkout given as source_dir. It is
+    configured in `build_root`, one directory per AMDGPU family.
+    """
+    path = Path(spec)
+    if path.is_file():
+        g = load_graph(path)
+        print(f"Loaded graph with {g.number_of_nodes()} projects from {path}")
+        return g
+
+    families = parse_amdgpu_families(args.amdgpu_families)
+    if (path / "CMakeLists.txt").is_file():
+        pairs = extract_pairs(path, families, args, build_root)
+    elif args.source_dir is None:
+        raise ValueError(f"'{spec}' is not a TheRock tree or an exported graph, "
+                         "and no TheRock git checkout (source_dir) was given to look it up as a revision")
+    else:
+        pairs = extract_revision_pairs(args.source_dir, spec, families, args, build_root)
+
+    project_info = args.old_project_info if label == 'old' and args.old_project_info else args.project_info
+    g = build_graph(pairs, args.include_external, load_project_repo_info(project_info))
+    if g.number_of_nodes() == 0:
+        print(f"Warning: no projects extracted for {spec}")
+    return g
+
+
+def diff_revisions(args: argparse.Namespace) -> None:
+    """
+    Extract the two sides of --diff concurrently, then print and write their
+    diff. They are configured in `diff-old` and `diff-new` of --build-dir, by
+    default of a temporary directory.
+    """
+    start = time.perf_counter()
+    old_spec, new_spec = args.diff
+    with contextlib.ExitStack() as stack:
+        build_root = args.build_dir
+        if build_root is None:
+            build_root = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="extract_deps_diff-")))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            old_future = executor.submit(load_diff_side, old_spec, args, 'old', build_root / "diff-old")
+            new_future = executor.submit(load_diff_side, new_spec, args, 'new', build_root / "diff-new")
+            old, new = old_future.result(), new_future.result()
+
+    diff = diff_graphs(old, new)
+    print_graph_diff(diff, old_spec, new_spec)
+    if args.diff_output:
+        with open(args.diff_output, 'w') as f:
+            json.dump({'old': old_spec, 'new': new_spec, **diff}, f, indent=1)
+        print(f"✔ wrote {args.diff_output}")
+    if args.diff_dot or args.diff_png:
+        dot_path = args.diff_dot or args.diff_png.with_suffix('.dot')
+        render_with_dot(diff_union_graph(old, new, diff), dot_path, args.diff_png, None, args.force_render)
+    print(f"Diff took {time.perf_counter() - start:.1f}s")
 
 
 # ---------------------------------------------------------------------------
-# 3.  Main
+# 7.  Main
 # ---------------------------------------------------------------------------
 
 def main() -> None:
     ap = argparse.ArgumentParser(
         description="Extract TheRock dependency graph and render with Graphviz dot."
     )
-    ap.add_argument("source_dir", type=Path, help="Path to TheRock source tree")
+    ap.add_argument("source_dir", type=Path, nargs="?", help="Path to TheRock source tree")
+    ap.add_argument("--graph", type=Path,
+                    help="Load a graph exported with --export --format json instead of "
+                         "extracting it from a TheRock source tree")
     ap.add_argument("--dot", type=Path, default=Path("the_rock_deps.dot"), help="DOT output path")
     ap.add_argument("--png", type=Path, default=Path("the_rock_deps.png"), help="PNG output path")
     ap.add_argument("--svg", type=Path, help="SVG output path (optional)")
+    ap.add_argument("--force-render", action="store_true",
+                    help="Run Graphviz even if the graph did not change since the last rendering")
     ap.add_argument("--include-external", action="store_true", 
                     help="Include external dependencies (starting with 'therock-') in the graph")
     ap.add_argument("--project-info", type=Path, default=Path("prj_info.yaml"),
                     help="Path to YAML file containing project repository mappings")
+    ap.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR,
+                    help="Directory of the extraction cache")
+    ap.add_argument("--build-dir", type=Path, default=None,
+                    help="Directory of the CMake configures, one subdirectory per AMDGPU family "
+                         "(default: build_extract_deps next to this script, a temporary directory for --diff)")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Do not use the extraction cache, always run the CMake configure")
+    ap.add_argument("--amdgpu-families", default=DEFAULT_AMDGPU_FAMILIES,
+                    help="Comma separated AMDGPU families to extract the graph for, "
+                         "e.g. gfx1100,gfx942,gfx90a (one CMake configure per family)")
+    ap.add_argument("--export", type=Path,
+                    help="Also write the graph, with typed edges, to this path (optional)")
+    ap.add_argument("--format", choices=EXPORT_FORMATS, default="json",
+                    help="Format of the --export output (default: json)")
+    ap.add_argument("--analyze", action="store_true",
+                    help="Report topological levels, level widths, critical path and "
+                         "transitive fan-in/fan-out of the build dependencies")
+    ap.add_argument("--impacted-by", metavar="NAME[,NAME...]",
+                    help="Print the projects transitively affected by a change in the given "
+                         "projects, in topological order, and exit")
+    ap.add_argument("--impacted-depth", type=int, default=None,
+                    help="Maximum number of dependency edges followed by --impacted-by")
+    ap.add_argument("--check-project-info", action="store_true",
+                    help="Cross-reference the project info file with the subprojects and the "
+                         "local recipes, report the inconsistencies and exit (status 1 if any)")
+    ap.add_argument("--recipes-dir", type=Path, default=DEFAULT_RECIPES_DIR,
+                    help="Directory of the local recipes, for --check-project-info")
+    ap.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"),
+                    help="Diff the dependency graphs of two TheRock revisions: git revisions of the "
+                         "source_dir checkout (extracted in temporary worktrees), trees or exported JSON graphs")
+    ap.add_argument("--diff-output", type=Path, help="Write the --diff as JSON to this path")
+    ap.add_argument("--diff-dot", type=Path, help="Write the --diff graph, changes highlighted, as DOT")
+    ap.add_argument("--diff-png", type=Path, help="Render the --diff graph, changes highlighted, as PNG")
+    ap.add_argument("--old-project-info", type=Path,
+                    help="prj_info.yaml for the OLD side of --diff (default: --project-info)")
+    ap.add_argument("--engine", choices=ENGINES, default="cmake",
+                    help="Extract with a CMake configure, with the CMake-free evaluator (fast), "
+                         "or with CMake checked against the evaluator (both) (default: %(default)s)")
+    ap.add_argument("-j", "--jobs", type=int, default=None,
+                    help="Maximum number of concurrent CMake configures (default: number of CPUs)")
     args = ap.parse_args()
 
-    # Load project repository mappings
-    project_info_map = load_project_repo_info(args.project_info)
+    if args.diff:
+        try:
+            diff_revisions(args)
+        except (ValueError, subprocess.CalledProcessError) as e:
+            print(f"Error: {getattr(e, 'stderr', None) or e}", file=sys.stderr)
+            sys.exit(1)
+        return
 
-    pairs = extract_deps_with_cmake(args.source_dir)
-    
-    # Filter and report on external dependencies
-    total_deps = sum(len(deps) for _, deps in pairs)
-    external_deps = sum(1 for _, deps in pairs for d in deps if d.startswith('therock-'))
-    
-    if external_deps > 0:
-        if args.include_external:
-            print(f"Including {external_deps} external dependencies (therock-*) in the graph")
-        else:
-            print(f"Excluding {external_deps} external dependencies (therock-*) from the graph")
-            print("Use --include-external to include them")
-    
-    g = build_graph(pairs, args.include_external, project_info_map)
+    if args.source_dir is None and args.graph is None:
+        ap.error("either a TheRock source_dir or --graph is required")
+
+    if args.graph is not None:
+        g = load_graph(args.graph)
+        print(f"Loaded graph with {g.number_of_nodes()} projects from {args.graph}")
+    else:
+        g = extract_graph(args)
+
+    if args.check_project_info:
+        sys.exit(1 if check_project_info(g, args.project_info, args.recipes_dir) else 0)
+
+    if args.impacted_by:
+        names = [name.strip() for name in args.impacted_by.split(',') if name.strip()]
+        try:
+            affected = impacted_by(g, names, args.impacted_depth)
+        except KeyError as e:
+            print(f"Error: {e.args[0]}", file=sys.stderr)
+            sys.exit(1)
+        print(f"{len(affected)} projects impacted by {', '.join(names)}:")
+        for name in affected:
+            print(name)
+        return
+
+    if args.analyze:
+        try:
+            analysis = analyze_schedule(g)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        annotate_schedule(g, analysis)
+        print_schedule_report(analysis)
+
+    if args.export:
+        export_graph(g, args.export, args.format)
 
-    render_with_dot(g, args.dot, args.png, args.svg)
+    render_with_dot(g, args.dot, args.png, args.svg, args.force_render)
 
 
 if __name__ == "__main__":
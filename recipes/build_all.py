@@ -0,0 +1,771 @@
+#!/usr/bin/env python3
+"""
+Build the recipes of this directory in dependency order, in parallel.
+
+The inter-recipe DAG is derived from the requirements of each `meta.yaml`
+(built with conda-build) and `recipe.yaml` (built with rattler-build): a recipe
+depends on every other recipe producing one of its build/host/run requirements,
+including its `compiler('hip')`. Recipes whose dependencies are all built are
+dispatched concurrently up to --jobs; the dependents of a failed recipe are
+skipped.
+
+Each recipe has a peak-memory and CPU budget (build_resources.yaml): builds are
+only admitted while their memory fits the available RAM, and the compile jobs
+of each build are capped to the free CPUs through CPU_COUNT, which the builders
+pass on to the build scripts (`cmake --build -j${CPU_COUNT}`). So heavy Tensile
+builds do not run out of memory together while light recipes keep building
+next to them.
+
+A content fingerprint of each recipe (recipe_fingerprint.py) is stored in the
+output channel after a successful build: unchanged recipes are not rebuilt, and
+recipes whose fingerprint changed (or that depend on one that changed) are
+rebuilt even if a package with the same version and build number exists.
+The variant matrix of each recipe is rendered once (variants.py): the builders
+get an explicit variant config without the variants that `build: skip:` would
+discard, and recipes without any variant for the target platform are not run.
+
+The packages of the output channel are indexed incrementally (local_channel.py)
+after every build, so recipes whose packages already exist for all their
+variants are skipped without starting a builder to find out.
+
+The source archives of the recipes are served from the content-addressed store
+shared with bump_version.py (source_store.py): the missing ones are downloaded
+into the store once, and all of them are linked into the source caches of the
+builders before building, so builds with a warm store do not fetch sources.
+
+With --gpu-targets, the HIP recipes compile their device code only for the
+given GPU targets (the `amdgpu_targets` variant, gpu_targets.py), and the code
+objects of the built packages are checked to be exactly for these targets. The
+variant is neither in the build string nor pinned in the requirements, so the
+solver could pick a dependency built for other targets from the channel: a
+channel with packages built for other targets is refused, and each target list
+is built into its own channel.
+
+With --compiler-cache, ccache is injected as the C, C++ and HIP compiler launcher
+(CMAKE_<LANG>_COMPILER_LAUNCHER, passed through by the recipes) with a cache
+directory shared by all the recipes and kept across runs.
+
+Every build runs through build_telemetry.py, which records its phase timings,
+peak memory and CPU utilization in the build history.
+
+The builders are invoked with $CONDA_BUILD_ARGS/$RATTLER_BUILD_ARGS as set by
+pixi (so `--skip-existing` keeps already built packages), and the executables
+can be replaced (--conda-build/--rattler-build) by stub commands.
+"""
+
+import argparse
+import concurrent.futures
+import math
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import yaml
+
+from build_telemetry import compiler_cache_stats
+from bump_version import DEFAULT_JOBS, default_cache_dir, download_and_hash
+from gpu_targets import (DEFAULT_VALUE as DEFAULT_GPU_TARGETS, VARIANT_KEY, built_packages, channel_values,
+                         check_packages, parse_targets, value_label, write_targets_config)
+from local_channel import current_records, has_builds, load_records, update_index
+from recipe_fingerprint import load_fingerprints, recipe_fingerprint, save_fingerprints
+from recipe_model import parse_recipe, recipe_files
+from source_store import DEFAULT_MAX_GB, SHA256_PATTERN, STORE_DIR_NAME, SourceStore, size_bytes
+from variants import DEFAULT_OUTPUT_DIR as VARIANTS_DIR
+from variants import render_variants
+
+try:
+    from conda_build.config import Config as CondaBuildConfig
+except ImportError:  # only needed to locate the source cache of conda-build
+    CondaBuildConfig = None
+
+RECIPES_DIR = Path(__file__).resolve().parent
+REPO_DIR = RECIPES_DIR.parent
+DEFAULT_CONDA_BUILD_ARGS = ("-c conda-forge -c local --skip-existing "
+                            "-m ./conda_forge_pinnings/conda_build_config.yaml "
+                            "-m ./recipes/conda_build_config.yaml --output-folder ./output")
+DEFAULT_RATTLER_BUILD_ARGS = ("-c conda-forge --skip-existing=all "
+                              "-m ./conda_forge_pinnings/conda_build_config.yaml "
+                              "-m ./recipes/conda_build_config.yaml")
+COMPILER_KEY_PATTERN = re.compile(r'^(\w+)_compiler:\s*$')
+CONFIG_ITEM_PATTERN = re.compile(r'^\s+-\s+["\']?([\w.-]+)["\']?\s*$')
+LOG_TAIL_LINES = 30
+RESOURCES_FILE = "build_resources.yaml"
+FINGERPRINTS_FILE = "recipe_fingerprints.json"
+# Packages whose code objects are not for their GPU targets
+REJECTED_DIR = "rejected"
+CACHED_LANGUAGES = ("C", "CXX", "HIP")
+
+
+@dataclass
+class BuildNode:
+    name: str                   # recipe directory name
+    recipe_dir: Path
+    builder: str                # 'conda-build' | 'rattler-build'
+    packages: List[str] = field(default_factory=list)
+    version: Optional[str] = None
+    build_number: Optional[int] = None
+    requirements: List[str] = field(default_factory=list)
+    deps: Set[str] = field(default_factory=set)
+    memory_gb: float = 4.0      # peak memory when building with `cpus` jobs
+    cpus: int = 4
+    fingerprint: str = ""
+    # Rebuild even if a package with the same name/version/build string exists
+    force: bool = False
+    # Explicit variant config with the variants that are not skipped
+    variant_config: Optional[Path] = None
+
+    def memory_for(self, cpus: int) -> float:
+        """Return the expected peak memory when building with `cpus` jobs."""
+        return self.memory_gb * cpus / self.cpus
+
+
+def read_compilers(config_path: Path, subdir: str) -> Dict[str, str]:
+    """
+    Return the language -> compiler package map (e.g. 'hip' -> 'hip-clang_linux-64')
+    from the first value of each `<lang>_compiler` key of a conda_build_config.yaml.
+    """
+    compilers: Dict[str, str] = {}
+    if not config_path.exists():
+        return compilers
+    language = None
+    with config_path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            key = COMPILER_KEY_PATTERN.match(line)
+            if key:
+                language = key.group(1)
+                continue
+            item = CONFIG_ITEM_PATTERN.match(line)
+            if item and language and language not in compilers:
+                compilers[language] = f"{item.group(1)}_{subdir}"
+            elif not item:
+                language = None
+    return compilers
+
+
+def load_resources(path: Path) -> Tuple[Dict[str, object], Dict[str, Dict[str, object]]]:
+    """Return the default and the per-recipe {memory_gb, cpus} budgets of build_resources.yaml."""
+    if not path.exists():
+        return {}, {}
+    with path.open("r", encoding="utf-8") as handle:
+        data = yaml.safe_load(handle) or {}
+    return data.get("default") or {}, data.get("recipes") or {}
+
+
+def available_memory_gb() -> float:
+    """Return the memory available for new processes (MemAvailable on Linux, total RAM otherwise)."""
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as handle:
+            for line in handle:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024 ** 2
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    except (AttributeError, ValueError, OSError):
+        return float("inf")
+
+
+def load_nodes(recipes_dir: Path, compilers: Dict[str, str]) -> Dict[str, BuildNode]:
+    """Parse every recipe of `recipes_dir` and link each one to the recipes it requires."""
+    default, resources = load_resources(recipes_dir / RESOURCES_FILE)
+    nodes: Dict[str, BuildNode] = {}
+    for recipe_dir in sorted(p for p in recipes_dir.iterdir() if p.is_dir()):
+        files = recipe_files(recipe_dir)
+        if not files:
+            continue
+        recipe = parse_recipe(files[0])
+        nodes[recipe_dir.name] = BuildNode(
+            name=recipe_dir.name,
+            recipe_dir=recipe_dir,
+            builder="conda-build" if recipe.is_meta else "rattler-build",
+            packages=recipe.package_names() or [recipe_dir.name],
+            version=recipe.package_version(),
+            build_number=recipe.build_number(),
+            requirements=recipe.requirement_names(compilers),
+        )
+        budget = {**default, **resources.get(recipe_dir.name, {})}
+        nodes[recipe_dir.name].memory_gb = float(budget.get("memory_gb", BuildNode.memory_gb))
+        nodes[recipe_dir.name].cpus = max(1, int(budget.get("cpus", BuildNode.cpus)))
+
+    producers: Dict[str, str] = {}
+    for node in nodes.values():
+        for package in node.packages:
+            producers.setdefault(package, node.name)
+    for node in nodes.values():
+        node.deps = {producers[r] for r in node.requirements if r in producers} - {node.name}
+    return nodes
+
+
+def select_nodes(nodes: Dict[str, BuildNode], targets: List[str], with_deps: bool) -> Set[str]:
+    """Return the recipes to build for `targets` (all recipes if empty)."""
+    unknown = [t for t in targets if t not in nodes]
+    if unknown:
+        raise SystemExit(f"Error: unknown recipe(s): {', '.join(unknown)}")
+    if not targets:
+        return set(nodes)
+    selected: Set[str] = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name in selected:
+            continue
+        selected.add(name)
+        if with_deps:
+            pending.extend(nodes[name].deps)
+    return selected
+
+
+def topological_levels(nodes: Dict[str, BuildNode], selected: Set[str]) -> List[List[str]]:
+    """Group the selected recipes by topological level, raising on dependency cycles."""
+    remaining = {name: nodes[name].deps & selected for name in selected}
+    levels = []
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            raise SystemExit(f"Error: dependency cycle between recipes: {', '.join(sorted(remaining))}")
+        levels.append(ready)
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return levels
+
+
+def variant_config_files(builder_args: Dict[str, List[str]]) -> List[Path]:
+    """Return the variant config files (`-m`) passed to the builders, in order."""
+    files: List[Path] = []
+    for args in builder_args.values():
+        for option, value in zip(args, args[1:]):
+            path = REPO_DIR / value
+            if option in ("-m", "--variant-config") and path not in files:
+                files.append(path)
+    return files
+
+
+def compute_fingerprints(nodes: Dict[str, BuildNode], builder_args: Dict[str, List[str]]) -> None:
+    """Set the fingerprint of every recipe, upstream recipes first."""
+    config_files = variant_config_files(builder_args)
+    for level in topological_levels(nodes, set(nodes)):
+        for name in level:
+            node = nodes[name]
+            upstream = {dep: nodes[dep].fingerprint for dep in node.deps}
+            node.fingerprint = recipe_fingerprint(node.recipe_dir, config_files, upstream, extra=node.builder)
+
+
+def recipe_status(nodes: Dict[str, BuildNode], selected: Set[str], fingerprints: Dict[str, str],
+                  rebuild: bool = False, built: Optional[Set[str]] = None) -> Dict[str, str]:
+    """
+    Return the status of each selected recipe against the stored fingerprints,
+    marking the recipes to rebuild over their existing packages as forced.
+
+    `built` are the recipes whose packages are in the local channel, if known:
+    an unchanged recipe without its packages (e.g. after the channel was
+    emptied, but not the fingerprints) is rebuilt.
+    """
+    status = {}
+    for name in selected:
+        if rebuild:
+            status[name] = "rebuild"
+        elif name not in fingerprints:
+            status[name] = "new"
+        elif fingerprints[name] == nodes[name].fingerprint:
+            status[name] = "up to date" if built is None or name in built else "rebuild"
+        else:
+            status[name] = "changed"
+        nodes[name].force = status[name] in ("rebuild", "changed")
+    return status
+
+
+def packages_exist(node: BuildNode, records: List[Dict[str, object]], variants: List[Dict[str, str]]) -> bool:
+    """Whether the local channel has the packages of all the outputs of a recipe, for each of its `variants`."""
+    if node.version is None or node.build_number is None:
+        return False
+    return all(has_builds(records, name, node.version, node.build_number, variants) for name in node.packages)
+
+
+def build_command(node: BuildNode, executables: Dict[str, str], builder_args: Dict[str, List[str]]) -> List[str]:
+    recipe_path = f"./{node.recipe_dir.relative_to(REPO_DIR).as_posix()}"
+    args = builder_args[node.builder]
+    if node.force:
+        args = [arg for arg in args if arg != "--skip-existing" and not arg.startswith("--skip-existing=")]
+    if node.variant_config is not None:
+        args = args + ["-m", os.path.relpath(node.variant_config, REPO_DIR)]
+    if node.builder == "conda-build":
+        return [executables["conda-build"], recipe_path] + args
+    return [executables["rattler-build"], "build"] + args + ["--recipe-dir", recipe_path]
+
+
+def admitted_cpus(node: BuildNode, free_memory_gb: float, free_cpus: int, idle: bool) -> Optional[int]:
+    """
+    Return the number of compile jobs a build can be started with now, or None if
+    it has to wait. A build is admitted with at least half of its declared CPUs
+    (and the memory this needs); when nothing else runs it is always admitted.
+    """
+    by_memory = math.floor(free_memory_gb * node.cpus / node.memory_gb) if node.memory_gb > 0 else node.cpus
+    cpus = min(node.cpus, free_cpus, by_memory)
+    if cpus >= max(1, node.cpus // 2):
+        return cpus
+    if idle:
+        return max(1, min(node.cpus, free_cpus))
+    return None
+
+
+def compiler_cache_env(ccache: str, cache_dir: Path, log_dir: Path, name: str) -> Dict[str, str]:
+    """
+    Write the ccache config of the build of `name` and return the environment that
+    makes CMake use ccache as compiler launcher.
+
+    The build directories and host prefixes of conda-build and rattler-build have a
+    new timestamp in their path on every build, so paths are hashed relative to `/`
+    (base_dir) and the compilers by content rather than by mtime. Each build has its
+    own stats log, so that the hit rate of concurrent builds is not mixed.
+    """
+    log_dir.mkdir(parents=True, exist_ok=True)
+    config_path = log_dir / f"{name}.ccache.conf"
+    stats_log = log_dir / f"{name}.ccache-stats.log"
+    if stats_log.exists():
+        stats_log.unlink()
+    with config_path.open("w", encoding="utf-8") as handle:
+        handle.write(f"cache_dir = {cache_dir.resolve()}\n")
+        handle.write("base_dir = /\n")
+        handle.write("hash_dir = false\n")
+        handle.write("compiler_check = content\n")
+        handle.write(f"stats_log = {stats_log.resolve()}\n")
+    env = {f"CMAKE_{language}_COMPILER_LAUNCHER": ccache for language in CACHED_LANGUAGES}
+    env["CCACHE_CONFIGPATH"] = str(config_path.resolve())
+    return env
+
+
+def build_env(cpus: int, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Return the environment of a build limited to `cpus` compile jobs."""
+    env = dict(os.environ)
+    # conda-build and rattler-build pass CPU_COUNT on to the build scripts
+    env["CPU_COUNT"] = str(cpus)
+    env.update(extra or {})
+    return env
+
+
+def run_build(node: BuildNode, command: List[str], log_dir: Path, cpus: int,
+              history: Optional[Path], extra_env: Optional[Dict[str, str]] = None) -> Tuple[bool, float, Path]:
+    """
+    Run the build of a recipe, writing its output to a log file and, if `history`
+    is given, its telemetry to the build history. Returns (success, seconds, log).
+    """
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_path = log_dir / f"{node.name}.log"
+    start = time.perf_counter()
+    with log_path.open("w", encoding="utf-8") as log:
+        log.write(f"$ {shlex.join(command)}\n")
+        log.flush()
+        if history is not None:
+            command = [sys.executable, str(RECIPES_DIR / "build_telemetry.py"), "--history", str(history),
+                       "run", "--recipe", node.name, "--"] + command
+        try:
+            returncode = subprocess.run(command, cwd=REPO_DIR, env=build_env(cpus, extra_env),
+                                        stdout=log, stderr=subprocess.STDOUT).returncode
+        except OSError as e:
+            log.write(f"{e}\n")
+            returncode = -1
+    return returncode == 0, time.perf_counter() - start, log_path
+
+
+def option_value(args: List[str], option: str) -> Optional[str]:
+    """Return the value of `option` (`--option value` or `--option=value`) in `args`."""
+    value = None
+    for i, arg in enumerate(args):
+        if arg == option and i + 1 < len(args):
+            value = args[i + 1]
+        elif arg.startswith(option + "="):
+            value = arg[len(option) + 1:]
+    return value
+
+
+def builder_source_caches(builder_args: Dict[str, List[str]]) -> Dict[str, Path]:
+    """Return the source cache directory of each builder that can be located."""
+    caches = {}
+    croot = option_value(builder_args["conda-build"], "--croot")
+    if croot is not None:
+        caches["conda-build"] = REPO_DIR / croot / "src_cache"
+    elif CondaBuildConfig is not None:
+        caches["conda-build"] = Path(CondaBuildConfig().src_cache)
+    output_dir = option_value(builder_args["rattler-build"], "--output-dir") or "output"
+    caches["rattler-build"] = REPO_DIR / output_dir / "src_cache"
+    return caches
+
+
+def recipe_sources(recipe_dir: Path) -> List[Tuple[str, str, str]]:
+    """Return the (builder, url, sha256) of the archive sources of a recipe."""
+    sources = []
+    for path in recipe_files(recipe_dir):
+        recipe = parse_recipe(path)
+        builder = "conda-build" if recipe.is_meta else "rattler-build"
+        for source in recipe.sources:
+            if source.kind != "url" or not source.sha256:
+                continue
+            url = recipe.render(source.url)
+            sha256 = recipe.render(source.sha256)
+            if url is None or sha256 is None or not SHA256_PATTERN.match(sha256.lower()):
+                print(f"Warning: cannot render the source {source.url} of {recipe_dir.name}")
+                continue
+            sources.append((builder, url, sha256.lower()))
+    return sources
+
+
+def serve_sources(nodes: Dict[str, BuildNode], selected: Set[str], store: SourceStore,
+                  caches: Dict[str, Path], jobs: int = DEFAULT_JOBS) -> List[str]:
+    """
+    Download the sources of the selected recipes missing from `store` (up to
+    `jobs` concurrently) and link them into the builder source `caches`.
+
+    Returns the urls that are not in the store, which the builders download.
+    """
+    sources = [source for name in sorted(selected) for source in recipe_sources(nodes[name].recipe_dir)]
+    missing = {}
+    for _, url, sha256 in sources:
+        if store.get(sha256) is None:
+            missing.setdefault(sha256, url)
+    if missing:
+        print(f"→ Fetching {len(missing)} source archives into {store.root}")
+        # The partial downloads are resumed by bump_version.py too
+        partial_dir = store.root.parent / "partial"
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = {executor.submit(download_and_hash, url, partial_dir, None, store): (sha256, url)
+                       for sha256, url in missing.items()}
+            for future in concurrent.futures.as_completed(futures):
+                sha256, url = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as exc:
+                    print(f"✗ Failed to fetch {url}: {exc}")
+                    continue
+                if entry["sha256"] != sha256:
+                    print(f"✗ {url} has sha256 {entry['sha256']}, the recipe expects {sha256}")
+    if any(builder not in caches for builder, _, _ in sources):
+        print("Warning: cannot locate the source cache of conda-build, its recipes download their sources")
+    served = 0
+    unavailable = []
+    for builder, url, sha256 in sources:
+        if store.get(sha256) is None:
+            unavailable.append(url)
+        elif builder in caches and store.seed(sha256, url, builder, caches[builder]) is not None:
+            served += 1
+    print(f"= Served {served}/{len(sources)} source archives from {store.root}")
+    return unavailable
+
+
+def log_tail(path: Path, lines: int = LOG_TAIL_LINES) -> str:
+    with path.open("r", encoding="utf-8", errors="replace") as handle:
+        return "".join(handle.readlines()[-lines:])
+
+
+def schedule(nodes: Dict[str, BuildNode], selected: Set[str], jobs: int,
+             executables: Dict[str, str], builder_args: Dict[str, List[str]],
+             log_dir: Path, memory_gb: float, cpus: int,
+             on_built: Optional[Callable[[str], None]] = None,
+             history: Optional[Path] = None,
+             compiler_cache: Optional[Tuple[str, Path]] = None,
+             verify: Optional[Callable[[str, float], List[str]]] = None) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Build the selected recipes, starting each one as soon as its dependencies are
+    built and its memory fits in the `memory_gb`/`cpus` left by the running builds.
+    `on_built` is called with the name of each successfully built recipe, and
+    `compiler_cache` is the (ccache executable, cache directory) to build with.
+    `verify` is called with the name and start time of each successful build and
+    returns the problems of its packages, that make the build fail.
+
+    Returns the (built, failed, skipped) recipe names.
+    """
+    waiting = {name: nodes[name].deps & selected for name in selected}
+    built: List[str] = []
+    failed: List[str] = []
+    skipped: List[str] = []
+    total = len(selected)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        running: Dict[concurrent.futures.Future, Tuple[str, int, float]] = {}
+        started: Dict[str, float] = {}
+
+        def dispatch() -> None:
+            # Heaviest ready recipes first, so that they are not starved by the light ones
+            ready = sorted((n for n, deps in waiting.items() if not deps),
+                           key=lambda n: (-nodes[n].memory_gb, n))
+            for name in ready:
+                if len(running) >= max(1, jobs):
+                    break
+                used_memory = sum(memory for _, _, memory in running.values())
+                used_cpus = sum(job_cpus for _, job_cpus, _ in running.values())
+                job_cpus = admitted_cpus(nodes[name], memory_gb - used_memory, cpus - used_cpus, not running)
+                if job_cpus is None:
+                    continue
+                del waiting[name]
+                job_memory = nodes[name].memory_for(job_cpus)
+                command = build_command(nodes[name], executables, builder_args)
+                print(f"→ Building {name} ({nodes[name].builder}, {job_cpus} jobs, ~{job_memory:.0f} GB)")
+                extra_env = None
+                if compiler_cache is not None:
+                    extra_env = compiler_cache_env(compiler_cache[0], compiler_cache[1], log_dir, name)
+                started[name] = time.time()
+                future = executor.submit(run_build, nodes[name], command, log_dir, job_cpus, history, extra_env)
+                running[future] = (name, job_cpus, job_memory)
+
+        dispatch()
+        while running:
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)[0]
+                success, elapsed, log_path = future.result()
+                finished = len(built) + len(failed) + len(skipped) + 1
+                problems = verify(name, started[name]) if success and verify is not None else []
+                if success and not problems:
+                    cache_stats = None
+                    if compiler_cache is not None:
+                        cache_stats = compiler_cache_stats(str(log_dir / f"{name}.ccache.conf"))
+                    if cache_stats and cache_stats["hits"] + cache_stats["misses"]:
+                        compiles = cache_stats["hits"] + cache_stats["misses"]
+                        print(f"✓ [{finished}/{total}] Built {name} in {elapsed:.1f}s "
+                              f"(compiler cache: {cache_stats['hits']}/{compiles} hits, "
+                              f"{cache_stats['hits'] / compiles:.0%})")
+                    else:
+                        print(f"✓ [{finished}/{total}] Built {name} in {elapsed:.1f}s")
+                    built.append(name)
+                    if on_built is not None:
+                        on_built(name)
+                    for deps in waiting.values():
+                        deps.discard(name)
+                    continue
+                if problems:
+                    print(f"✗ [{finished}/{total}] Built {name} in {elapsed:.1f}s, "
+                          f"but its code objects are not for the requested GPU targets")
+                else:
+                    print(f"✗ [{finished}/{total}] Failed to build {name} in {elapsed:.1f}s (log: {log_path})")
+                    print(log_tail(log_path))
+                failed.append(name)
+                # Skip everything that (transitively) needs the failed recipe
+                blocked = [name]
+                while blocked:
+                    current = blocked.pop()
+                    for dependent in sorted(n for n, deps in waiting.items() if current in deps):
+                        del waiting[dependent]
+                        skipped.append(dependent)
+                        blocked.append(dependent)
+                        print(f"- Skipping {dependent}: depends on failed {current}")
+            dispatch()
+    return built, failed, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the recipes in dependency order, in parallel")
+    parser.add_argument("recipes", nargs="*",
+                        help="Recipes (directory names) to build, with their dependencies (default: all)")
+    parser.add_argument("-j", "--jobs", type=int, default=2,
+                        help="Maximum number of concurrent builds (default: %(default)s)")
+    parser.add_argument("--memory-gb", type=float,
+                        help="Memory available to the builds in GB (default: the available RAM)")
+    parser.add_argument("--cpus", type=int,
+                        help="CPUs available to the builds (default: all the CPUs)")
+    parser.add_argument("--no-deps", action="store_true",
+                        help="Only build the given recipes, not the recipes they depend on")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the build levels and commands without building (nor writing into output/)")
+    parser.add_argument("--subdir", default="linux-64",
+                        help="Target subdir, used to name the compiler packages (default: %(default)s)")
+    parser.add_argument("--conda-build", default="conda-build",
+                        help="conda-build executable (default: %(default)s)")
+    parser.add_argument("--rattler-build", default="rattler-build",
+                        help="rattler-build executable (default: %(default)s)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild the selected recipes even if their fingerprint did not change")
+    parser.add_argument("--channel", type=Path, default=REPO_DIR / "output",
+                        help="Local output channel of the builders (default: %(default)s)")
+    parser.add_argument("--fingerprints", type=Path, default=REPO_DIR / "output" / FINGERPRINTS_FILE,
+                        help="Fingerprints of the built recipes (default: %(default)s)")
+    parser.add_argument("--no-prune-variants", action="store_true",
+                        help="Let the builders expand the full variant matrix of each recipe")
+    parser.add_argument("--gpu-targets", type=parse_targets, action="append",
+                        help="GPU targets of the device code of the HIP recipes, as a comma-separated list "
+                             "(e.g. gfx1100). The channel must not have packages built for other targets, "
+                             "build each target list into its own channel "
+                             "(default: the amdgpu_targets of recipes/conda_build_config.yaml)")
+    parser.add_argument("--compiler-cache", action="store_true",
+                        help="Use ccache as launcher of the C, C++ and HIP compilers")
+    parser.add_argument("--compiler-cache-dir", type=Path, default=default_cache_dir() / "ccache",
+                        help="Directory of the compiler cache, shared by all the recipes (default: %(default)s)")
+    parser.add_argument("--no-source-store", action="store_true",
+                        help="Let the builders download the sources instead of serving them from the source store")
+    parser.add_argument("--source-store-dir", type=Path, default=default_cache_dir() / STORE_DIR_NAME,
+                        help="Directory of the source store, shared with bump_version.py (default: %(default)s)")
+    parser.add_argument("--source-store-max-gb", type=float, default=DEFAULT_MAX_GB,
+                        help="Size of the source store above which the least recently used archives "
+                             "are removed, in GB (default: %(default)s)")
+    parser.add_argument("--fetch-sources", action="store_true",
+                        help="Only fetch the sources of the selected recipes into the source store, "
+                             "e.g. before building offline")
+    parser.add_argument("--history", type=Path, default=REPO_DIR / "output" / "build_history.jsonl",
+                        help="Build telemetry history, see build_telemetry.py (default: %(default)s)")
+    parser.add_argument("--no-telemetry", action="store_true",
+                        help="Do not record the telemetry of the builds")
+    parser.add_argument("--log-dir", type=Path, default=REPO_DIR / "output" / "build-logs",
+                        help="Directory of the per-recipe build logs (default: %(default)s)")
+    args = parser.parse_args()
+
+    compilers = read_compilers(RECIPES_DIR / "conda_build_config.yaml", args.subdir)
+    nodes = load_nodes(RECIPES_DIR, compilers)
+    selected = select_nodes(nodes, args.recipes, with_deps=not args.no_deps)
+    levels = topological_levels(nodes, selected)
+
+    executables = {"conda-build": args.conda_build, "rattler-build": args.rattler_build}
+    builder_args = {
+        "conda-build": shlex.split(os.environ.get("CONDA_BUILD_ARGS", DEFAULT_CONDA_BUILD_ARGS)),
+        "rattler-build": shlex.split(os.environ.get("RATTLER_BUILD_ARGS", DEFAULT_RATTLER_BUILD_ARGS)),
+    }
+
+    # The packages do not record their targets in the build string nor pin them, so the
+    # solver cannot tell apart the builds of several target lists in the same channel
+    target_lists = list(dict.fromkeys(args.gpu_targets or []))
+    if len(target_lists) > 1:
+        print("Error: --gpu-targets can only be given once, build each target list into its own channel "
+              "(--channel and the output directory of the builders)", file=sys.stderr)
+        sys.exit(1)
+    gpu_targets = target_lists[0] if target_lists else None
+
+    # A dry run writes the variant configs into a temporary directory and does not update the index
+    dry_run_dir = tempfile.TemporaryDirectory(prefix="build_all-") if args.dry_run else None
+    variants_dir = Path(dry_run_dir.name) if dry_run_dir else VARIANTS_DIR
+    if gpu_targets:
+        # Last config file, so that it overrides conda_build_config.yaml
+        targets_config = variants_dir / f"{VARIANT_KEY}.yaml"
+        write_targets_config(targets_config, [gpu_targets])
+        for name in builder_args:
+            builder_args[name] += ["-m", os.path.relpath(targets_config, REPO_DIR)]
+
+    source_store = None
+    if not args.no_source_store:
+        source_store = SourceStore(args.source_store_dir, size_bytes(args.source_store_max_gb))
+    if args.fetch_sources:
+        if source_store is None:
+            raise SystemExit("Error: --fetch-sources needs the source store")
+        unavailable = serve_sources(nodes, selected, source_store, builder_source_caches(builder_args))
+        sys.exit(1 if unavailable else 0)
+
+    # Unchanged recipes are up to date if their packages are still in the channel (not checked
+    # with --no-prune-variants), changed ones are rebuilt over the existing packages.
+    # Recipes without a stored fingerprint keep --skip-existing, to reuse packages built before.
+    compute_fingerprints(nodes, builder_args)
+    fingerprints = load_fingerprints(args.fingerprints)
+    built = None
+    if not args.no_prune_variants:
+        matrices = render_variants({name: nodes[name].recipe_dir for name in selected},
+                                   variant_config_files(builder_args), args.subdir, variants_dir)
+        if args.dry_run:
+            records = current_records(args.channel)
+        else:
+            update_index(args.channel)
+            records = load_records(args.channel)
+        other_targets = channel_values(records) - {gpu_targets or DEFAULT_GPU_TARGETS}
+        if other_targets:
+            print(f"Error: {args.channel} has packages built for {VARIANT_KEY}="
+                  f"{', '.join(value_label(value) for value in sorted(other_targets))}, "
+                  f"build for other GPU targets into another channel", file=sys.stderr)
+            sys.exit(1)
+        built = {name for name, (matrix, _) in matrices.items()
+                 if matrix.variants and packages_exist(nodes[name], records, matrix.variants)}
+    status = recipe_status(nodes, selected, fingerprints, args.rebuild, built)
+    up_to_date = {name for name in selected if status[name] == "up to date"}
+
+    if not args.no_prune_variants:
+        for name, (matrix, config_path) in matrices.items():
+            nodes[name].variant_config = config_path
+            if name in up_to_date:
+                continue
+            if not matrix.variants:
+                status[name] = f"no variant for {args.subdir}"
+                up_to_date.add(name)
+            elif status[name] == "new" and name in built:
+                # Packages built with the same variant values, as --skip-existing finds by build string
+                status[name] = f"already in {args.channel.name}/"
+                up_to_date.add(name)
+                fingerprints[name] = nodes[name].fingerprint
+
+    if args.dry_run:
+        for i, level in enumerate(levels):
+            print(f"Level {i}:")
+            for name in level:
+                deps = ", ".join(sorted(nodes[name].deps & selected)) or "-"
+                print(f"  {name} [{status[name]}] (needs: {deps}; "
+                      f"{nodes[name].cpus} jobs, {nodes[name].memory_gb:g} GB)")
+                if name not in up_to_date:
+                    print(f"    $ {shlex.join(build_command(nodes[name], executables, builder_args))}")
+        dry_run_dir.cleanup()
+        sys.exit(0)
+
+    for name in sorted(up_to_date):
+        print(f"= Skipping {name}: {status[name]}")
+    selected -= up_to_date
+    levels = topological_levels(nodes, selected)
+
+    save_fingerprints(args.fingerprints, fingerprints)
+
+    def record_fingerprint(name: str) -> None:
+        fingerprints[name] = nodes[name].fingerprint
+        save_fingerprints(args.fingerprints, fingerprints)
+        # Only the packages of this build are read
+        update_index(args.channel)
+
+    def verify_gpu_targets(name: str, started: float) -> List[str]:
+        packages = built_packages(args.channel, args.subdir, nodes[name].packages, since=started)
+        problems = check_packages(packages, gpu_targets)
+        # Moved out of the channel, so that they are not taken as existing builds of their variant
+        for package in problems:
+            rejected = args.channel / REJECTED_DIR / package.name
+            rejected.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(package, rejected)
+            print(f"Moved {package.name} to {rejected.parent}")
+        return list(problems.values())
+
+    compiler_cache = None
+    if args.compiler_cache:
+        ccache = shutil.which("ccache")
+        if ccache is None:
+            print("Error: 'ccache' command not found, install it (e.g. pixi global install ccache) or build without --compiler-cache")
+            sys.exit(1)
+        args.compiler_cache_dir.mkdir(parents=True, exist_ok=True)
+        compiler_cache = (ccache, args.compiler_cache_dir)
+
+    if source_store is not None and selected:
+        serve_sources(nodes, selected, source_store, builder_source_caches(builder_args))
+
+    memory_gb = args.memory_gb if args.memory_gb is not None else available_memory_gb()
+    cpus = args.cpus or os.cpu_count() or 1
+    print(f"Building {len(selected)} recipes in {len(levels)} levels with up to {args.jobs} builds, "
+          f"{cpus} CPUs and {memory_gb:.1f} GB")
+    # Groups the telemetry records of this run in the build history
+    os.environ.setdefault("BUILD_RUN_ID", time.strftime("%Y%m%dT%H%M%S"))
+    start = time.perf_counter()
+    built, failed, skipped = schedule(nodes, selected, args.jobs, executables, builder_args, args.log_dir,
+                                      memory_gb, cpus, on_built=record_fingerprint,
+                                      history=None if args.no_telemetry else args.history,
+                                      compiler_cache=compiler_cache,
+                                      verify=verify_gpu_targets if gpu_targets else None)
+    wall_time = time.perf_counter() - start
+
+    print("\n" + "="*60)
+    print(f"Build complete in {wall_time:.1f}s: {len(built)} built, {len(failed)} failed, "
+          f"{len(skipped)} skipped, {len(up_to_date)} up to date")
+    if failed:
+        print(f"Failed: {', '.join(sorted(failed))}")
+        if skipped:
+            print(f"Skipped: {', '.join(sorted(skipped))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
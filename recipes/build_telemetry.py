@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Record and report the timing of the conda-build/rattler-build invocations.
+
+`run` wraps a builder invocation: its output is passed through unchanged, while
+every line is matched against the phase markers of the builders (source
+download, patching, environment solving, CMake configure, compilation, Tensile
+kernel generation, packaging, tests) to time each phase. The peak memory of the
+whole process tree is sampled from /proc, and the CPU time of the builder comes
+from the process accounting of the wrapper. When the build uses the compiler
+cache (CCACHE_CONFIGPATH), its hits and misses are read from the ccache stats
+log. One record per invocation is appended to a JSON-lines history file.
+
+`report` reads the history and prints the slowest recipes of the last runs with
+their phase breakdown, and the recipes whose build got slower than in the
+previous run.
+
+    python recipes/build_telemetry.py run -- rattler-build build --recipe-dir ./recipes/rocfft
+    python recipes/build_telemetry.py report
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows, where the CPU time and peak memory of the builds are not recorded
+    resource = None
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_HISTORY = REPO_DIR / "output" / "build_history.jsonl"
+SAMPLE_INTERVAL = 1.0
+
+# Markers of the build phases in the conda-build and rattler-build (and CMake,
+# make, ninja, Tensile) output. A phase lasts until a line of another phase.
+PHASE_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("source", re.compile(r'Source cache directory|Downloading source|Fetching source|Downloading https?://'
+                          r'|Extracting|Checking out|git clone', re.IGNORECASE)),
+    ("patch", re.compile(r'Applying patch|patching file')),
+    ("environment", re.compile(r'Solving environment|Resolving (build|host|test|run) environment'
+                               r'|Installing (build|host|test) environment|## Package Plan')),
+    ("configure", re.compile(r'^-- (The (C|CXX|HIP) compiler identification|Configuring|Detecting|Looking for'
+                             r'|Performing Test|Found )|^checking ')),
+    ("tensile", re.compile(r'Tensile|TensileCreateLibrary|Generating kernels|kernel generation', re.IGNORECASE)),
+    ("compile", re.compile(r'^\[\s*\d+/\d+\]|^\[\s*\d+%\]|Building (C|CXX|HIP) object|Linking (C|CXX|HIP)')),
+    ("package", re.compile(r'^Packaging|Packaging new files|Compressing|Writing package|Creating package'
+                           r'|INFO:conda_build.build:Packaging')),
+    ("test", re.compile(r'TEST START|Running tests|Testing commands|Running package_contents|Running .* tests'
+                        r'|TEST END')),
+]
+RECIPE_ARGUMENT_PATTERN = re.compile(r'(?:^|/)recipes/([^/]+)/?$')
+
+
+class PhaseTimer:
+    """Accumulate the time spent in each phase from the output lines of a build."""
+
+    def __init__(self, start: float):
+        self.phase = "setup"
+        self.since = start
+        self.durations: Dict[str, float] = {}
+
+    def feed(self, line: str, now: float) -> None:
+        for phase, pattern in PHASE_PATTERNS:
+            if pattern.search(line):
+                if phase != self.phase:
+                    self.close(now)
+                    self.phase = phase
+                return
+
+    def close(self, now: float) -> None:
+        self.durations[self.phase] = self.durations.get(self.phase, 0.0) + now - self.since
+        self.since = now
+
+
+def process_tree_rss(root_pid: int) -> Optional[int]:
+    """Return the total resident memory (bytes) of `root_pid` and its descendants, None if unavailable."""
+    children: Dict[int, List[int]] = {}
+    rss: Dict[int, int] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r", encoding="utf-8", errors="replace") as handle:
+                fields = handle.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        # Fields after the command name: state, ppid, ..., rss (24th field of the line)
+        pid = int(entry)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss[pid] = int(fields[21]) * page_size
+    total = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        total += rss.get(pid, 0)
+        pending.extend(children.get(pid, []))
+    return total
+
+
+def sample_memory(pid: int, stop: threading.Event, peak: Dict[str, int]) -> None:
+    while not stop.is_set():
+        total = process_tree_rss(pid)
+        if total is None:
+            return
+        peak["rss"] = max(peak.get("rss", 0), total)
+        stop.wait(SAMPLE_INTERVAL)
+
+
+def compiler_cache_stats(config_path: Optional[str]) -> Optional[Dict[str, int]]:
+    """Return the {hits, misses} of the ccache `stats_log` of a ccache config file, if any."""
+    if not config_path or not os.path.exists(config_path):
+        return None
+    stats_log = None
+    with open(config_path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            key, _, value = line.partition("=")
+            if key.strip() == "stats_log":
+                stats_log = value.strip()
+    if not stats_log or not os.path.exists(stats_log):
+        return None
+    stats = {"hits": 0, "misses": 0}
+    with open(stats_log, "r", encoding="utf-8", errors="replace") as handle:
+        for line in handle:
+            line = line.strip()
+            if line.endswith("cache_hit"):
+                stats["hits"] += 1
+            elif line.endswith("cache_miss"):
+                stats["misses"] += 1
+    return stats
+
+
+def recipe_of(command: List[str]) -> str:
+    """Guess the recipe built by a builder command from its recipe path argument."""
+    for argument in reversed(command):
+        match = RECIPE_ARGUMENT_PATTERN.search(argument.rstrip("/"))
+        if match:
+            return match.group(1)
+        if argument.rstrip("/").endswith("recipes"):
+            return "recipes"
+    return Path(command[0]).name
+
+
+def run(command: List[str], recipe: str, history: Path) -> int:
+    """Run a builder command, record its telemetry in `history` and return its exit code."""
+    start = time.monotonic()
+    timer = PhaseTimer(start)
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource is not None else None
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        print(f"Error: cannot run {command[0]}: {e}", file=sys.stderr)
+        return 127
+
+    peak: Dict[str, int] = {}
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_memory, args=(process.pid, stop, peak), daemon=True)
+    sampler.start()
+    for raw in process.stdout:
+        sys.stdout.buffer.write(raw)
+        sys.stdout.flush()
+        timer.feed(raw.decode("utf-8", errors="replace"), time.monotonic())
+    returncode = process.wait()
+    stop.set()
+    sampler.join()
+
+    end = time.monotonic()
+    timer.close(end)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN) if resource is not None else None
+    wall = end - start
+    cpu = None
+    if usage is not None:
+        cpu = (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime)
+    cpus = int(os.environ.get("CPU_COUNT") or os.cpu_count() or 1)
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "run_id": os.environ.get("BUILD_RUN_ID"),
+        "recipe": recipe,
+        "builder": Path(command[0]).name,
+        "command": command,
+        "returncode": returncode,
+        "wall_s": round(wall, 2),
+        "cpu_s": round(cpu, 2) if cpu is not None else None,
+        "cpus": cpus,
+        "cpu_utilization": round(cpu / (wall * cpus), 3) if cpu is not None and wall > 0 else None,
+        # Peak of the whole process tree (sampled) and of its largest single process
+        "peak_rss_gb": round(peak["rss"] / 1024 ** 3, 3) if "rss" in peak else None,
+        "max_process_rss_gb": round(usage.ru_maxrss / 1024 ** 2, 3) if usage is not None else None,
+        "phases": {phase: round(seconds, 2) for phase, seconds in timer.durations.items()},
+        "compiler_cache": compiler_cache_stats(os.environ.get("CCACHE_CONFIGPATH")),
+    }
+    append_record(history, record)
+    return returncode
+
+
+def append_record(history: Path, record: Dict[str, object]) -> None:
+    history.parent.mkdir(parents=True, exist_ok=True)
+    with history.open("a", encoding="utf-8") as handle:
+        handle.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def load_history(history: Path) -> List[Dict[str, object]]:
+    if not history.exists():
+        return []
+    records = []
+    with history.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def report(history: Path, top: int, threshold: float, min_seconds: float) -> None:
+    """Print the slowest recipes of their last successful build and the regressions since the previous one."""
+    by_recipe: Dict[str, List[Dict[str, object]]] = {}
+    for record in load_history(history):
+        if record.get("returncode") == 0:
+            by_recipe.setdefault(record["recipe"], []).append(record)
+    if not by_recipe:
+        print(f"No successful build recorded in {history}")
+        return
+
+    latest = sorted((records[-1] for records in by_recipe.values()), key=lambda r: r["wall_s"], reverse=True)
+    total = sum(r["wall_s"] for r in latest)
+    print(f"Slowest recipes (last successful build, {total / 60:.1f} min in total):")
+    print(f"  {'recipe':24} {'wall':>9} {'cpu util':>8} {'peak GB':>8}  phases")
+    for record in latest[:top]:
+        phases = sorted(record["phases"].items(), key=lambda item: item[1], reverse=True)
+        breakdown = ", ".join(f"{phase} {seconds / 60:.1f}m" for phase, seconds in phases if seconds >= 1)
+        peak = record.get("peak_rss_gb")
+        utilization = record.get("cpu_utilization")
+        utilization = f"{utilization:.0%}" if utilization is not None else "-"
+        print(f"  {record['recipe']:24} {record['wall_s'] / 60:8.1f}m {utilization:>8} "
+              f"{peak if peak is not None else '-':>8}  {breakdown}")
+
+    regressions = []
+    for recipe, records in by_recipe.items():
+        if len(records) < 2:
+            continue
+        previous, current = records[-2], records[-1]
+        delta = current["wall_s"] - previous["wall_s"]
+        if delta >= min_seconds and delta > previous["wall_s"] * threshold:
+            phases = {
+                phase: current["phases"].get(phase, 0.0) - previous["phases"].get(phase, 0.0)
+                for phase in set(current["phases"]) | set(previous["phases"])
+            }
+            worst = max(phases.items(), key=lambda item: item[1])
+            regressions.append((delta, recipe, previous, current, worst))
+    print()
+    if not regressions:
+        print(f"No regression above {threshold:.0%} since the previous builds")
+        return
+    print(f"Regressions above {threshold:.0%} since the previous build:")
+    for delta, recipe, previous, current, (phase, phase_delta) in sorted(regressions, reverse=True):
+        print(f"  {recipe:24} {previous['wall_s'] / 60:.1f}m -> {current['wall_s'] / 60:.1f}m "
+              f"(+{delta / previous['wall_s']:.0%}, mostly {phase} +{phase_delta / 60:.1f}m)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and report the timing of the recipe builds")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY,
+                        help="JSON-lines history of the builds (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a builder command and record its telemetry")
+    run_parser.add_argument("--recipe", help="Recipe name (default: guessed from the command)")
+    run_parser.add_argument("command", nargs=argparse.REMAINDER, help="Builder command, after --")
+
+    report_parser = subparsers.add_parser("report", help="Print the slowest recipes and the regressions")
+    report_parser.add_argument("--top", type=int, default=15,
+                               help="Number of slowest recipes to show (default: %(default)s)")
+    report_parser.add_argument("--threshold", type=float, default=0.1,
+                               help="Relative slowdown reported as regression (default: %(default)s)")
+    report_parser.add_argument("--min-seconds", type=float, default=30.0,
+                               help="Ignore slowdowns shorter than this (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.action == "report":
+        report(args.history, args.top, args.threshold, args.min_seconds)
+        return
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("missing the builder command")
+    sys.exit(run(command, args.recipe or recipe_of(command), args.history))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,217 +1,417 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 import hashlib
-import re
+import json
+import os
 import sys
+import tempfile
+import time
+import urllib.error
 import urllib.request
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
-CHUNK_SIZE = 1 << 15
+from recipe_model import Recipe, SourceEntry, parse_recipe, recipe_files
+from source_store import DEFAULT_MAX_GB, STORE_DIR_NAME, SourceStore, size_bytes
+
+CHUNK_SIZE = 1 << 20
+DEFAULT_JOBS = 8
 TARGET_PATTERNS = ("rocm-{{ version }}", "rocm-${{ version }}")
+HASH_CACHE_NAME = "sha256_cache.json"
 
 
-def compute_sha256(url: str) -> str:
+def default_cache_dir() -> Path:
+    """Return the persistent cache directory, shared by all the checkouts of the repo."""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "rock-the-conda"
+
+
+def load_hash_cache(path: Path) -> Dict[str, Dict[str, object]]:
+    """Load the url -> {sha256, size, etag, last_modified} persistent cache."""
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError) as exc:
+        print(f"Warning: ignoring unreadable hash cache {path}: {exc}", file=sys.stderr)
+        return {}
+
+
+def save_hash_cache(path: Path, entries: Dict[str, Dict[str, object]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        json.dump(entries, handle, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def strong_validator(validators: Dict[str, Optional[str]]) -> Optional[str]:
+    """Return a validator usable in If-Range (a strong ETag or a Last-Modified date)."""
+    etag = validators.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validators.get("last_modified")
+
+
+def download_and_hash(url: str, partial_dir: Optional[Path] = None,
+                      conditional: Optional[Dict[str, object]] = None,
+                      store: Optional[SourceStore] = None) -> Optional[Dict[str, object]]:
+    """
+    Download `url` and return its {sha256, size, etag, last_modified} entry.
+
+    If `partial_dir` is given, the download is written there while hashing so that
+    an interrupted download can be resumed with an HTTP Range request on the next
+    call: the partial file is hashed again and only the missing bytes are fetched.
+    The partial file is removed once the download completes, or moved into the
+    source `store` if one is given, so that the builders do not download it again.
+
+    If `conditional` (a previous entry) is given, the request is conditional on its
+    ETag/Last-Modified and None is returned if the server answers 304 Not Modified.
+    """
     hasher = hashlib.sha256()
-    print(f"Downloading {url}", flush=True)
-    with urllib.request.urlopen(url) as response:
-        while True:
-            chunk = response.read(CHUNK_SIZE)
-            if not chunk:
-                break
-            hasher.update(chunk)
-    digest = hasher.hexdigest()
-    print(f"Computed sha256 {digest} for {url}", flush=True)
-    return digest
-
-
-def normalize_url(raw: str) -> str:
-    raw = raw.strip()
-    if raw and raw[0] in ('"', "'") and raw[-1] == raw[0]:
-        raw = raw[1:-1]
-    return raw
-
-
-def extract_url(line: str) -> Optional[str]:
-    if "url:" not in line:
-        return None
-    _, value = line.split("url:", 1)
-    return normalize_url(value)
-
-
-def update_meta_version(lines: List[str], new_version: str) -> bool:
-    pattern = re.compile(r'(\s*{%\s*set\s+version\s*=\s*")(.*?)("\s*%}\s*)')
-    for idx, line in enumerate(lines):
-        match = pattern.match(line)
-        if match:
-            lines[idx] = f"{match.group(1)}{new_version}{match.group(3)}\n"
-            return True
-    return False
-
-
-def update_recipe_version(lines: List[str], new_version: str) -> bool:
-    in_context = False
-    updated = False
-    for idx, line in enumerate(lines):
-        stripped = line.strip()
-        if stripped.startswith("context:"):
-            in_context = True
-            continue
-        if in_context and not stripped:
-            in_context = False
-            continue
-        if in_context and stripped.startswith("version:"):
-            match = re.search(r'(version:\s*)(["\'])([^"\']+)(["\'])', line)
-            if match:
-                start = match.start(3)
-                end = match.end(3)
-                lines[idx] = f"{line[:start]}{new_version}{line[end:]}"
-                updated = True
-                in_context = False
-    return updated
-
-
-def update_hashes(lines: List[str], new_version: str, cache: Dict[str, str]) -> bool:
-    changed = False
-    for idx, line in enumerate(lines):
-        url_value = extract_url(line)
-        if not url_value:
-            continue
-        if not any(pattern in url_value for pattern in TARGET_PATTERNS):
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    headers: Dict[str, str] = {}
+    offset = 0
+    validators: Dict[str, Optional[str]] = {}
+
+    part_path = meta_path = None
+    if partial_dir is not None:
+        partial_dir.mkdir(parents=True, exist_ok=True)
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        part_path = partial_dir / f"{key}.part"
+        meta_path = partial_dir / f"{key}.part.json"
+        if part_path.exists() and meta_path.exists():
+            with meta_path.open("r", encoding="utf-8") as handle:
+                validators = json.load(handle)
+            if_range = strong_validator(validators)
+            if if_range and part_path.stat().st_size > 0:
+                with part_path.open("rb") as handle:
+                    while True:
+                        size = handle.readinto(buffer)
+                        if not size:
+                            break
+                        hasher.update(view[:size])
+                        offset += size
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = if_range
+
+    if conditional and not offset:
+        if conditional.get("etag"):
+            headers["If-None-Match"] = str(conditional["etag"])
+        if conditional.get("last_modified"):
+            headers["If-Modified-Since"] = str(conditional["last_modified"])
+
+    if offset:
+        print(f"Resuming {url} at {offset} bytes", flush=True)
+    elif "If-None-Match" in headers or "If-Modified-Since" in headers:
+        print(f"Revalidating {url}", flush=True)
+    else:
+        print(f"Downloading {url}", flush=True)
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as exc:
+        if exc.code == 304 and conditional:
+            return None
+        if exc.code == 416 and offset and part_path is not None:
+            # The partial file does not match the remote file anymore, start over
+            part_path.unlink()
+            return download_and_hash(url, partial_dir, conditional, store)
+        raise
+
+    with response:
+        if offset and response.status != 206:
+            # The server ignored the Range request (or the file changed): start over
+            print(f"Cannot resume {url}, downloading it again", flush=True)
+            hasher = hashlib.sha256()
+            offset = 0
+        if not offset:
+            validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            if meta_path is not None:
+                with meta_path.open("w", encoding="utf-8") as handle:
+                    json.dump(validators, handle)
+        expected = response.headers.get("Content-Length")
+
+        received = 0
+        part_file = part_path.open("ab" if offset else "wb") if part_path is not None else None
+        try:
+            while True:
+                size = response.readinto(buffer)
+                if not size:
+                    break
+                hasher.update(view[:size])
+                if part_file is not None:
+                    part_file.write(view[:size])
+                received += size
+        finally:
+            if part_file is not None:
+                part_file.close()
+
+    if expected is not None and received != int(expected):
+        raise IOError(f"incomplete download of {url}: got {received} of {expected} bytes")
+
+    entry = {
+        "sha256": hasher.hexdigest(),
+        "size": offset + received,
+        "etag": validators.get("etag"),
+        "last_modified": validators.get("last_modified"),
+    }
+    if part_path is not None:
+        meta_path.unlink()
+        if store is not None:
+            store.add(part_path, str(entry["sha256"]))
+        else:
+            part_path.unlink()
+    print(f"Computed sha256 {entry['sha256']} for {url}", flush=True)
+    return entry
+
+
+def compute_sha256(url: str) -> str:
+    return download_and_hash(url)["sha256"]
+
+
+def hash_urls(urls: Iterable[str], cache: Dict[str, str], jobs: int = DEFAULT_JOBS,
+              cache_dir: Optional[Path] = None, verify: bool = False,
+              source_store: Optional[SourceStore] = None) -> List[str]:
+    """
+    Compute the sha256 of every url not already in `cache`, downloading up to
+    `jobs` of them concurrently, and store the results in `cache`.
+
+    If `cache_dir` is given, hashes are also looked up in and saved to the
+    persistent cache in that directory, and downloads are resumable. With
+    `verify`, persistent cache entries are revalidated with conditional
+    requests instead of being trusted. The downloaded tarballs are added to
+    `source_store`, through the partial downloads of `cache_dir` if given, else
+    of the directory of the store.
+
+    Returns the list of urls that could not be hashed.
+    """
+    store: Dict[str, Dict[str, object]] = {}
+    store_path = partial_dir = None
+    if cache_dir is not None:
+        store_path = cache_dir / HASH_CACHE_NAME
+        partial_dir = cache_dir / "partial"
+        store = load_hash_cache(store_path)
+    if source_store is not None and partial_dir is None:
+        partial_dir = source_store.root.parent / "partial"
+
+    pending = []
+    for url in sorted(set(urls)):
+        if url in cache:
             continue
-        rewritten_url = url_value.replace("{{ version }}", new_version).replace("${{ version }}", new_version)
-        if rewritten_url not in cache:
-            cache[rewritten_url] = compute_sha256(rewritten_url)
-        sha_idx = None
-        for look_ahead in range(1, 6):
-            pos = idx + look_ahead
-            if pos >= len(lines):
-                break
-            if "sha256:" in lines[pos]:
-                sha_idx = pos
-                break
-        if sha_idx is None:
+        if url in store and not verify:
+            cache[url] = str(store[url]["sha256"])
+            print(f"Using cached sha256 {cache[url]} for {url}", flush=True)
             continue
-        sha_line = lines[sha_idx]
-        match = re.search(r'(sha256:\s*)([0-9a-fA-F]+)', sha_line)
-        if not match:
+        pending.append(url)
+    if not pending:
+        return []
+
+    action = "Verifying/hashing" if verify else "Hashing"
+    print(f"{action} {len(pending)} tarballs with {min(jobs, len(pending))} workers", flush=True)
+    start = time.perf_counter()
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {
+            executor.submit(download_and_hash, url, partial_dir, store.get(url) if verify else None,
+                            source_store): url
+            for url in pending
+        }
+        for future in concurrent.futures.as_completed(futures):
+            url = futures[future]
+            try:
+                entry = future.result()
+            except Exception as exc:
+                print(f"Failed to hash {url}: {exc}", file=sys.stderr, flush=True)
+                failed.append(url)
+                continue
+            if entry is None:
+                print(f"Cached sha256 of {url} is still valid", flush=True)
+                entry = store[url]
+            elif url in store and store[url]["sha256"] != entry["sha256"]:
+                print(f"Warning: {url} changed upstream, sha256 {store[url]['sha256']} -> {entry['sha256']}",
+                      file=sys.stderr, flush=True)
+            cache[url] = str(entry["sha256"])
+            if store_path is not None:
+                # Save after every download so that an interrupted run keeps its progress
+                store[url] = entry
+                save_hash_cache(store_path, store)
+    elapsed = time.perf_counter() - start
+    print(f"Hashed {len(pending) - len(failed)}/{len(pending)} tarballs in {elapsed:.1f}s", flush=True)
+    return failed
+
+
+def is_target_url(url: str) -> bool:
+    return any(pattern in url for pattern in TARGET_PATTERNS)
+
+
+def target_sources(recipe: Recipe, new_version: str) -> List[Tuple[SourceEntry, str]]:
+    """
+    Return the ROCm-patterned archive sources of a recipe, each with its url
+    rendered for `new_version`.
+    """
+    targets = []
+    for source in recipe.sources:
+        if source.kind != "url" or not is_target_url(source.url):
             continue
-        lines[sha_idx] = f"{sha_line[:match.start(2)]}{cache[rewritten_url]}{sha_line[match.end(2):]}"
-        changed = True
-    return changed
-
-
-def get_meta_version(lines: List[str]) -> Optional[str]:
-    pattern = re.compile(r'(\s*{%\s*set\s+version\s*=\s*")(.*?)("\s*%}\s*)')
-    for line in lines:
-        match = pattern.match(line)
-        if match:
-            return match.group(2)
-    return None
-
-
-def get_recipe_version(lines: List[str]) -> Optional[str]:
-    in_context = False
-    for line in lines:
-        stripped = line.strip()
-        if stripped.startswith("context:"):
-            in_context = True
+        url = recipe.render(source.url, {"version": new_version})
+        if url is None:
+            print(f"Warning: cannot render {source.url} in {recipe.path}", file=sys.stderr)
             continue
-        if in_context and not stripped:
-            in_context = False
+        targets.append((source, url))
+    return targets
+
+
+def apply_bump(recipe: Recipe, new_version: str, hashes: Dict[str, str]) -> List[Tuple[int, str, str]]:
+    """
+    Set the version and the sha256 of the ROCm-patterned sources of `recipe` (in
+    memory), taking the hashes from `hashes` (url -> sha256).
+
+    Returns the (line index, old line, new line) changes.
+    """
+    before = list(recipe.lines)
+    version_span = recipe.variable_spans.get("version")
+    if version_span is not None:
+        recipe.set_value(version_span, new_version)
+    for source, url in target_sources(recipe, new_version):
+        if source.sha256_span is None or "{{" in (source.sha256 or ""):
+            print(f"Warning: no literal sha256 for {source.url} in {recipe.path}", file=sys.stderr)
             continue
-        if in_context and stripped.startswith("version:"):
-            match = re.search(r'(version:\s*)(["\'])([^"\']+)(["\'])', line)
-            if match:
-                return match.group(3)
-    return None
-
-
-def file_has_target_urls(lines: List[str]) -> bool:
-    for line in lines:
-        url = extract_url(line)
-        if url and any(p in url for p in TARGET_PATTERNS):
-            return True
-    return False
-
-
-def process_file(path: Path, new_version: str, cache: Dict[str, str]) -> bool:
-    with path.open("r", encoding="utf-8") as handle:
-        lines = handle.readlines()
-    modified = False
-    if path.name == "meta.yaml":
-        modified |= update_meta_version(lines, new_version)
-    elif path.name == "recipe.yaml":
-        modified |= update_recipe_version(lines, new_version)
-    modified |= update_hashes(lines, new_version, cache)
-    if modified:
-        with path.open("w", encoding="utf-8") as handle:
-            handle.writelines(lines)
-    return modified
+        recipe.set_value(source.sha256_span, hashes[url])
+    return [(idx, old, new) for idx, (old, new) in enumerate(zip(before, recipe.lines)) if old != new]
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Bump ROCm recipe versions and hashes")
     parser.add_argument("version", help="Target ROCm version, e.g. 7.0.2")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"Number of tarballs downloaded concurrently (default: {DEFAULT_JOBS})")
+    parser.add_argument("--recipes-dir", type=Path, default=Path(__file__).resolve().parent,
+                        help="Directory containing the recipes (default: the directory of this script)")
+    parser.add_argument("--cache-dir", type=Path, default=default_cache_dir(),
+                        help="Directory of the persistent sha256 cache and of the partial downloads "
+                             "(default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not use the persistent sha256 cache")
+    parser.add_argument("--no-source-store", action="store_true",
+                        help="Do not keep the downloaded tarballs in the source store of the cache directory, "
+                             "shared with build_all.py")
+    parser.add_argument("--source-store-max-gb", type=float, default=DEFAULT_MAX_GB,
+                        help="Size of the source store above which the least recently used tarballs "
+                             "are removed, in GB (default: %(default)s)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Revalidate the cached sha256 with conditional requests instead of trusting them")
+    parser.add_argument("--no-check-patches", action="store_true",
+                        help="Do not check that the patches of the updated recipes apply to their new sources")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the planned changes and the urls to fetch, without using the network "
+                             "or modifying any file")
     args = parser.parse_args()
 
-    recipes_root = Path(__file__).resolve().parent
+    recipes_root = args.recipes_dir.resolve()
+    cache_dir = None if args.no_cache else args.cache_dir
+    source_store = None
+    if cache_dir is not None and not args.no_source_store:
+        source_store = SourceStore(cache_dir / STORE_DIR_NAME, size_bytes(args.source_store_max_gb))
     cache: Dict[str, str] = {}
     updated_files: List[Path] = []
+    planned: List[Recipe] = []
+    urls: List[str] = []
 
+    # First pass: parse every recipe once, find the ones to update and the urls to hash
     for entry in sorted(recipes_root.iterdir()):
         if not entry.is_dir():
             continue
-        # If the recipe already declares the target version, skip downloading/updating
-        meta = entry / "meta.yaml"
-        recipe = entry / "recipe.yaml"
-
-        # Read any existing files so we can inspect declared version and URLs
-        meta_lines: Optional[List[str]] = None
-        recipe_lines: Optional[List[str]] = None
-        if meta.exists():
-            with meta.open("r", encoding="utf-8") as fh:
-                meta_lines = fh.readlines()
-        if recipe.exists():
-            with recipe.open("r", encoding="utf-8") as fh:
-                recipe_lines = fh.readlines()
-
-        declared_version = None
-        if meta_lines is not None:
-            declared_version = get_meta_version(meta_lines)
-        elif recipe_lines is not None:
-            declared_version = get_recipe_version(recipe_lines)
+        recipes = [parse_recipe(path) for path in recipe_files(entry)]
+        if not recipes:
+            continue
 
+        # If the recipe already declares the target version, skip downloading/updating
         rel_entry = entry.relative_to(recipes_root)
-        if declared_version == args.version:
+        if recipes[0].version == args.version:
             print(f"Skipping {rel_entry}: already at version {args.version}", flush=True)
             continue
 
-        # If neither file contains a ROCm-patterned URL, skip the whole recipe
-        has_targets = False
-        if meta_lines is not None and file_has_target_urls(meta_lines):
-            has_targets = True
-        if recipe_lines is not None and file_has_target_urls(recipe_lines):
-            has_targets = True
-        if not has_targets:
+        # If no file contains a ROCm-patterned URL (or git tag), skip the whole recipe
+        targets = [url for recipe in recipes for _, url in target_sources(recipe, args.version)]
+        git_targets = [source for recipe in recipes for source in recipe.sources
+                       if source.kind == "git" and source.rev and is_target_url(source.rev)]
+        if not targets and not git_targets:
             print(f"Skipping {rel_entry}: no ROCm-patterned URLs found", flush=True)
             continue
 
-        for candidate, lines in ((meta, meta_lines), (recipe, recipe_lines)):
-            if candidate.exists():
-                rel_path = candidate.relative_to(recipes_root)
-                print(f"Processing {rel_path}", flush=True)
-                if process_file(candidate, args.version, cache):
-                    print(f"Updated {rel_path}", flush=True)
-                    updated_files.append(candidate)
-
-    if updated_files:
-        for path in updated_files:
-            rel = path.relative_to(recipes_root)
-            print(f"Updated {rel}")
-    else:
-        print("No recipes required updates.")
+        planned.extend(recipes)
+        urls.extend(targets)
+
+    if args.dry_run:
+        store = load_hash_cache(cache_dir / HASH_CACHE_NAME) if cache_dir is not None else {}
+        hashes = {url: str(store[url]["sha256"]) if url in store else f"<sha256 of {url}>" for url in urls}
+        for recipe in planned:
+            changes = apply_bump(recipe, args.version, hashes)
+            if not changes:
+                continue
+            print(f"--- {recipe.path.relative_to(recipes_root)}")
+            for idx, old, new in changes:
+                print(f"  {idx + 1}: - {old.rstrip()}")
+                print(f"  {idx + 1}: + {new.rstrip()}")
+        pending = sorted(url for url in set(urls) if url not in store)
+        print(f"{len(set(urls))} urls to hash, {len(pending)} not in the persistent cache:")
+        for url in sorted(set(urls)):
+            print(f"  {url}{'' if url in pending else ' (cached)'}")
+        return
+
+    # Without the source store, the tarballs are kept in a temporary one for the patch check,
+    # so that each source is only downloaded once
+    scratch_dir = None
+    if source_store is None and not args.no_check_patches:
+        scratch_dir = tempfile.TemporaryDirectory(prefix="bump-sources-")
+        source_store = SourceStore(Path(scratch_dir.name) / STORE_DIR_NAME)
+    try:
+        # Hash all the tarballs concurrently before touching any file
+        failed = hash_urls(urls, cache, args.jobs, cache_dir, args.verify, source_store)
+        if failed:
+            print(f"Could not hash {len(failed)} tarballs, no recipe was modified:", file=sys.stderr)
+            for url in sorted(failed):
+                print(f"  - {url}", file=sys.stderr)
+            sys.exit(1)
+
+        # Second pass: rewrite the recipes using the hashes computed above
+        for recipe in planned:
+            rel_path = recipe.path.relative_to(recipes_root)
+            print(f"Processing {rel_path}", flush=True)
+            if apply_bump(recipe, args.version, cache):
+                recipe.write()
+                updated_files.append(recipe.path)
+
+        if updated_files:
+            for path in updated_files:
+                rel = path.relative_to(recipes_root)
+                print(f"Updated {rel}")
+        else:
+            print("No recipes required updates.")
+            return
+
+        if not args.no_check_patches:
+            # Imported here, as check_patches.py imports this module
+            from check_patches import check_patches, print_report
+
+            recipe_dirs = sorted({path.parent for path in updated_files})
+            results, warnings = check_patches(recipe_dirs, source_store, os.cpu_count() or 1)
+            failures = print_report(results, warnings)
+            if failures:
+                print(f"{failures} patches do not apply to the new sources, update them before building",
+                      file=sys.stderr)
+                sys.exit(1)
+    finally:
+        if scratch_dir is not None:
+            scratch_dir.cleanup()
 
 
 if __name__ == "__main__":
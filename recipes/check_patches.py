@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Check that the patches of the recipes still apply to their sources.
+
+A patch that does not apply anymore after a version bump is otherwise only
+noticed when the build of its recipe reaches the patching step, possibly hours
+into a build. This check runs `patch --dry-run` on every patch of the selected
+recipes, without solving environments or compiling anything:
+
+- the source archives are taken from the source store (source_store.py) and
+  only downloaded into it when missing, so the check after a bump reuses the
+  tarballs downloaded to hash them; git sources are shallow cloned;
+- only the files touched by the patches are extracted, so large archives such
+  as llvm-project are not unpacked in full;
+- the sources are checked in a process pool, one job per source, and the
+  patches of a source are applied in order, as the builders do;
+- the strip level of each patch is detected as the builders do, by trying the
+  levels for which the patched files exist.
+
+Each patch is reported with the hunks that fail, the hunks that only apply
+with fuzz, and whether it looks already applied upstream. The exit status is 1
+when a patch does not apply.
+
+    python recipes/check_patches.py                 # all the recipes with patches
+    python recipes/check_patches.py hip rocm-comgr  # some of them
+"""
+
+import argparse
+import concurrent.futures
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from bump_version import DEFAULT_JOBS, default_cache_dir, download_and_hash
+from recipe_model import parse_recipe, recipe_files
+from source_store import STORE_DIR_NAME, SHA256_PATTERN, SourceStore
+
+RECIPES_DIR = Path(__file__).resolve().parent
+# Strip levels tried for each patch, in order
+STRIP_LEVELS = (1, 0, 2, 3)
+PATCH_HEADER_PATTERN = re.compile(r'^(?:---|\+\+\+) ("?)(.+?)\1(?:\t.*)?$')
+GIT_HEADER_PATTERN = re.compile(r'^diff --git a/(\S+) b/(\S+)$')
+FILE_PATTERN = re.compile(r'^(?:checking|patching) file (.+?)$')
+FAILED_HUNK_PATTERN = re.compile(r'^Hunk #(\d+) FAILED at (\d+)')
+FUZZY_HUNK_PATTERN = re.compile(r'^Hunk #(\d+) succeeded at (\d+) with fuzz (\d+)')
+MISSING_FILE_MARKER = "can't find file to patch"
+QUOTED_HEADER_PATTERN = re.compile(r'^\|(?:---|\+\+\+) ("?)(.+?)\1(?:\t.*)?$')
+REVERSED_MARKER = "Reversed (or previously applied) patch detected"
+
+
+@dataclass
+class SourceJob:
+    recipe: str
+    recipe_dir: Path
+    url: str
+    kind: str                           # 'url' | 'git'
+    patches: List[Path]
+    sha256: Optional[str] = None
+    rev: Optional[str] = None
+    archive: Optional[Path] = None      # stored archive of url sources
+
+
+@dataclass
+class PatchResult:
+    recipe: str
+    patch: str
+    strip: Optional[int] = None
+    failed_hunks: List[str] = field(default_factory=list)
+    fuzzy_hunks: List[str] = field(default_factory=list)
+    reversed_files: List[str] = field(default_factory=list)
+    missing_files: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return not (self.failed_hunks or self.reversed_files or self.missing_files or self.error)
+
+
+def patch_paths(patch: Path) -> Set[str]:
+    """Return the paths (before stripping) of the files a patch reads."""
+    paths = set()
+    with patch.open("r", encoding="utf-8", errors="replace") as handle:
+        for line in handle:
+            line = line.rstrip("\r\n")
+            git_match = GIT_HEADER_PATTERN.match(line)
+            if git_match:
+                paths.update(("a/" + git_match.group(1), "b/" + git_match.group(2)))
+                continue
+            header = PATCH_HEADER_PATTERN.match(line)
+            if header and header.group(2) != "/dev/null":
+                paths.add(header.group(2))
+    return paths
+
+
+def stripped_paths(paths: Set[str]) -> Set[str]:
+    """Return the paths relative to the source root for all the strip levels."""
+    wanted = set()
+    for path in paths:
+        parts = [part for part in path.split("/") if part and part != "."]
+        for level in STRIP_LEVELS:
+            if len(parts) > level:
+                wanted.add("/".join(parts[level:]))
+    return wanted
+
+
+def safe_relative(name: str) -> Optional[str]:
+    normalized = os.path.normpath(name)
+    if normalized.startswith("..") or os.path.isabs(normalized):
+        return None
+    return normalized
+
+
+def extract_files(archive: Path, dest: Path, wanted: Set[str]) -> int:
+    """
+    Extract the files of `archive` whose path, without the top-level directory
+    of the archive, is in `wanted`. Returns the number of extracted files.
+    """
+    extracted = 0
+
+    def write(name: str, data, mode: int) -> None:
+        nonlocal extracted
+        target = dest / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with target.open("wb") as handle:
+            shutil.copyfileobj(data, handle)
+        os.chmod(target, (mode & 0o777) | 0o600)
+        extracted += 1
+
+    top = None
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as bundle:
+            for info in bundle.infolist():
+                top = top or info.filename.split("/", 1)[0]
+                name = safe_relative(info.filename.split("/", 1)[1] if info.filename.startswith(top + "/")
+                                     else info.filename)
+                if name in wanted and not info.is_dir():
+                    with bundle.open(info) as data:
+                        write(name, data, info.external_attr >> 16)
+        return extracted
+    # Streamed: archives are read once, without seeking
+    with tarfile.open(archive, "r|*") as bundle:
+        for member in bundle:
+            top = top or member.name.split("/", 1)[0]
+            name = safe_relative(member.name.split("/", 1)[1] if member.name.startswith(top + "/")
+                                 else member.name)
+            if name in wanted and member.isfile():
+                write(name, bundle.extractfile(member), member.mode)
+    return extracted
+
+
+def clone_files(job: SourceJob, dest: Path, wanted: Set[str]) -> int:
+    """Check out the files of a git source in `wanted`, with a shallow blob-less clone."""
+    subprocess.run(["git", "clone", "--quiet", "--depth", "1", "--filter=blob:none", "--no-checkout",
+                    *(["--branch", job.rev] if job.rev else []), job.url, str(dest)],
+                   check=True, capture_output=True, text=True)
+    tracked = subprocess.run(["git", "-C", str(dest), "ls-tree", "-r", "--name-only", "HEAD"],
+                             check=True, capture_output=True, text=True).stdout.splitlines()
+    files = sorted(wanted.intersection(tracked))
+    if files:
+        subprocess.run(["git", "-C", str(dest), "checkout", "--quiet", "HEAD", "--", *files],
+                       check=True, capture_output=True, text=True)
+    shutil.rmtree(dest / ".git")
+    return len(files)
+
+
+def run_patch(patch: Path, tree: Path, level: int, dry_run: bool) -> Tuple[int, str]:
+    command = ["patch", "--batch", "--forward", "--no-backup-if-mismatch", "--reject-file=-",
+               f"-p{level}", "-i", str(patch), "-d", str(tree)]
+    if dry_run:
+        command.append("--dry-run")
+    result = subprocess.run(command, capture_output=True, text=True)
+    return result.returncode, result.stdout + result.stderr
+
+
+def parse_patch_output(output: str, result: PatchResult) -> None:
+    current = "?"
+    for line in output.splitlines():
+        # The headers of a file that is not found are quoted before the error
+        quoted = QUOTED_HEADER_PATTERN.match(line)
+        if quoted:
+            current = quoted.group(2)
+            continue
+        if MISSING_FILE_MARKER in line:
+            result.missing_files.append(current)
+            continue
+        file_match = FILE_PATTERN.match(line)
+        if file_match:
+            current = file_match.group(1).strip("'\"")
+            continue
+        failed = FAILED_HUNK_PATTERN.match(line)
+        if failed:
+            result.failed_hunks.append(f"{current}: hunk #{failed.group(1)} FAILED at line {failed.group(2)}")
+            continue
+        fuzzy = FUZZY_HUNK_PATTERN.match(line)
+        if fuzzy:
+            result.fuzzy_hunks.append(f"{current}: hunk #{fuzzy.group(1)} applies at line {fuzzy.group(2)} "
+                                      f"with fuzz {fuzzy.group(3)}")
+        elif REVERSED_MARKER in line:
+            result.reversed_files.append(current)
+
+
+def apply_patch(job: SourceJob, patch: Path, tree: Path) -> PatchResult:
+    """
+    Dry-run `patch` at the first strip level that applies it (or that finds
+    most of its files), then apply it to `tree`.
+    """
+    result = PatchResult(recipe=job.recipe, patch=os.path.relpath(patch, job.recipe_dir))
+    if not patch.exists():
+        result.error = "patch file not found"
+        return result
+    attempts = []
+    for level in STRIP_LEVELS:
+        returncode, output = run_patch(patch, tree, level, dry_run=True)
+        if returncode == 0:
+            attempts = [(0, level, output)]
+            break
+        if any(FILE_PATTERN.match(line) for line in output.splitlines()):
+            attempts.append((output.count(MISSING_FILE_MARKER), level, output))
+    if not attempts:
+        result.missing_files = sorted(patch_paths(patch))
+        return result
+    _, result.strip, output = min(attempts, key=lambda attempt: attempt[0])
+    parse_patch_output(output, result)
+    if returncode and result.ok:
+        result.error = output.strip().splitlines()[-1]
+    # Applied for real, so that the next patches of the source see its changes
+    run_patch(patch, tree, result.strip, dry_run=False)
+    return result
+
+
+def check_source(job: SourceJob) -> List[PatchResult]:
+    """Extract the files patched in a source and apply its patches in order (run in a worker process)."""
+    wanted = stripped_paths(set().union(*(patch_paths(p) for p in job.patches if p.exists())))
+    with tempfile.TemporaryDirectory(prefix=f"check-patches-{job.recipe}-") as tmp:
+        tree = Path(tmp) / "src"
+        try:
+            if job.kind == "git":
+                clone_files(job, tree, wanted)
+            else:
+                tree.mkdir()
+                extract_files(job.archive, tree, wanted)
+        except (OSError, tarfile.TarError, zipfile.BadZipFile, subprocess.CalledProcessError) as exc:
+            detail = exc.stderr.strip() if isinstance(exc, subprocess.CalledProcessError) else exc
+            return [PatchResult(recipe=job.recipe, patch=os.path.relpath(p, job.recipe_dir),
+                                error=f"cannot get {job.url}: {detail}") for p in job.patches]
+        return [apply_patch(job, patch, tree) for patch in job.patches]
+
+
+def source_jobs(recipe_dirs: List[Path]) -> Tuple[List[SourceJob], List[str]]:
+    """Return the sources with patches of the recipes, and the warnings about the ones not checkable."""
+    jobs = []
+    warnings = []
+    for recipe_dir in recipe_dirs:
+        for path in recipe_files(recipe_dir):
+            recipe = parse_recipe(path)
+            for source in recipe.sources:
+                if not source.patches:
+                    continue
+                url = recipe.render(source.url)
+                patches = [recipe.render(p) for p in source.patches]
+                if url is None or None in patches:
+                    warnings.append(f"{recipe_dir.name}: cannot render the source {source.url} or its patches")
+                    continue
+                job = SourceJob(recipe=recipe_dir.name, recipe_dir=recipe_dir, url=url, kind=source.kind,
+                                patches=[recipe_dir / p for p in patches])
+                if source.kind == "git":
+                    job.rev = recipe.render(source.rev) if source.rev else None
+                else:
+                    job.sha256 = recipe.render(source.sha256 or "")
+                    if not job.sha256 or not SHA256_PATTERN.match(job.sha256.lower()):
+                        warnings.append(f"{recipe_dir.name}: no literal sha256 for {url}")
+                        continue
+                    job.sha256 = job.sha256.lower()
+                jobs.append(job)
+    return jobs, warnings
+
+
+def fetch_archives(jobs: List[SourceJob], store: SourceStore, offline: bool,
+                   fetch_jobs: int = DEFAULT_JOBS) -> List[str]:
+    """
+    Set the archive of the url jobs from `store`, downloading the missing ones
+    into it unless `offline`. Returns the warnings about the failed downloads.
+    """
+    missing: Dict[str, str] = {}
+    for job in jobs:
+        if job.kind == "url" and store.get(job.sha256) is None:
+            missing.setdefault(job.sha256, job.url)
+    warnings = []
+    if missing and not offline:
+        print(f"→ Fetching {len(missing)} source archives into {store.root}", flush=True)
+        partial_dir = store.root.parent / "partial"
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, fetch_jobs)) as executor:
+            futures = {executor.submit(download_and_hash, url, partial_dir, None, store): (sha256, url)
+                       for sha256, url in missing.items()}
+            for future in concurrent.futures.as_completed(futures):
+                sha256, url = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as exc:
+                    warnings.append(f"cannot fetch {url}: {exc}")
+                    continue
+                if entry["sha256"] != sha256:
+                    warnings.append(f"{url} has sha256 {entry['sha256']}, the recipe expects {sha256}")
+    for job in jobs:
+        if job.kind == "url":
+            job.archive = store.get(job.sha256)
+    return warnings
+
+
+def check_patches(recipe_dirs: List[Path], store: SourceStore, jobs: int, offline: bool = False
+                  ) -> Tuple[List[PatchResult], List[str]]:
+    """Check the patches of the recipes in a process pool of `jobs` workers."""
+    sources, warnings = source_jobs(recipe_dirs)
+    warnings.extend(fetch_archives(sources, store, offline))
+    runnable = []
+    for job in sources:
+        if job.kind == "git" and offline:
+            warnings.append(f"{job.recipe}: cannot clone {job.url} offline")
+        elif job.kind == "url" and job.archive is None:
+            warnings.append(f"{job.recipe}: {job.url} is not in the source store")
+        else:
+            runnable.append(job)
+    results: List[PatchResult] = []
+    if not runnable:
+        return results, warnings
+    print(f"→ Checking {sum(len(job.patches) for job in runnable)} patches of {len(runnable)} sources "
+          f"with {min(jobs, len(runnable))} workers", flush=True)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, min(jobs, len(runnable)))) as executor:
+        for source_results in executor.map(check_source, runnable):
+            results.extend(source_results)
+    return results, warnings
+
+
+def print_report(results: List[PatchResult], warnings: List[str]) -> int:
+    """Print the results by recipe and return the number of patches that do not apply."""
+    for warning in warnings:
+        print(f"= Not checked: {warning}")
+    by_recipe: Dict[str, List[PatchResult]] = {}
+    for result in results:
+        by_recipe.setdefault(result.recipe, []).append(result)
+    failures = 0
+    for recipe, recipe_results in sorted(by_recipe.items()):
+        failed = [result for result in recipe_results if not result.ok]
+        failures += len(failed)
+        if not failed:
+            print(f"✓ {recipe}: {len(recipe_results)} patches apply")
+        for result in recipe_results:
+            if not result.ok:
+                print(f"✗ {recipe}: {result.patch} does not apply"
+                      + (f" (-p{result.strip})" if result.strip is not None else ""))
+            for hunk in result.failed_hunks:
+                print(f"    {hunk}")
+            for path in result.reversed_files:
+                print(f"    {path}: already applied upstream (reversed patch)")
+            if result.missing_files:
+                print(f"    files not found at any strip level: {', '.join(result.missing_files)}")
+            if result.error:
+                print(f"    {result.error}")
+            for hunk in result.fuzzy_hunks:
+                print(f"  ~ {result.patch}: {hunk}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that the patches of the recipes apply to their sources")
+    parser.add_argument("recipes", nargs="*",
+                        help="Recipes (directory names) to check (default: all the recipes with patches)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Number of sources checked concurrently (default: %(default)s)")
+    parser.add_argument("--source-store-dir", type=Path, default=default_cache_dir() / STORE_DIR_NAME,
+                        help="Directory of the source store, shared with bump_version.py and build_all.py "
+                             "(default: %(default)s)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Only check the sources available in the source store")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.recipes if not recipe_files(RECIPES_DIR / name)]
+    if unknown:
+        raise SystemExit(f"Error: unknown recipe(s): {', '.join(unknown)}")
+    names = args.recipes or sorted(p.name for p in RECIPES_DIR.iterdir() if p.is_dir() and recipe_files(p))
+
+    start = time.perf_counter()
+    results, warnings = check_patches([RECIPES_DIR / name for name in names], SourceStore(args.source_store_dir),
+                                      args.jobs, args.offline)
+    failures = print_report(results, warnings)
+    print(f"Checked {len(results)} patches in {time.perf_counter() - start:.1f}s: "
+          f"{failures} do not apply, {len(warnings)} sources not checked")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
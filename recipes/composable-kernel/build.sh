@@ -16,6 +16,6 @@ cmake -GNinja \
     -DENABLE_CLANG_CPP_CHECKS=OFF \
     ..
 
-# Limit to 4 parallel jobs to avoid OOM issues
-cmake --build . -- -j4
+# At most 4 parallel jobs to avoid OOM issues, fewer if CPU_COUNT is lower
+cmake --build . -j$(( CPU_COUNT < 4 ? CPU_COUNT : 4 ))
 cmake --install .
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+GPU targets of the device code of the HIP recipes.
+
+The recipes that compile device code (rocblas, hipblaslt, rocfft, miopen-hip,
+composable-kernel, ...) take their targets from the `amdgpu_targets` variant
+key of recipes/conda_build_config.yaml: `default` builds for
+CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS as set by the hip-clang activation, any
+other value is a ';'-separated list of gfx targets that the activation uses in
+its place (the recipes pass the variant as ROCK_THE_CONDA_AMDGPU_TARGETS).
+build_all.py --gpu-targets writes an explicit variant config with the requested
+value. The value is neither in the build string nor pinned between the
+packages, so a channel only holds the builds of one value: other target lists,
+e.g. to build per target family in parallel, go into their own channels.
+
+The built packages are then checked against the targets of their variant: the
+device code objects, i.e. the offload bundles embedded in the libraries and the
+code object files (parsed as in package_sizes.py), must be exactly for the
+requested targets, ignoring the target features (gfx90a:xnack-). Packages
+without device code (headers, host-only libraries) are not checked.
+
+    python recipes/gpu_targets.py                   # check the packages of output/linux-64
+    python recipes/gpu_targets.py rocblas rocfft    # only some of them
+"""
+
+import argparse
+import re
+import sys
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from local_channel import read_variant
+from package_sizes import GPU_TARGET_PATTERN, archive_members, file_type, scan_file, split_package_name
+
+RECIPES_DIR = Path(__file__).resolve().parent
+REPO_DIR = RECIPES_DIR.parent
+VARIANT_KEY = "amdgpu_targets"
+DEFAULT_VALUE = "default"
+ACTIVATION_SCRIPT = RECIPES_DIR / "hip" / "activate" / "hip-clang_activate.sh"
+DEFAULT_TARGETS_PATTERN = re.compile(r'^export CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS="([^"]*)"', re.MULTILINE)
+# A gfx target with optional features, e.g. gfx1100, gfx90a:xnack-, gfx9-4-generic
+TARGET_PATTERN = re.compile(r'^gfx[0-9a-f]+(?:-[0-9a-f]+)*(?:-generic)?(?::[a-z]+[+-])*$')
+# Files that do not embed device code, not worth scanning
+UNSCANNED_TYPES = ("metadata", "header", "cmake", "python", "documentation", "kernel database")
+
+
+def default_targets() -> List[str]:
+    """Return CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS, as set by the hip-clang activation script."""
+    match = DEFAULT_TARGETS_PATTERN.search(ACTIVATION_SCRIPT.read_text(encoding="utf-8"))
+    if match is None:
+        raise SystemExit(f"Error: CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS not found in {ACTIVATION_SCRIPT}")
+    return [target for target in match.group(1).split(";") if target]
+
+
+def parse_targets(text: str) -> str:
+    """Parse a `,`/`;`-separated list of gfx targets into an `amdgpu_targets` value (argparse type)."""
+    if text.strip() == DEFAULT_VALUE:
+        return DEFAULT_VALUE
+    targets = [target for target in re.split(r'[,;\s]+', text.strip()) if target]
+    invalid = [target for target in targets if not TARGET_PATTERN.match(target)]
+    if not targets or invalid:
+        raise argparse.ArgumentTypeError(f"invalid GPU targets: {', '.join(invalid) or repr(text)}")
+    return ";".join(targets)
+
+
+def value_label(value: str) -> str:
+    """Return a short name of an `amdgpu_targets` value, usable in file names."""
+    return value.replace(";", ",")
+
+
+def requested_targets(value: str) -> Set[str]:
+    """Return the targets of an `amdgpu_targets` value, without their features."""
+    targets = default_targets() if value == DEFAULT_VALUE else value.split(";")
+    return {target.split(":", 1)[0].lower() for target in targets if target}
+
+
+def write_targets_config(path: Path, values: List[str]) -> None:
+    """Write a variant config setting the `amdgpu_targets` values."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as handle:
+        handle.write("# GPU targets requested with build_all.py --gpu-targets\n")
+        handle.write(f"{VARIANT_KEY}:\n")
+        for value in values:
+            handle.write(f"  - \"{value}\"\n")
+
+
+def package_variant(package: Path) -> Optional[str]:
+    """Return the `amdgpu_targets` value a package was built with, None if it does not use it."""
+    variant = read_variant(package)
+    return variant.get(VARIANT_KEY) if variant else None
+
+
+def channel_values(records: List[Dict[str, object]]) -> Set[str]:
+    """Return the `amdgpu_targets` values the packages of a channel index (local_channel.py) were built with."""
+    return {str(record["variant"][VARIANT_KEY]) for record in records
+            if record.get("variant") and VARIANT_KEY in record["variant"]}
+
+
+def code_object_targets(package: Path) -> Set[str]:
+    """Return the targets of the device code objects of a package, without their features."""
+    targets = set()
+    for member, handle in archive_members(package):
+        kind = file_type(member.name)
+        if kind in UNSCANNED_TYPES:
+            continue
+        _, bundles = scan_file(handle)
+        targets.update(target for target, _ in bundles)
+        if kind == "code object" and not bundles:
+            match = GPU_TARGET_PATTERN.search(member.name.rsplit("/", 1)[-1])
+            if match:
+                targets.add(match.group(0).lower())
+    return targets
+
+
+def check_package(package: Path, only_value: Optional[str] = None) -> Optional[Tuple[str, Set[str], Set[str]]]:
+    """
+    Compare the code objects of a package with the targets of its variant.
+
+    Returns (variant value, missing targets, unexpected targets), or None if the
+    package does not use `amdgpu_targets` (or `only_value`) or has no device code.
+    """
+    value = package_variant(package)
+    if value is None or (only_value is not None and value != only_value):
+        return None
+    found = code_object_targets(package)
+    if not found:
+        return None
+    expected = requested_targets(value)
+    return value, expected - found, found - expected
+
+
+def check_packages(packages: List[Path], only_value: Optional[str] = None) -> Dict[Path, str]:
+    """
+    Check the code objects of `packages` (only those built for `only_value` if
+    given), printing the results. Returns the problem of each failing package.
+    """
+    problems = {}
+    for package in packages:
+        try:
+            result = check_package(package, only_value)
+        except (OSError, ValueError, tarfile.TarError, zipfile.BadZipFile) as exc:
+            problems[package] = f"{package.name}: cannot be read: {exc}"
+            print(f"✗ {problems[package]}")
+            continue
+        if result is None:
+            continue
+        value, missing, unexpected = result
+        if not missing and not unexpected:
+            print(f"✓ {package.name}: code objects for {VARIANT_KEY}={value_label(value)}")
+            continue
+        details = []
+        if missing:
+            details.append(f"missing {', '.join(sorted(missing))}")
+        if unexpected:
+            details.append(f"unexpected {', '.join(sorted(unexpected))}")
+        problems[package] = f"{package.name} ({VARIANT_KEY}={value_label(value)}): {'; '.join(details)}"
+        print(f"✗ {problems[package]}")
+    return problems
+
+
+def built_packages(channel: Path, subdir: str, names: List[str], since: float = 0.0) -> List[Path]:
+    """Return the packages of `names` (all if empty) in a channel subdir, written after `since`."""
+    packages = []
+    for package in sorted((channel / subdir).glob("*")):
+        if not package.name.endswith((".conda", ".tar.bz2")):
+            continue
+        if names and split_package_name(package.name)[0] not in names:
+            continue
+        if package.stat().st_mtime >= since:
+            packages.append(package)
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the GPU targets of the code objects of the built packages")
+    parser.add_argument("packages", nargs="*", help="Package names to check (default: all)")
+    parser.add_argument("--channel", type=Path, default=REPO_DIR / "output",
+                        help="Local channel of the packages (default: %(default)s)")
+    parser.add_argument("--subdir", default="linux-64", help="Channel subdir (default: %(default)s)")
+    args = parser.parse_args()
+
+    packages = built_packages(args.channel, args.subdir, args.packages)
+    problems = check_packages(packages)
+    print(f"Checked {len(packages)} packages: {len(problems)} with unexpected code objects")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
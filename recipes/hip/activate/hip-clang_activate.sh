@@ -16,4 +16,11 @@ export HIPCXX=$CONDA_PREFIX/bin/x86_64-conda-linux-gnu-clang
 export CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS_CONDA_BACKUP=${CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS:-}
 export CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS="gfx908;gfx90a;gfx942;gfx950;gfx1030;gfx1100;gfx1101;gfx1102;gfx1150;gfx1151;gfx1200;gfx1201"
 
-
+# The recipes built for the `amdgpu_targets` variant of recipes/conda_build_config.yaml
+# (build_all.py --gpu-targets) pass it as ROCK_THE_CONDA_AMDGPU_TARGETS, which replaces the
+# targets above, `default` keeps them. Only applied in conda-build/rattler-build builds,
+# not in the environments of the users
+if { [ -n "${CONDA_BUILD:-}" ] || [ -n "${RATTLER_BUILD:-}" ]; } && \
+   [ -n "${ROCK_THE_CONDA_AMDGPU_TARGETS:-}" ] && [ "${ROCK_THE_CONDA_AMDGPU_TARGETS}" != "default" ]; then
+    export CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS="${ROCK_THE_CONDA_AMDGPU_TARGETS}"
+fi
@@ -45,7 +45,7 @@ ln -sf -- "$HIPCXX" "$PREFIX/bin/amdclang++"
 ln -sf -- "$HIPCXX" "$PREFIX/bin/amdclang"
 
 cmake -GNinja ${CMAKE_ARGS} -DAMDGPU_TARGETS="${AMDGPU_TARGETS_EXPANDED}" -DPython_EXECUTABLE=$PYTHON -Bbuild -S.
-cmake --build ./build
+cmake --build ./build -j${CPU_COUNT}
 cmake --install ./build
 
 # Remove amdclang++ symlink to avoid to ship it
@@ -1,5 +1,5 @@
 #!/bin/bash
 
 cmake -GNinja ${CMAKE_ARGS} -DGPU_TARGETS=${CONDA_FORGE_DEFAULT_ROCM_GPU_TARGETS} -Bbuild -S.
-cmake --build ./build
+cmake --build ./build -j${CPU_COUNT}
 cmake --install ./build
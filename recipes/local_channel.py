@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Incrementally updated index of the local output channel.
+
+conda-build and rattler-build index the whole `output/` channel on every
+invocation, and finding out that a package already exists (--skip-existing)
+costs a full builder start, render and index. This index is kept in
+`<subdir>/.local_index.json` of the channel (next to, and independent of, the
+repodata.json written by the builders) and only reads the packages that are
+new or changed since the last update (by size and mtime), so build_all.py can
+refresh it after every build and look up the existing packages in-process.
+
+Besides its index.json, the variant each package was built with is recorded:
+the variant keys that went into its build string hash, as listed by
+info/recipe/rendered_recipe.yaml (rattler-build) or info/hash_input.json
+(conda-build). A package only counts as existing for a rendered variant when
+these keys have the same values, as --skip-existing decides by build string.
+
+    python recipes/local_channel.py            # update the index of ./output
+    python recipes/local_channel.py --list     # and print its packages
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+try:
+    import zstandard
+except ImportError:  # .conda packages need zstandard, available in the conda-build environment
+    zstandard = None
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CHANNEL = REPO_DIR / "output"
+SUBDIRS = ("linux-64", "noarch")
+INDEX_FILE = ".local_index.json"
+RENDERED_RECIPE_FILE = "info/recipe/rendered_recipe.yaml"
+HASH_INPUT_FILE = "info/hash_input.json"
+
+
+def read_info_file(package: Path, name: str) -> Optional[bytes]:
+    """
+    Return the content of the `info/` file `name` (e.g. info/index.json) of a
+    .conda or .tar.bz2 package, None if .conda packages cannot be read. Raises
+    KeyError if the package has no such file.
+    """
+    if package.name.endswith(".tar.bz2"):
+        with tarfile.open(package, "r:bz2") as archive:
+            return archive.extractfile(name).read()
+    if zstandard is None:
+        return None
+    with zipfile.ZipFile(package) as archive:
+        info_name = next(n for n in archive.namelist() if n.startswith("info-") and n.endswith(".tar.zst"))
+        with archive.open(info_name) as compressed:
+            data = zstandard.ZstdDecompressor().stream_reader(compressed).read()
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:") as archive:
+        return archive.extractfile(name).read()
+
+
+def read_index_json(package: Path) -> Optional[Dict[str, object]]:
+    """Return the info/index.json of a .conda or .tar.bz2 package, None if it cannot be read."""
+    try:
+        data = read_info_file(package, "info/index.json")
+        return json.loads(data) if data is not None else None
+    except (OSError, KeyError, StopIteration, ValueError, tarfile.TarError, zipfile.BadZipFile) as e:
+        print(f"Warning: cannot read the index of {package.name}: {e}", file=sys.stderr)
+        return None
+
+
+def read_variant(package: Path) -> Optional[Dict[str, str]]:
+    """
+    Return the variant (key -> value, as strings) a package was built with, as
+    hashed into its build string. None if it cannot be read.
+    """
+    try:
+        data = read_info_file(package, RENDERED_RECIPE_FILE)
+        if data is None:
+            return None
+        # BaseLoader keeps the values as written (e.g. "7.10" rather than 7.1)
+        rendered = yaml.load(data, Loader=yaml.BaseLoader) or {}
+        variant = (rendered.get("build_configuration") or {}).get("variant")
+    except KeyError:
+        try:
+            variant = json.loads(read_info_file(package, HASH_INPUT_FILE))
+        except (KeyError, ValueError):
+            return None
+    except (OSError, StopIteration, ValueError, yaml.YAMLError, tarfile.TarError, zipfile.BadZipFile):
+        return None
+    if not isinstance(variant, dict):
+        return None
+    return {str(key): value if isinstance(value, str) else json.dumps(value) for key, value in variant.items()}
+
+
+def package_record(package: Path, index: Dict[str, object]) -> Dict[str, object]:
+    hasher = hashlib.sha256()
+    with package.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            hasher.update(chunk)
+    record = dict(index)
+    record.update({"sha256": hasher.hexdigest(), "size": package.stat().st_size, "variant": read_variant(package)})
+    return record
+
+
+def scan_subdir(subdir_dir: Path) -> Tuple[Dict[str, Dict[str, object]], int, bool]:
+    """
+    Return the index entries of the packages of a channel subdir, reading only
+    the new or changed packages, with their count and whether the stored index
+    is out of date.
+    """
+    cache_path = subdir_dir / INDEX_FILE
+    try:
+        with cache_path.open("r", encoding="utf-8") as handle:
+            cache = json.load(handle)
+    except (OSError, ValueError):
+        cache = {}
+
+    entries = {}
+    read = 0
+    for package in sorted(subdir_dir.iterdir()):
+        if not (package.name.endswith(".conda") or package.name.endswith(".tar.bz2")):
+            continue
+        stat = package.stat()
+        previous = cache.get(package.name)
+        if (previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime_ns
+                and "variant" in previous["record"]):
+            entries[package.name] = previous
+            continue
+        index = read_index_json(package)
+        if index is None:
+            continue
+        entries[package.name] = {"size": stat.st_size, "mtime": stat.st_mtime_ns,
+                                 "record": package_record(package, index)}
+        read += 1
+
+    return entries, read, bool(read) or set(entries) != set(cache)
+
+
+def update_subdir(subdir_dir: Path) -> int:
+    """Update the index of a channel subdir, reading only new or changed packages. Returns their count."""
+    entries, read, stale = scan_subdir(subdir_dir)
+    if stale:
+        write_json(subdir_dir / INDEX_FILE, entries)
+    return read
+
+
+def update_index(channel: Path) -> int:
+    """Update the index of every subdir of the local channel. Returns the number of packages read."""
+    return sum(update_subdir(channel / subdir) for subdir in SUBDIRS if (channel / subdir).is_dir())
+
+
+def current_records(channel: Path) -> List[Dict[str, object]]:
+    """Return the records of all the packages of the local channel, without updating its stored index."""
+    records = []
+    for subdir in SUBDIRS:
+        if (channel / subdir).is_dir():
+            entries, _, _ = scan_subdir(channel / subdir)
+            records.extend(entry["record"] for entry in entries.values())
+    return records
+
+
+def load_records(channel: Path) -> List[Dict[str, object]]:
+    """Return the records of all the packages of the local channel (as of its last update)."""
+    records = []
+    for subdir in SUBDIRS:
+        path = channel / subdir / INDEX_FILE
+        try:
+            with path.open("r", encoding="utf-8") as handle:
+                entries = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        records.extend(entry["record"] for entry in entries.values())
+    return records
+
+
+def same_variant(rendered: Dict[str, str], built: Dict[str, str]) -> bool:
+    """Whether a package built with the variant `built` is the build of the `rendered` variant."""
+    return all(str(rendered[key]) == built[key] for key in rendered.keys() & built.keys())
+
+
+def has_builds(records: List[Dict[str, object]], name: str, version: str, build_number: int,
+               variants: List[Dict[str, str]]) -> bool:
+    """Whether the channel has a package of name/version/build number for each of the rendered `variants`."""
+    built = [
+        r["variant"] for r in records
+        if r.get("name") == name and r.get("version") == version and r.get("build_number") == build_number
+        and r.get("variant") is not None
+    ]
+    return all(any(same_variant(variant, variant_built) for variant_built in built) for variant in variants)
+
+
+def write_json(path: Path, data: object) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally update the index of the local output channel")
+    parser.add_argument("--channel", type=Path, default=DEFAULT_CHANNEL,
+                        help="Local channel directory (default: %(default)s)")
+    parser.add_argument("--list", action="store_true", help="Print the packages of the channel")
+    args = parser.parse_args()
+
+    read = update_index(args.channel)
+    records = load_records(args.channel)
+    print(f"Indexed {len(records)} packages in {args.channel} ({read} new or changed)")
+    if args.list:
+        for record in sorted(records, key=lambda r: (r["name"], r["version"], r["build"])):
+            print(f"  {record['name']} {record['version']} {record['build']}")
+
+
+if __name__ == "__main__":
+    main()
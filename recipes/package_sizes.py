@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Size and content of the built packages.
+
+The packages of the channel (`output/linux-64` by default) are streamed member
+by member (the zstd tarballs inside a .conda, or the .tar.bz2) without being
+extracted to disk. The size of every package is broken down by file type and by
+GPU target: code objects named after a target (Tensile and MIOpen kernel
+libraries) count for that target, and the clang offload bundles embedded in the
+fat binaries are parsed to count each device code object for its target. Files
+with the same content in several places (across packages or within one) are
+listed with the space they waste.
+
+The summary of every scanned package is appended to a JSON-lines history, used
+to skip the packages that did not change and to show the size deltas between
+builds.
+
+    python recipes/package_sizes.py                    # the packages of output/linux-64
+    python recipes/package_sizes.py rocblas hipblaslt  # only some of them
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import struct
+import sys
+import tarfile
+import zipfile
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+import zstandard
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CHANNEL = REPO_DIR / "output"
+DEFAULT_HISTORY = REPO_DIR / "output" / "package_sizes.jsonl"
+CHUNK_SIZE = 8 << 20
+# Bytes after an offload bundle magic that are enough to hold its header
+HEADER_WINDOW = 64 << 10
+# Files smaller than this are not recorded for the duplicate detection
+DUPLICATE_MIN_SIZE = 64 << 10
+
+BUNDLE_MAGIC = b"__CLANG_OFFLOAD_BUNDLE__"
+COMPRESSED_BUNDLE_MAGIC = b"CCOB"
+# Offload kinds of the bundle entries, e.g. hipv4-amdgcn-amd-amdhsa--gfx90a:xnack-
+BUNDLE_TRIPLE_PATTERN = re.compile(r'^(hip|hipv4|host|openmp)-')
+# gfx9xx targets have three characters, gfx1xxx four (MIOpen databases append the CU count, gfx90a68.kdb)
+GPU_TARGET_PATTERN = re.compile(r'gfx(?:\d+(?:-\d+)?-generic|1\d{3}|[6-9]\d[0-9a-f])', re.IGNORECASE)
+
+FILE_TYPES: List[Tuple[str, re.Pattern]] = [
+    ("metadata", re.compile(r'^info/')),
+    ("static library", re.compile(r'\.a$')),
+    ("shared library", re.compile(r'\.so(\.\d+)*$')),
+    ("code object", re.compile(r'\.(co|hsaco|hipfb)$')),
+    ("kernel database", re.compile(r'\.(dat|kdb|db|ukdb|msgpack)$|\.fdb\.txt$')),
+    ("header", re.compile(r'\.(h|hh|hpp|hxx|inc|inl|cuh)$')),
+    ("cmake", re.compile(r'\.cmake$')),
+    ("python", re.compile(r'\.(py|pyc|pyi)$')),
+    ("executable", re.compile(r'^bin/')),
+    ("documentation", re.compile(r'^share/(doc|man|info)/')),
+]
+
+
+def file_type(path: str) -> str:
+    for name, pattern in FILE_TYPES:
+        if pattern.search(path):
+            return name
+    return "other"
+
+
+def split_package_name(filename: str) -> Tuple[str, str, str]:
+    """Return the name, version and build string of a package file name."""
+    for extension in (".conda", ".tar.bz2"):
+        if filename.endswith(extension):
+            filename = filename[:-len(extension)]
+    name, version, build = filename.rsplit("-", 2)
+    return name, version, build
+
+
+def human_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return ""
+
+
+def archive_members(package: Path) -> Iterator[Tuple[tarfile.TarInfo, IO[bytes]]]:
+    """Stream the regular files of a .conda or .tar.bz2 package."""
+    if package.name.endswith(".tar.bz2"):
+        with tarfile.open(package, "r|bz2") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member, archive.extractfile(member)
+        return
+    with zipfile.ZipFile(package) as zip_archive:
+        for name in zip_archive.namelist():
+            if not name.endswith(".tar.zst"):
+                continue
+            with zip_archive.open(name) as compressed, \
+                    zstandard.ZstdDecompressor().stream_reader(compressed) as stream, \
+                    tarfile.open(fileobj=stream, mode="r|") as archive:
+                for member in archive:
+                    if member.isfile():
+                        yield member, archive.extractfile(member)
+
+
+def bundle_targets(data: bytes) -> Tuple[List[Tuple[str, int]], int]:
+    """
+    Return the (GPU target, size) of the device code objects of the offload
+    bundle at the start of data, and the length of the bundle (no targets if
+    it is not a valid bundle).
+    """
+    if data.startswith(COMPRESSED_BUNDLE_MAGIC):
+        return compressed_bundle_targets(data)
+    try:
+        count = struct.unpack_from("<Q", data, len(BUNDLE_MAGIC))[0]
+        if not 0 < count < 1024:
+            return [], 0
+        position = len(BUNDLE_MAGIC) + 8
+        targets = []
+        length = 0
+        for _ in range(count):
+            offset, size, triple_size = struct.unpack_from("<QQQ", data, position)
+            if triple_size > 1024:
+                return [], 0
+            triple = data[position + 24:position + 24 + triple_size].decode("ascii")
+            position += 24 + triple_size
+            if not BUNDLE_TRIPLE_PATTERN.match(triple):
+                return [], 0
+            match = GPU_TARGET_PATTERN.search(triple)
+            if match:
+                targets.append((match.group(0).lower(), size))
+            length = max(length, offset + size)
+        return targets, length
+    except (struct.error, UnicodeDecodeError):
+        return [], 0
+
+
+def compressed_bundle_targets(data: bytes) -> Tuple[List[Tuple[str, int]], int]:
+    """Return the targets of a compressed (CCOB) bundle, with their sizes scaled to the compressed size."""
+    try:
+        version, method = struct.unpack_from("<HH", data, 4)
+        if version == 1:
+            total_size, (uncompressed_size,) = 0, struct.unpack_from("<I", data, 8)
+            start = 20
+        elif version == 2:
+            total_size, uncompressed_size = struct.unpack_from("<II", data, 8)
+            start = 24
+        elif version == 3:
+            total_size, uncompressed_size = struct.unpack_from("<QQ", data, 8)
+            start = 32
+        else:
+            return [], 0
+        # The header of the inner bundle is at the start of the decompressed data
+        if method == 0:
+            inner = zlib.decompressobj().decompress(data[start:])
+        elif method == 1:
+            inner = zstandard.ZstdDecompressor().decompressobj().decompress(data[start:])
+        else:
+            return [], 0
+    except (struct.error, zlib.error, zstandard.ZstdError):
+        return [], 0
+    if not inner.startswith(BUNDLE_MAGIC):
+        return [], 0
+    ratio = total_size / uncompressed_size if total_size and uncompressed_size else 1.0
+    return [(target, int(size * ratio)) for target, size in bundle_targets(inner)[0]], total_size
+
+
+def scan_file(handle: IO[bytes]) -> Tuple[str, List[Tuple[str, int]]]:
+    """Return the sha256 of a file and the device code objects of the offload bundles it embeds."""
+    hasher = hashlib.sha256()
+    targets: List[Tuple[str, int]] = []
+    carry = b""
+    base = 0  # offset of data in the file
+    skip_until = 0  # end of the last bundle, whose content may contain the magic of other bundles
+    while True:
+        chunk = handle.read(CHUNK_SIZE)
+        hasher.update(chunk)
+        data = carry + chunk
+        # A magic near the end is looked for in the next round, with its header
+        limit = len(data) if not chunk else max(len(data) - HEADER_WINDOW, 0)
+        positions = []
+        for magic in (BUNDLE_MAGIC, COMPRESSED_BUNDLE_MAGIC):
+            position = data.find(magic, 0, limit + len(magic) - 1)
+            while position != -1:
+                positions.append(position)
+                position = data.find(magic, position + 1, limit + len(magic) - 1)
+        for position in sorted(positions):
+            if base + position < skip_until:
+                continue
+            bundle, length = bundle_targets(data[position:position + HEADER_WINDOW])
+            if bundle:
+                targets.extend(bundle)
+                skip_until = base + position + length
+        if not chunk:
+            return hasher.hexdigest(), targets
+        carry = data[limit:]
+        base += limit
+
+
+def scan_package(package: Path) -> Dict[str, object]:
+    """Return the size summary of a package."""
+    name, version, build = split_package_name(package.name)
+    stat = package.stat()
+    summary = {
+        "package": package.name, "name": name, "version": version, "build": build,
+        "archive_size": stat.st_size, "mtime": stat.st_mtime_ns,
+        "scanned_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "size": 0, "types": {}, "targets": {}, "files": {},
+    }
+    for member, handle in archive_members(package):
+        digest, bundles = scan_file(handle)
+        kind = file_type(member.name)
+        summary["size"] += member.size
+        summary["types"][kind] = summary["types"].get(kind, 0) + member.size
+        if bundles:
+            for target, size in bundles:
+                summary["targets"][target] = summary["targets"].get(target, 0) + size
+        elif kind in ("code object", "kernel database"):
+            match = GPU_TARGET_PATTERN.search(member.name.rsplit("/", 1)[-1])
+            target = match.group(0).lower() if match else "unnamed"
+            summary["targets"][target] = summary["targets"].get(target, 0) + member.size
+        if member.size >= DUPLICATE_MIN_SIZE and kind != "metadata":
+            summary["files"][member.name] = [member.size, digest]
+    return summary
+
+
+def load_history(history: Path) -> List[Dict[str, object]]:
+    if not history.exists():
+        return []
+    records = []
+    with history.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def append_records(history: Path, records: List[Dict[str, object]]) -> None:
+    history.parent.mkdir(parents=True, exist_ok=True)
+    with history.open("a", encoding="utf-8") as handle:
+        for record in records:
+            handle.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def breakdown(sizes: Dict[str, int], total: int, limit: int = 6) -> str:
+    items = sorted(sizes.items(), key=lambda item: item[1], reverse=True)
+    text = ", ".join(f"{key} {human_size(size)} ({size / total:.0%})" for key, size in items[:limit] if size)
+    if len(items) > limit:
+        text += f", +{len(items) - limit} more"
+    return text
+
+
+def report_packages(summaries: List[Dict[str, object]], top: int) -> None:
+    summaries = sorted(summaries, key=lambda s: s["archive_size"], reverse=True)
+    total = sum(s["archive_size"] for s in summaries)
+    print(f"Largest packages ({len(summaries)} packages, {human_size(total)} in total):")
+    for summary in summaries[:top]:
+        print(f"  {summary['package']}  {human_size(summary['archive_size'])} "
+              f"({human_size(summary['size'])} unpacked)")
+        print(f"    types:   {breakdown(summary['types'], summary['size'])}")
+        if summary["targets"]:
+            device = sum(summary["targets"].values())
+            print(f"    targets: {human_size(device)} of device code, "
+                  f"{breakdown(summary['targets'], summary['size'])}")
+
+
+def report_duplicates(summaries: List[Dict[str, object]], min_size: int, top: int) -> None:
+    by_digest: Dict[str, List[Tuple[str, str, int]]] = {}
+    for summary in summaries:
+        for path, (size, digest) in summary["files"].items():
+            if size >= min_size:
+                by_digest.setdefault(digest, []).append((summary["name"], path, size))
+    duplicates = sorted(
+        (copies for copies in by_digest.values() if len(copies) > 1),
+        key=lambda copies: copies[0][2] * (len(copies) - 1), reverse=True,
+    )
+    print()
+    if not duplicates:
+        print(f"No duplicated file of at least {human_size(min_size)}")
+        return
+    wasted = sum(copies[0][2] * (len(copies) - 1) for copies in duplicates)
+    print(f"Duplicated files of at least {human_size(min_size)} ({human_size(wasted)} wasted):")
+    for copies in duplicates[:top]:
+        print(f"  {human_size(copies[0][2])} x {len(copies)}")
+        for name, path, _ in sorted(copies):
+            print(f"    {name}: {path}")
+
+
+def report_deltas(history: List[Dict[str, object]], names: List[str]) -> None:
+    deltas = []
+    for name in names:
+        records = [r for r in history if r["name"] == name]
+        if len(records) < 2:
+            continue
+        previous, current = records[-2], records[-1]
+        delta = current["archive_size"] - previous["archive_size"]
+        if delta:
+            deltas.append((delta, previous, current))
+    print()
+    if not deltas:
+        print("No size change since the previous builds")
+        return
+    print("Size changes since the previous build:")
+    for delta, previous, current in sorted(deltas, key=lambda item: abs(item[0]), reverse=True):
+        print(f"  {current['name']:24} {human_size(previous['archive_size'])} -> "
+              f"{human_size(current['archive_size'])} ({'+' if delta > 0 else '-'}{human_size(abs(delta))}, "
+              f"{delta / previous['archive_size']:+.0%})  {previous['version']}-{previous['build']} -> "
+              f"{current['version']}-{current['build']}")
+        for key in ("types", "targets"):
+            changes = {
+                k: current[key].get(k, 0) - previous[key].get(k, 0)
+                for k in set(current[key]) | set(previous[key])
+            }
+            changes = {k: v for k, v in changes.items() if abs(v) >= 1 << 20}
+            if changes:
+                text = ", ".join(
+                    f"{k} {'+' if v > 0 else '-'}{human_size(abs(v))}"
+                    for k, v in sorted(changes.items(), key=lambda item: abs(item[1]), reverse=True)
+                )
+                print(f"    {key + ':':8} {text} unpacked")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the size and content of the built packages")
+    parser.add_argument("packages", nargs="*", help="Package names to report (default: all)")
+    parser.add_argument("--channel", type=Path, default=DEFAULT_CHANNEL,
+                        help="Local channel directory (default: %(default)s)")
+    parser.add_argument("--subdir", default="linux-64", help="Channel subdir (default: %(default)s)")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY,
+                        help="JSON-lines history of the package sizes (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=20,
+                        help="Number of packages and duplicates to show (default: %(default)s)")
+    parser.add_argument("--min-duplicate-mb", type=float, default=1.0,
+                        help="Smallest duplicated file to report, in MB (default: %(default)s)")
+    args = parser.parse_args()
+
+    subdir_dir = args.channel / args.subdir
+    packages = sorted(
+        (p for p in subdir_dir.glob("*") if p.name.endswith(".conda") or p.name.endswith(".tar.bz2")),
+        key=lambda p: p.stat().st_mtime_ns,
+    )
+    # The most recent package of each name
+    latest: Dict[str, Path] = {}
+    for package in packages:
+        name = split_package_name(package.name)[0]
+        if not args.packages or name in args.packages:
+            latest[name] = package
+    if not latest:
+        print(f"✗ No package found in {subdir_dir}")
+        sys.exit(1)
+
+    history = load_history(args.history)
+    scanned = {(r["package"], r["archive_size"], r["mtime"]): r for r in history}
+    summaries = []
+    new_records = []
+    for name, package in sorted(latest.items()):
+        stat = package.stat()
+        summary: Optional[Dict[str, object]] = scanned.get((package.name, stat.st_size, stat.st_mtime_ns))
+        if summary is None:
+            print(f"→ Scanning {package.name} ({human_size(stat.st_size)})", file=sys.stderr, flush=True)
+            try:
+                summary = scan_package(package)
+            except (OSError, tarfile.TarError, zipfile.BadZipFile, zstandard.ZstdError) as e:
+                print(f"✗ Cannot read {package.name}: {e}", file=sys.stderr)
+                continue
+            new_records.append(summary)
+        summaries.append(summary)
+    append_records(args.history, new_records)
+
+    report_packages(summaries, args.top)
+    report_duplicates(summaries, int(args.min_duplicate_mb * (1 << 20)), args.top)
+    report_deltas(history + new_records, sorted(latest))
+
+
+if __name__ == "__main__":
+    main()
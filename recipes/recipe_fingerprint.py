@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Content fingerprints of the recipes, used to rebuild only what changed.
+
+The fingerprint of a recipe covers every file of its directory (recipe,
+scripts, patches, local conda_build_config.yaml, tests), the entries of the
+variant config files (`-m` of the builders) that the recipe can use, and the
+fingerprints of the recipes it depends on, so that a change propagates to all
+its dependents. Fingerprints of the built recipes are stored next to the output
+channel.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+TOKEN_PATTERN = re.compile(r'[A-Za-z_][\w.-]*')
+FUNCTION_PATTERN = re.compile(r'\b(compiler|stdlib)\(\s*["\'](\w+)["\']')
+TOP_LEVEL_KEY_PATTERN = re.compile(r'^([A-Za-z_][\w.-]*):')
+# Variant config entries that affect every recipe
+GLOBAL_CONFIG_KEYS = ("zip_keys", "pin_run_as_build")
+
+
+def normalize(name: str) -> str:
+    """Variant keys use underscores where package names use dashes."""
+    return name.replace("-", "_")
+
+
+def recipe_dir_files(recipe_dir: Path) -> List[Path]:
+    return sorted(
+        p for p in recipe_dir.rglob("*")
+        if p.is_file() and "__pycache__" not in p.parts and not p.name.startswith(".")
+    )
+
+
+def recipe_tokens(files: Iterable[Path]) -> Set[str]:
+    """Return the (normalized) names that may select entries of the variant config."""
+    tokens: Set[str] = set()
+    for path in files:
+        if path.suffix not in (".yaml", ".yml", ".sh", ".bat"):
+            continue
+        text = path.read_text(encoding="utf-8", errors="replace")
+        tokens.update(normalize(token) for token in TOKEN_PATTERN.findall(text))
+        for kind, language in FUNCTION_PATTERN.findall(text):
+            tokens.update((f"{language}_{kind}", f"{language}_{kind}_version"))
+    return tokens
+
+
+def config_blocks(path: Path) -> Dict[str, str]:
+    """Split a conda_build_config.yaml into the text of each top-level key."""
+    blocks: Dict[str, List[str]] = {}
+    current = None
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            match = TOP_LEVEL_KEY_PATTERN.match(line)
+            if match:
+                current = match.group(1)
+                blocks.setdefault(current, [])
+            if current is not None:
+                blocks[current].append(line)
+    return {key: "".join(lines) for key, lines in blocks.items()}
+
+
+def recipe_fingerprint(recipe_dir: Path, config_files: List[Path], upstream: Dict[str, str],
+                       extra: str = "") -> str:
+    """
+    Return the fingerprint of a recipe directory, given the variant config files
+    and the fingerprints of the recipes it depends on (recipe name -> fingerprint).
+    """
+    hasher = hashlib.sha256()
+    files = recipe_dir_files(recipe_dir)
+    for path in files:
+        hasher.update(f"file {path.relative_to(recipe_dir).as_posix()}\n".encode())
+        hasher.update(hashlib.sha256(path.read_bytes()).digest())
+
+    tokens = recipe_tokens(files)
+    for config_path in config_files:
+        if not config_path.exists():
+            continue
+        hasher.update(f"config {config_path.name}\n".encode())
+        for key, text in sorted(config_blocks(config_path).items()):
+            if key in GLOBAL_CONFIG_KEYS or normalize(key) in tokens:
+                hasher.update(text.encode())
+
+    for name, fingerprint in sorted(upstream.items()):
+        hasher.update(f"dep {name} {fingerprint}\n".encode())
+    hasher.update(extra.encode())
+    return hasher.hexdigest()
+
+
+def load_fingerprints(path: Path) -> Dict[str, str]:
+    """Load the recipe -> fingerprint map of the last successful builds."""
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable fingerprints {path}: {e}", file=sys.stderr)
+        return {}
+
+
+def save_fingerprints(path: Path, fingerprints: Dict[str, str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        json.dump(fingerprints, handle, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Lightweight, single-pass model of the recipes in this directory.
+
+Both conda-build `meta.yaml` (Jinja `{% set %}` variables) and rattler-build
+`recipe.yaml` (`context:` variables) files are templates rather than plain YAML,
+so they are scanned line by line once, keeping the position of every value we
+may want to rewrite. Rewrites only touch those values, so the rest of the file
+(comments, selectors, quoting) is left untouched.
+
+Run as a script, it prints the packages produced by the recipes of a directory
+as JSON (package name -> recipe directory), for tools outside recipes/:
+
+    python recipes/recipe_model.py --packages recipes
+"""
+
+import argparse
+import ast
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+# (line index, start column, end column) of a scalar value in a recipe file
+Span = Tuple[int, int, int]
+
+KEY_PATTERN = re.compile(r'^(\s*)(-\s+)?([A-Za-z_][\w.-]*):(?=\s|$)\s*(.*?)\s*$')
+LIST_ITEM_PATTERN = re.compile(r'^(\s*)-\s+(.*?)\s*$')
+JINJA_SET_PATTERN = re.compile(r'^\s*{%-?\s*set\s+(\w+)\s*=\s*(["\'])(.*?)\2\s*-?%}')
+TEMPLATE_VARIABLE_PATTERN = re.compile(r'\$?{{\s*(\w+)\s*((?:\|\s*\w+\s*(?:\([^()]*\)\s*)?)*)}}')
+TEMPLATE_FILTER_PATTERN = re.compile(r'\|\s*(\w+)\s*(?:\(([^()]*)\))?')
+TEMPLATE_FUNCTION_PATTERN = re.compile(r'\$?{{\s*(\w+)\(\s*(["\']?)([\w.-]+)\2[^}]*}}')
+REQUIREMENT_SECTIONS = ("build", "host", "run")
+SELECTOR_PATTERN = re.compile(r'#\s*\[(.*)\]\s*$')
+
+
+def apply_filter(value: Union[None, str, List[str]], name: str,
+                 arguments: str) -> Union[None, str, List[str]]:
+    """
+    Apply a Jinja filter of the recipes (`lower`, `upper`, `replace(...)`,
+    `split(...)`, `list`, `first`, `last`, `join(...)`) to a value. Returns
+    None for any other filter or argument.
+    """
+    try:
+        arguments = ast.literal_eval(f"({arguments},)") if arguments.strip() else ()
+    except (SyntaxError, ValueError):
+        return None
+    if isinstance(value, str):
+        if name in ("lower", "upper"):
+            return getattr(value, name)()
+        if name == "replace" and len(arguments) == 2:
+            return value.replace(*arguments)
+        if name == "split" and len(arguments) <= 1:
+            return value.split(*arguments)
+    elif isinstance(value, list):
+        if name == "list":
+            return value
+        if name in ("first", "last") and value:
+            return value[0 if name == "first" else -1]
+        if name == "join" and len(arguments) <= 1:
+            return (arguments[0] if arguments else "").join(value)
+    return None
+
+
+@dataclass
+class SourceEntry:
+    url: str
+    url_span: Span
+    kind: str = "url"               # 'url' for archives, 'git' for git checkouts
+    rev: Optional[str] = None       # tag/rev/branch of git sources
+    sha256: Optional[str] = None
+    sha256_span: Optional[Span] = None
+    folder: Optional[str] = None
+    patches: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Recipe:
+    path: Path
+    lines: List[str]
+    variables: Dict[str, str] = field(default_factory=dict)
+    variable_spans: Dict[str, Span] = field(default_factory=dict)
+    sources: List[SourceEntry] = field(default_factory=list)
+    # Raw names of the package and of its outputs
+    raw_names: List[str] = field(default_factory=list)
+    # Raw `package: version:` and `build: number:` values
+    raw_version: Optional[str] = None
+    raw_build_number: Optional[str] = None
+    # Raw requirement specs of the recipe and of its outputs, by section (build/host/run)
+    requirements: Dict[str, List[str]] = field(default_factory=dict)
+    # Conditions of `build: skip:`, as expressions of the variant and platform variables
+    skip_conditions: List[str] = field(default_factory=list)
+
+    @property
+    def is_meta(self) -> bool:
+        return self.path.name == "meta.yaml"
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.variables.get("version")
+
+    def value(self, span: Span) -> str:
+        line, start, end = span
+        return self.lines[line][start:end]
+
+    def set_value(self, span: Span, new_value: str) -> bool:
+        """Replace the value at `span` in place, returning whether it changed."""
+        line, start, end = span
+        text = self.lines[line]
+        if text[start:end] == new_value:
+            return False
+        self.lines[line] = f"{text[:start]}{new_value}{text[end:]}"
+        return True
+
+    def render(self, text: str, overrides: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """
+        Substitute the simple `{{ var }}` / `${{ var }}` references of `text` with
+        the recipe variables (and `overrides`), through the string filters of
+        `apply_filter`. Returns None if a template expression cannot be resolved
+        this way.
+        """
+        variables = dict(self.variables)
+        variables.update(overrides or {})
+
+        def substitute(match: re.Match) -> str:
+            value = variables.get(match.group(1))
+            for name, arguments in TEMPLATE_FILTER_PATTERN.findall(match.group(2)):
+                value = apply_filter(value, name, arguments)
+            return value if isinstance(value, str) else match.group(0)
+
+        rendered = TEMPLATE_VARIABLE_PATTERN.sub(substitute, text)
+        if "{{" in rendered or "{%" in rendered:
+            return None
+        return rendered
+
+    def package_names(self) -> List[str]:
+        """Return the rendered names of the package and of all its outputs."""
+        names = []
+        for raw in self.raw_names:
+            name = self.render(raw)
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    def package_version(self) -> Optional[str]:
+        """Return the rendered package version, or None if it cannot be rendered."""
+        return self.render(self.raw_version) if self.raw_version else self.version
+
+    def build_number(self) -> Optional[int]:
+        rendered = self.render(self.raw_build_number) if self.raw_build_number else "0"
+        return int(rendered) if rendered and rendered.isdigit() else None
+
+    def requirement_names(self, compilers: Optional[Dict[str, str]] = None,
+                          sections: Tuple[str, ...] = REQUIREMENT_SECTIONS) -> List[str]:
+        """
+        Return the package names required by the recipe (and its outputs) in the
+        given sections.
+
+        `compiler('lang')` requirements are resolved with `compilers` (language ->
+        package name, e.g. 'hip' -> 'hip-clang_linux-64') and ignored if missing;
+        `pin_subpackage`/`pin_compatible` resolve to the pinned package.
+        """
+        names = []
+        for section in sections:
+            for spec in self.requirements.get(section, []):
+                name = requirement_name(self, spec, compilers or {})
+                if name and name not in names:
+                    names.append(name)
+        return names
+
+    def write(self) -> None:
+        with self.path.open("w", encoding="utf-8") as handle:
+            handle.writelines(self.lines)
+
+
+def requirement_name(recipe: Recipe, spec: str, compilers: Dict[str, str]) -> Optional[str]:
+    """Return the package name of a raw requirement spec, or None if it cannot be resolved."""
+    function = TEMPLATE_FUNCTION_PATTERN.match(spec)
+    if function:
+        kind, argument = function.group(1), function.group(3)
+        if kind == "compiler":
+            return compilers.get(argument)
+        if kind in ("pin_subpackage", "pin_compatible"):
+            # pin_subpackage(name) refers to the `name` variable when unquoted
+            return argument if function.group(2) else recipe.variables.get(argument)
+        return None
+    rendered = recipe.render(spec)
+    if not rendered:
+        return None
+    return rendered.split()[0]
+
+
+def indent_of(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def is_blank_or_comment(line: str) -> bool:
+    stripped = line.strip()
+    return not stripped or stripped.startswith("#")
+
+
+def value_span(line_idx: int, line: str, match: re.Match, group: int) -> Tuple[str, Span]:
+    """
+    Return the unquoted scalar of a regex group and its span, without quotes
+    and without a trailing `# comment`/selector.
+    """
+    start, end = match.start(group), match.end(group)
+    raw = line[start:end]
+    if raw[:1] in ('"', "'"):
+        closing = raw.find(raw[0], 1)
+        if closing > 0:
+            return raw[1:closing], (line_idx, start + 1, start + closing)
+    comment = re.search(r'\s+#', raw)
+    if comment:
+        end = start + comment.start()
+        raw = raw[:comment.start()]
+    return raw, (line_idx, start, end)
+
+
+def skip_condition(value: str, line: str) -> str:
+    """
+    Return the condition of a `skip:` value: the expression itself in recipe.yaml,
+    the selector of `skip: true  # [selector]` in meta.yaml.
+    """
+    selector = SELECTOR_PATTERN.search(line)
+    if value.lower() == "true":
+        return selector.group(1).strip() if selector else "True"
+    if value.lower() == "false":
+        return "False"
+    return value
+
+
+def track_structure(recipe: Recipe, stack: List[Tuple[int, str]], idx: int, line: str, indent: int) -> None:
+    """
+    Follow the nesting of mapping keys with `stack` and record the package/output
+    names, the requirement specs and the skip conditions of `line`.
+    """
+    key_match = KEY_PATTERN.match(line)
+    column = indent + len(key_match.group(2) or "") if key_match else indent
+    while stack and stack[-1][0] >= column:
+        stack.pop()
+    path = [key for _, key in stack]
+
+    if key_match:
+        key = key_match.group(3)
+        if key == "name" and key_match.group(4):
+            # package: name: / outputs: - name: / outputs: - package: name:
+            if path in (["package"], ["outputs"], ["outputs", "package"]):
+                recipe.raw_names.append(value_span(idx, line, key_match, 4)[0])
+        elif key == "version" and key_match.group(4) and path == ["package"]:
+            recipe.raw_version = value_span(idx, line, key_match, 4)[0]
+        elif key == "number" and key_match.group(4) and path == ["build"]:
+            recipe.raw_build_number = value_span(idx, line, key_match, 4)[0]
+        elif key == "skip" and key_match.group(4) and path == ["build"]:
+            value = value_span(idx, line, key_match, 4)[0]
+            recipe.skip_conditions.append(skip_condition(value, line))
+        stack.append((column, key))
+        return
+
+    if path == ["build", "skip"]:
+        item = LIST_ITEM_PATTERN.match(line)
+        if item:
+            recipe.skip_conditions.append(skip_condition(value_span(idx, line, item, 2)[0], line))
+        return
+
+    # Requirement spec: list item below requirements: build/host/run (or a then/else branch)
+    sections = [key for key in path if key in REQUIREMENT_SECTIONS]
+    if "requirements" not in path or not sections or path[-1] not in (sections[-1], "then", "else"):
+        return
+    item = LIST_ITEM_PATTERN.match(line)
+    if item:
+        value = value_span(idx, line, item, 2)[0]
+        recipe.requirements.setdefault(sections[-1], []).append(value)
+
+
+def parse_recipe(path: Path) -> Recipe:
+    """Read and scan a `meta.yaml` or `recipe.yaml` file in a single pass."""
+    with path.open("r", encoding="utf-8") as handle:
+        lines = handle.readlines()
+    recipe = Recipe(path=path, lines=lines)
+
+    section = None          # current top-level key
+    current: Optional[SourceEntry] = None
+    list_owner = None       # ('patches' | 'url', indent of the key) while reading a list
+    stack: List[Tuple[int, str]] = []   # (column, key) of the mapping keys enclosing the line
+    for idx, line in enumerate(lines):
+        if is_blank_or_comment(line):
+            continue
+
+        set_match = JINJA_SET_PATTERN.match(line)
+        if set_match:
+            recipe.variables[set_match.group(1)] = set_match.group(3)
+            recipe.variable_spans[set_match.group(1)] = (idx, set_match.start(3), set_match.end(3))
+            continue
+        if line.lstrip().startswith("{%"):
+            # Other Jinja statements do not change the structure we track
+            continue
+
+        indent = indent_of(line)
+        track_structure(recipe, stack, idx, line, indent)
+        if indent == 0 and not line.startswith("-"):
+            key_match = KEY_PATTERN.match(line)
+            section = key_match.group(3) if key_match else None
+            current = None
+            list_owner = None
+            if section != "source" or not key_match.group(4):
+                continue
+
+        if list_owner is not None:
+            item = LIST_ITEM_PATTERN.match(line)
+            if item and indent >= list_owner[1] and not KEY_PATTERN.match(item.group(2) + "\n"):
+                value, span = value_span(idx, line, item, 2)
+                if list_owner[0] == "patches" and current is not None:
+                    current.patches.append(value)
+                elif list_owner[0] == "url" and current is None:
+                    # Mirror list: the first url is the one used by the builders
+                    current = SourceEntry(url=value, url_span=span)
+                    recipe.sources.append(current)
+                continue
+            list_owner = None
+
+        key_match = KEY_PATTERN.match(line)
+        if key_match is None:
+            continue
+        key = key_match.group(3)
+        has_value = bool(key_match.group(4))
+
+        if section == "context" and has_value and indent > 0:
+            value, span = value_span(idx, line, key_match, 4)
+            recipe.variables[key] = value
+            recipe.variable_spans[key] = span
+        elif section == "source":
+            if key == "url":
+                if has_value:
+                    value, span = value_span(idx, line, key_match, 4)
+                    current = SourceEntry(url=value, url_span=span)
+                    recipe.sources.append(current)
+                else:
+                    current = None
+                    list_owner = ("url", indent)
+            elif key == "git" and has_value:
+                value, span = value_span(idx, line, key_match, 4)
+                current = SourceEntry(url=value, url_span=span, kind="git")
+                recipe.sources.append(current)
+            elif current is not None and key in ("tag", "rev", "branch") and has_value:
+                current.rev = value_span(idx, line, key_match, 4)[0]
+            elif current is not None and key == "sha256" and has_value:
+                current.sha256, current.sha256_span = value_span(idx, line, key_match, 4)
+            elif current is not None and key in ("folder", "target_directory") and has_value:
+                current.folder = value_span(idx, line, key_match, 4)[0]
+            elif current is not None and key == "patches":
+                if has_value:
+                    value = value_span(idx, line, key_match, 4)[0]
+                    current.patches.extend(p.strip() for p in value.strip("[]").split(",") if p.strip())
+                else:
+                    list_owner = ("patches", indent)
+    return recipe
+
+
+def recipe_files(recipe_dir: Path) -> List[Path]:
+    """Return the recipe files of a recipe directory (`meta.yaml` first)."""
+    return [p for p in (recipe_dir / "meta.yaml", recipe_dir / "recipe.yaml") if p.exists()]
+
+
+def recipe_packages(recipes_dir: Path) -> Dict[str, str]:
+    """Return the package name -> recipe directory name map of the recipes of `recipes_dir`."""
+    packages: Dict[str, str] = {}
+    for recipe_dir in sorted(p for p in recipes_dir.iterdir() if p.is_dir()):
+        for path in recipe_files(recipe_dir):
+            packages.setdefault(recipe_dir.name, recipe_dir.name)
+            for name in parse_recipe(path).package_names():
+                packages.setdefault(name, recipe_dir.name)
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the packages produced by the recipes of a directory")
+    parser.add_argument("--packages", type=Path, metavar="RECIPES_DIR", required=True,
+                        help="Directory of the recipes")
+    args = parser.parse_args()
+    print(json.dumps(recipe_packages(args.packages), indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -48,7 +48,7 @@ ln -sf -- "$HIPCXX" "$BUILD_PREFIX/bin/amdclang"
 # https://github.com/ROCm/Tensile/blob/e8a8999e0e7374aaae546a6d7cb703d9e06b0ebf/Tensile/Utilities/Toolchain.py#L147C58-L147C65
 # and https://github.com/traversaro/rock-the-conda/issues/3#issuecomment-3315983823
 cmake -GNinja ${CMAKE_ARGS} -DGPU_TARGETS=${AMDGPU_TARGETS_EXPANDED} -DCMAKE_C_COMPILER="$BUILD_PREFIX/bin/amdclang" -DCMAKE_CXX_COMPILER="$BUILD_PREFIX/bin/amdclang++" -DTensile_TEST_LOCAL_PATH=$(pwd)/tensile_local_copy -Bbuild -S.
-cmake --build ./build
+cmake --build ./build -j${CPU_COUNT}
 cmake --install ./build
 
 # Remove amdclang++ symlink to avoid to ship it
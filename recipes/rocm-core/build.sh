@@ -6,5 +6,5 @@
 #  * https://github.com/ROCm/rocm-core/blob/rocm-6.4.3/CMakeLists.txt#L63
 
 cmake -GNinja ${CMAKE_ARGS} -DROCM_VERSION=${PKG_VERSION} -Bbuild -S.
-cmake --build ./build
+cmake --build ./build -j${CPU_COUNT}
 cmake --install ./build
@@ -1,5 +1,5 @@
 #!/bin/bash
 
 cmake -GNinja ${CMAKE_ARGS} -DROCM_PATH=$BUILD_PREFIX -DBUILD_TESTING:BOOL=OFF -Bbuild -S.
-cmake --build ./build
+cmake --build ./build -j${CPU_COUNT}
 cmake --install ./build
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store of the source archives of the recipes.
+
+Archives are stored by sha256 (`<store>/<sha256[:2]>/<sha256>`), so a tarball
+is kept once whatever URL it was fetched from. bump_version.py adds every
+archive it downloads to hash it, and build_all.py serves the store to the
+builders as a local mirror: before building, the archives of each recipe are
+linked into the source cache of its builder under the name the builder looks
+for, downloading the missing ones into the store first:
+
+    conda-build    <croot>/src_cache/<name>_<sha256[:10]><ext>
+    rattler-build  <output-dir>/src_cache/<name>_<sha256[:8]><ext>
+
+The builders check the sha256 of a cached archive as of a downloaded one, so a
+stale or unexpected file is just downloaded again; with a warm store the
+recipes are built without fetching their sources, also offline.
+
+The modification time of an archive records its last use: when the store grows
+above its maximum size, the least recently used archives are removed.
+
+    python recipes/source_store.py status
+    python recipes/source_store.py evict --max-gb 20
+"""
+
+import argparse
+import os
+import posixpath
+import re
+import shutil
+import sys
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+STORE_DIR_NAME = "sources"
+DEFAULT_MAX_GB = 50.0
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+# conda_build.utils.ext_re, used by append_hash_to_fn()
+CONDA_BUILD_EXTENSION_PATTERN = re.compile(r'(.*?)(\.(?:tar\.)?[^.]+)$')
+
+
+def cache_name(builder: str, url: str, sha256: str) -> Optional[str]:
+    """Return the file name of the archive of `url` in the source cache of `builder`."""
+    if builder == "conda-build":
+        # basename of the url, with the hash appended before the extension
+        filename = posixpath.basename(url)
+        if not filename:
+            return None
+        return CONDA_BUILD_EXTENSION_PATTERN.sub(rf"\1_{sha256[:10]}\2", filename)
+    segments = [s for s in urllib.parse.urlparse(url).path.split("/") if s]
+    if not segments:
+        return None
+    filename = segments[-1]
+    stem, extension = posixpath.splitext(filename)
+    if stem.endswith(".tar"):
+        stem, extension = stem[:-len(".tar")], ".tar" + extension
+    return f"{stem}_{sha256[:8]}{extension}"
+
+
+def link_file(source: Path, target: Path) -> None:
+    """Hard link `source` to `target` (copying across file systems), atomically."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+@dataclass
+class SourceStore:
+    root: Path
+    # Size above which the least recently used archives are evicted (None: unbounded)
+    max_bytes: Optional[int] = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    def get(self, sha256: str) -> Optional[Path]:
+        """Return the archive with `sha256` (marking it as used), or None if not stored."""
+        path = self.path(sha256)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def add(self, path: Path, sha256: str) -> Path:
+        """Move the file at `path`, whose content has `sha256`, into the store."""
+        target = self.path(sha256)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{sha256}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.move(str(path), str(tmp_path))
+        os.replace(tmp_path, target)
+        os.utime(target)
+        self.evict()
+        return target
+
+    def entries(self) -> List[Tuple[Path, int, float]]:
+        """Return the (path, size, last use) of the stored archives, least recently used first."""
+        entries = []
+        for path in self.root.glob("??/*"):
+            if not SHA256_PATTERN.match(path.name):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, max_bytes: Optional[int] = None) -> List[Path]:
+        """Remove the least recently used archives until the store fits in `max_bytes`."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return []
+        removed = []
+        with self.lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= max_bytes:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed.append(path)
+        for path in removed:
+            print(f"Evicted {path.name} from the source store", flush=True)
+        return removed
+
+    def seed(self, sha256: str, url: str, builder: str, cache_dir: Path) -> Optional[Path]:
+        """
+        Link the stored archive with `sha256` into the source cache of `builder`,
+        under the name it gives to the archive of `url`. Returns the cache file,
+        or None if the archive is not stored.
+        """
+        blob = self.get(sha256)
+        name = cache_name(builder, url, sha256)
+        if blob is None or name is None:
+            return None
+        target = cache_dir / name
+        if not target.exists():
+            link_file(blob, target)
+        return target
+
+
+def size_bytes(gb: Optional[float]) -> Optional[int]:
+    return None if gb is None else int(gb * 1024 ** 3)
+
+
+def main() -> None:
+    # Imported here, as bump_version.py imports this module
+    from bump_version import default_cache_dir
+
+    parser = argparse.ArgumentParser(description="Inspect and trim the source archive store")
+    parser.add_argument("--store-dir", type=Path, default=default_cache_dir() / STORE_DIR_NAME,
+                        help="Directory of the source store (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Print the archives of the store, most recently used first")
+    evict_parser = subparsers.add_parser("evict", help="Remove the least recently used archives")
+    evict_parser.add_argument("--max-gb", type=float, default=DEFAULT_MAX_GB,
+                              help="Size to trim the store to, in GB (default: %(default)s)")
+    args = parser.parse_args()
+
+    store = SourceStore(args.store_dir)
+    if args.command == "evict":
+        removed = store.evict(size_bytes(args.max_gb))
+        print(f"Removed {len(removed)} archives")
+        return
+    entries = store.entries()
+    for path, size, used in reversed(entries):
+        print(f"  {path.name}  {size / 1024 ** 2:10.1f} MB  "
+              f"last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}")
+    total = sum(size for _, size, _ in entries)
+    print(f"{len(entries)} archives, {total / 1024 ** 3:.2f} GB in {store.root}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -1,16 +1,131 @@
 #!/usr/bin/env python3
 """
 Upload all conda packages from output/linux-64/ directory to prefix.dev
+
+Packages are uploaded concurrently (--jobs) with `pixi upload`. Transient
+failures (network errors, 5xx and 429 answers) are retried with exponential
+backoff, the other ones (e.g. authentication) fail at once, and a package the
+channel already has counts as uploaded. A local manifest records the sha256 of
+every file already uploaded to a channel, so unchanged artifacts are skipped
+without spawning any process.
 """
 
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import shutil
 import subprocess
 import sys
+import time
 from pathlib import Path
+from typing import Dict, Tuple
+
+DEFAULT_UPLOAD_URL = "https://prefix.dev/api/v1/upload/rock-the-conda"
+CHUNK_SIZE = 1 << 20
+# Errors of `pixi upload` worth retrying: server errors, rate limiting and network failures
+TRANSIENT_ERROR_PATTERN = re.compile(
+    r'\b(5\d\d|429)\b|timed? ?out|connection|error sending request|temporar|dns', re.IGNORECASE)
+# The channel already has a package with this file name
+EXISTS_ERROR_PATTERN = re.compile(r'already exists|\b409\b', re.IGNORECASE)
+
+
+def file_sha256(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def load_manifest(path: Path) -> Dict[str, Dict[str, Dict[str, object]]]:
+    """Load the upload url -> filename -> {sha256, size, mtime} manifest."""
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable manifest {path}: {e}")
+        return {}
+
+
+def save_manifest(path: Path, manifest: Dict[str, Dict[str, Dict[str, object]]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def package_record(package: Path, previous: Dict[str, object]) -> Dict[str, object]:
+    """Return the {sha256, size, mtime} record of a package, reusing the hash if the file is unchanged."""
+    stat = package.stat()
+    if previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime_ns:
+        sha256 = previous["sha256"]
+    else:
+        sha256 = file_sha256(package)
+    return {"sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def upload_package(package: Path, upload_url: str, retries: int, backoff: float) -> Tuple[str, float, str]:
+    """
+    Upload a package with `pixi upload`, retrying transient failures up to
+    `retries` times.
+
+    Returns (outcome, elapsed seconds, error message of the last attempt), the
+    outcome being "uploaded", "exists" (already on the channel) or "failed".
+    """
+    start = time.perf_counter()
+    error = ""
+    for attempt in range(retries + 1):
+        if attempt:
+            delay = backoff * 2 ** (attempt - 1)
+            print(f"  retrying {package.name} in {delay:.1f}s (attempt {attempt + 1}/{retries + 1})")
+            time.sleep(delay)
+        try:
+            result = subprocess.run(
+                ["pixi", "upload", upload_url, str(package)],
+                check=True,
+                capture_output=True,
+                text=True
+            )
+            if result.stdout:
+                print(result.stdout)
+            return "uploaded", time.perf_counter() - start, ""
+        except subprocess.CalledProcessError as e:
+            error = e.stderr or str(e)
+            output = f"{e.stdout or ''}\n{error}"
+            if EXISTS_ERROR_PATTERN.search(output):
+                return "exists", time.perf_counter() - start, ""
+            if not TRANSIENT_ERROR_PATTERN.search(output):
+                break
+    return "failed", time.perf_counter() - start, error
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Upload all the built conda packages to prefix.dev")
+    parser.add_argument("--output-dir", type=Path, default=Path("./output/linux-64"),
+                        help="Directory containing the .conda packages (default: %(default)s)")
+    parser.add_argument("--upload-url", default=DEFAULT_UPLOAD_URL,
+                        help="Upload URL of the channel (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=4,
+                        help="Number of concurrent uploads (default: %(default)s)")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="Number of retries of a failed upload (default: %(default)s)")
+    parser.add_argument("--backoff", type=float, default=5.0,
+                        help="Delay before the first retry in seconds, doubled at each retry (default: %(default)s)")
+    parser.add_argument("--manifest", type=Path,
+                        help="Manifest of the already uploaded packages (default: <output-dir>/../upload_manifest.json)")
+    parser.add_argument("--force", action="store_true",
+                        help="Upload all the packages, even the ones recorded in the manifest")
+    args = parser.parse_args()
+
     # Define the output directory
-    output_dir = Path("./output/linux-64")
+    output_dir = args.output_dir
+    manifest_path = args.manifest or output_dir.parent / "upload_manifest.json"
     
     # Check if directory exists
     if not output_dir.exists():
@@ -18,43 +133,72 @@ def main():
         sys.exit(1)
     
     # Find all .conda files
-    conda_packages = list(output_dir.glob("*.conda"))
+    conda_packages = sorted(output_dir.glob("*.conda"))
     
     if not conda_packages:
         print(f"No .conda packages found in {output_dir}")
         sys.exit(0)
-    
-    print(f"Found {len(conda_packages)} packages to upload")
-    
-    # Upload URL
-    upload_url = "https://prefix.dev/api/v1/upload/rock-the-conda"
-    
-    # Upload each package
+
+    # Skip the packages already uploaded to this channel with the same content
+    manifest = load_manifest(manifest_path)
+    uploaded = manifest.setdefault(args.upload_url, {})
+    records = {}
+    to_upload = []
+    for package in conda_packages:
+        records[package.name] = package_record(package, uploaded.get(package.name, {}))
+        previous = uploaded.get(package.name)
+        if not args.force and previous and previous.get("sha256") == records[package.name]["sha256"]:
+            print(f"= Skipping {package.name}: already uploaded")
+            continue
+        to_upload.append(package)
+
+    print(f"Found {len(conda_packages)} packages, {len(to_upload)} to upload")
+    if not to_upload:
+        print("All packages are already uploaded!")
+        sys.exit(0)
+
+    if shutil.which("pixi") is None:
+        print("Error: 'pixi' command not found. Please ensure pixi is installed and in PATH")
+        sys.exit(1)
+
+    # Upload the packages concurrently
     failed_uploads = []
-    for i, package in enumerate(conda_packages, 1):
-        print(f"\n[{i}/{len(conda_packages)}] Uploading {package.name}...")
-        
-        try:
-            result = subprocess.run(
-                ["pixi", "upload", upload_url, str(package)],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            print(f"✓ Successfully uploaded {package.name}")
-            if result.stdout:
-                print(result.stdout)
-        except subprocess.CalledProcessError as e:
-            print(f"✗ Failed to upload {package.name}")
-            print(f"Error: {e.stderr}")
-            failed_uploads.append(package.name)
-        except FileNotFoundError:
-            print("Error: 'pixi' command not found. Please ensure pixi is installed and in PATH")
-            sys.exit(1)
+    timings = {}
+    uploaded_bytes = 0
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {
+            executor.submit(upload_package, package, args.upload_url, args.retries, args.backoff): package
+            for package in to_upload
+        }
+        for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            package = futures[future]
+            outcome, elapsed, error = future.result()
+            timings[package.name] = elapsed
+            if outcome == "exists":
+                print(f"= [{i}/{len(to_upload)}] {package.name} is already on the channel")
+                uploaded[package.name] = records[package.name]
+                save_manifest(manifest_path, manifest)
+            elif outcome == "uploaded":
+                print(f"✓ [{i}/{len(to_upload)}] Successfully uploaded {package.name} in {elapsed:.1f}s")
+                uploaded[package.name] = records[package.name]
+                uploaded_bytes += records[package.name]["size"]
+                save_manifest(manifest_path, manifest)
+            else:
+                print(f"✗ [{i}/{len(to_upload)}] Failed to upload {package.name}")
+                print(f"Error: {error}")
+                failed_uploads.append(package.name)
+    wall_time = time.perf_counter() - start
     
     # Summary
     print("\n" + "="*60)
-    print(f"Upload complete: {len(conda_packages) - len(failed_uploads)}/{len(conda_packages)} successful")
+    print(f"Upload complete: {len(to_upload) - len(failed_uploads)}/{len(to_upload)} successful, "
+          f"{len(conda_packages) - len(to_upload)} skipped")
+    throughput = uploaded_bytes / wall_time if wall_time > 0 else 0.0
+    print(f"Uploaded {uploaded_bytes / 1e6:.1f} MB in {wall_time:.1f}s ({throughput / 1e6:.2f} MB/s)")
+    print("Per-package upload time:")
+    for name, elapsed in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        print(f"  {elapsed:8.1f}s  {name}")
     
     if failed_uploads:
         print(f"\nFailed uploads ({len(failed_uploads)}):")
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Render the variant matrix of the recipes once and prune the skipped variants.
+
+conda-build and rattler-build expand the variant matrix of a recipe from the
+`conda_build_config.yaml` files (conda-forge pinnings, recipes/, the recipe
+directory) at the start of every invocation, render and solve every variant,
+and only then discard the ones that `build: skip:` excludes. This module
+expands the matrix of each recipe over the variant keys it actually uses
+(unpinned build/host requirements, compilers, template and skip variables),
+evaluates the skip conditions for the target platform, and writes an explicit
+variant config per recipe with only the surviving values, passed to the
+builders with `-m`. Variants whose skip condition cannot be evaluated are kept.
+
+The rendered matrices are cached in output/variants/, keyed by a fingerprint of
+the recipe directory, of the variant config files and of the environment
+variables their selectors read (e.g. `os.environ.get("CF_CUDA_ENABLED")`).
+
+    python recipes/variants.py                 # report kept/skipped variants of all recipes
+    python recipes/variants.py rocfft hip      # of some recipes
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from recipe_fingerprint import normalize, recipe_fingerprint
+from recipe_model import SELECTOR_PATTERN, Recipe, parse_recipe, recipe_files
+
+RECIPES_DIR = Path(__file__).resolve().parent
+REPO_DIR = RECIPES_DIR.parent
+DEFAULT_CONFIG_FILES = [
+    REPO_DIR / "conda_forge_pinnings" / "conda_build_config.yaml",
+    RECIPES_DIR / "conda_build_config.yaml",
+]
+DEFAULT_OUTPUT_DIR = REPO_DIR / "output" / "variants"
+INDEX_FILE = "index.json"
+
+TOP_LEVEL_KEY_PATTERN = re.compile(r'^([A-Za-z_][\w.-]*):\s*(.*?)\s*$')
+ITEM_PATTERN = re.compile(r'^(\s*)-\s*(.*?)\s*$')
+TEMPLATE_PATTERN = re.compile(r'\{\{(.*?)\}\}|\{%(.*?)%\}', re.DOTALL)
+IDENTIFIER_PATTERN = re.compile(r'(?<![\w.\'"])([A-Za-z_]\w*)(?![\w\'"(])')
+FUNCTION_PATTERN = re.compile(r'\b(compiler|stdlib)\(\s*["\'](\w+)["\']')
+# Environment variables read by selectors and templates: os.environ.get("X"), os.getenv("X"), env.get("X")
+ENVIRON_PATTERN = re.compile(r'\b(?:environ\.get\(|environ\[|getenv\(|env\.get\(|env\.exists\()\s*["\'](\w+)["\']')
+
+
+@dataclass
+class VariantMatrix:
+    recipe: str
+    keys: List[str] = field(default_factory=list)               # used variant keys with values
+    variants: List[Dict[str, str]] = field(default_factory=list)
+    skipped: List[Tuple[Dict[str, str], str]] = field(default_factory=list)   # (variant, condition)
+    pruned: Dict[str, List[str]] = field(default_factory=dict)  # explicit config of the kept variants
+
+
+def platform_namespace(subdir: str) -> Dict[str, object]:
+    """Return the selector variables of a conda subdir (e.g. linux-64)."""
+    platform, _, arch = subdir.partition("-")
+    machine = {"64": "x86_64", "aarch64": "aarch64", "ppc64le": "ppc64le", "arm64": "arm64",
+               "armv7l": "armv7l", "32": "x86"}.get(arch, arch)
+    namespace: Dict[str, object] = {
+        "linux": platform == "linux", "osx": platform == "osx", "win": platform == "win",
+        "unix": platform in ("linux", "osx"),
+        "x86_64": machine == "x86_64", "x86": machine in ("x86", "x86_64"),
+        "aarch64": machine == "aarch64", "arm64": machine == "arm64",
+        "ppc64le": machine == "ppc64le", "armv7l": machine == "armv7l",
+        "linux64": subdir == "linux-64", "win64": subdir == "win-64",
+        "os": SimpleNamespace(environ=dict(os.environ), getenv=os.environ.get),
+        "None": None, "true": True, "false": False,
+    }
+    return namespace
+
+
+def evaluate(expression: str, namespace: Dict[str, object]) -> Optional[bool]:
+    """Evaluate a selector or skip expression, returning None if it cannot be evaluated."""
+    try:
+        return bool(eval(expression, {"__builtins__": {}}, dict(namespace)))
+    except Exception:
+        return None
+
+
+def selected(line: str, namespace: Dict[str, object]) -> bool:
+    """Whether the `# [selector]` of a config line (if any) is true."""
+    selector = SELECTOR_PATTERN.search(line)
+    return selector is None or evaluate(selector.group(1), namespace) is True
+
+
+def scalar(text: str) -> str:
+    text = re.sub(r'(^|\s+)#.*$', '', text).strip()
+    if text[:1] in ('"', "'") and text[-1:] == text[:1]:
+        return text[1:-1]
+    return text
+
+
+def read_variant_config(path: Path, namespace: Dict[str, object]) -> Tuple[Dict[str, List[str]], List[List[str]]]:
+    """
+    Read the list-valued keys and the zip_keys of a conda_build_config.yaml,
+    keeping only the entries whose selector is true on the target platform.
+    """
+    values: Dict[str, List[str]] = {}
+    zip_keys: List[List[str]] = []
+    if not path.exists():
+        return values, zip_keys
+    key = None
+    group: Optional[List[str]] = None
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            top = TOP_LEVEL_KEY_PATTERN.match(line)
+            if top:
+                key = top.group(1) if selected(line, namespace) else None
+                group = None
+                if key and key != "zip_keys":
+                    inline = scalar(top.group(2))
+                    values[key] = [inline] if inline else []
+                continue
+            item = ITEM_PATTERN.match(line)
+            if key is None or item is None or not selected(line, namespace):
+                continue
+            value = scalar(item.group(2))
+            if key != "zip_keys":
+                values[key].append(value)
+            elif value.startswith("["):
+                zip_keys.append([scalar(v) for v in value.strip("[]").split(",") if v.strip()])
+            elif not value:
+                group = []
+                zip_keys.append(group)
+            elif group is not None:
+                group.append(value)
+    return {k: v for k, v in values.items() if v}, zip_keys
+
+
+def merged_config(config_files: List[Path], namespace: Dict[str, object]) -> Tuple[Dict[str, List[str]], List[List[str]]]:
+    """Merge variant config files, later files overriding the keys of the previous ones."""
+    values: Dict[str, List[str]] = {}
+    zip_keys: List[List[str]] = []
+    for path in config_files:
+        file_values, file_zip_keys = read_variant_config(path, namespace)
+        values.update(file_values)
+        for group in file_zip_keys:
+            if group and group not in zip_keys:
+                zip_keys.append(group)
+    return values, zip_keys
+
+
+def used_keys(recipe: Recipe, files: List[Path]) -> List[str]:
+    """
+    Return the (normalized) variant keys a recipe can use: unpinned build/host
+    requirements, compiler/stdlib keys, and the variables of its templates,
+    selectors and skip conditions.
+    """
+    keys = set()
+    for section in ("build", "host"):
+        for spec in recipe.requirements.get(section, []):
+            if "{{" not in spec and len(spec.split()) == 1:
+                keys.add(normalize(spec))
+    expressions = list(recipe.skip_conditions)
+    for path in files:
+        text = path.read_text(encoding="utf-8", errors="replace")
+        for kind, language in FUNCTION_PATTERN.findall(text):
+            keys.update((f"{language}_{kind}", f"{language}_{kind}_version"))
+        expressions.extend(a or b for a, b in TEMPLATE_PATTERN.findall(text))
+        expressions.extend(m.group(1) for m in map(SELECTOR_PATTERN.search, text.splitlines()) if m)
+    for expression in expressions:
+        keys.update(normalize(name) for name in IDENTIFIER_PATTERN.findall(expression))
+    return sorted(keys)
+
+
+def expand(keys: List[str], values: Dict[str, List[str]], zip_keys: List[List[str]]) -> List[List[Dict[str, str]]]:
+    """
+    Return the dimensions of the matrix: one per zip group (or single key) used
+    by the recipe, each a list of the {key: value} entries it can take.
+    """
+    normalized = {normalize(k): k for k in values}
+    used = [normalized[k] for k in keys if k in normalized]
+    dimensions = []
+    zipped = set()
+    for group in zip_keys:
+        members = [k for k in group if k in values]
+        if not any(k in used for k in members):
+            continue
+        size = min(len(values[k]) for k in members if k in used)
+        members = [k for k in members if len(values[k]) >= size]
+        dimensions.append([{k: values[k][i] for k in members} for i in range(size)])
+        zipped.update(members)
+    for key in used:
+        if key not in zipped:
+            dimensions.append([{key: value} for value in values[key]])
+    return dimensions
+
+
+def render_matrix(name: str, recipe: Recipe, files: List[Path], config_files: List[Path],
+                  subdir: str) -> VariantMatrix:
+    namespace = platform_namespace(subdir)
+    values, zip_keys = merged_config(config_files, namespace)
+    dimensions = expand(used_keys(recipe, files), values, zip_keys)
+    matrix = VariantMatrix(recipe=name, keys=sorted({k for d in dimensions for entry in d for k in entry}))
+
+    kept_entries: List[set] = [set() for _ in dimensions]
+    for indices in itertools.product(*(range(len(d)) for d in dimensions)):
+        variant: Dict[str, str] = {}
+        for dimension, i in zip(dimensions, indices):
+            variant.update(dimension[i])
+        scope = dict(namespace)
+        scope.update(variant)
+        reason = next((c for c in recipe.skip_conditions if evaluate(c, scope) is True), None)
+        if reason is not None:
+            matrix.skipped.append((variant, reason))
+            continue
+        matrix.variants.append(variant)
+        for kept, i in zip(kept_entries, indices):
+            kept.add(i)
+
+    # Only the values used by a kept variant are handed to the builders
+    for dimension, kept in zip(dimensions, kept_entries):
+        if len(kept) == len(dimension) or not kept:
+            continue
+        for key in dimension[0]:
+            matrix.pruned[key] = [dimension[i][key] for i in sorted(kept)]
+    return matrix
+
+
+def write_pruned_config(path: Path, matrix: VariantMatrix) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as handle:
+        handle.write(f"# Variants of {matrix.recipe} kept after evaluating its skip conditions\n")
+        for key, values in sorted(matrix.pruned.items()):
+            handle.write(f"{key}:\n")
+            for value in values:
+                handle.write(f"  - {json.dumps(value)}\n")
+
+
+def environment_values(paths: List[Path]) -> List[Tuple[str, Optional[str]]]:
+    """Return the value of the environment variables that the files at `paths` read."""
+    names = set()
+    for path in paths:
+        if path.exists():
+            names.update(ENVIRON_PATTERN.findall(path.read_text(encoding="utf-8", errors="replace")))
+    return [(name, os.environ.get(name)) for name in sorted(names)]
+
+
+def render_variants(recipe_dirs: Dict[str, Path], config_files: List[Path], subdir: str,
+                    output_dir: Path = DEFAULT_OUTPUT_DIR) -> Dict[str, Tuple[VariantMatrix, Optional[Path]]]:
+    """
+    Render (or load from the cache) the variant matrix of each recipe directory.
+
+    Returns recipe name -> (matrix, path of the pruned variant config or None if
+    nothing has to be pruned).
+    """
+    index_path = output_dir / INDEX_FILE
+    try:
+        with index_path.open("r", encoding="utf-8") as handle:
+            index = json.load(handle)
+    except (OSError, ValueError):
+        index = {}
+
+    results = {}
+    changed = False
+    for name, recipe_dir in sorted(recipe_dirs.items()):
+        files = recipe_files(recipe_dir)
+        local_config = recipe_dir / "conda_build_config.yaml"
+        configs = config_files + ([local_config] if local_config.exists() else [])
+        environment = environment_values(files + configs)
+        fingerprint = recipe_fingerprint(recipe_dir, configs, {}, extra=f"{subdir} {environment}")
+        cached = index.get(name)
+        stale = not cached or cached.get("fingerprint") != fingerprint
+        if not stale:
+            matrix = VariantMatrix(recipe=name, keys=cached["keys"], variants=cached["variants"],
+                                   skipped=[tuple(s) for s in cached["skipped"]], pruned=cached["pruned"])
+        else:
+            matrix = render_matrix(name, parse_recipe(files[0]), files, configs, subdir)
+            index[name] = {"fingerprint": fingerprint, "keys": matrix.keys, "variants": matrix.variants,
+                           "skipped": matrix.skipped, "pruned": matrix.pruned}
+            changed = True
+        config_path = output_dir / f"{name}.yaml"
+        if matrix.pruned and (stale or not config_path.exists()):
+            write_pruned_config(config_path, matrix)
+        results[name] = (matrix, config_path if matrix.pruned else None)
+
+    if changed:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            json.dump(index, handle, indent=1, sort_keys=True)
+        os.replace(tmp_path, index_path)
+    return results
+
+
+def describe(variant: Dict[str, str], keys: List[str]) -> str:
+    return ", ".join(f"{k}={variant[k]}" for k in keys if k in variant) or "(single variant)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the variant matrix of the recipes and report the skipped variants")
+    parser.add_argument("recipes", nargs="*", help="Recipes (directory names) to render (default: all)")
+    parser.add_argument("--subdir", default="linux-64", help="Target subdir (default: %(default)s)")
+    parser.add_argument("-m", "--variant-config", dest="configs", type=Path, action="append",
+                        help="Variant config files, in order (default: the conda-forge pinnings and recipes/conda_build_config.yaml)")
+    parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR,
+                        help="Directory of the cached matrices and pruned variant configs (default: %(default)s)")
+    args = parser.parse_args()
+
+    recipe_dirs = {p.name: p for p in sorted(RECIPES_DIR.iterdir()) if p.is_dir() and recipe_files(p)}
+    unknown = [r for r in args.recipes if r not in recipe_dirs]
+    if unknown:
+        print(f"Error: unknown recipe(s): {', '.join(unknown)}")
+        sys.exit(1)
+    if args.recipes:
+        recipe_dirs = {name: recipe_dirs[name] for name in args.recipes}
+
+    results = render_variants(recipe_dirs, args.configs or DEFAULT_CONFIG_FILES, args.subdir, args.output_dir)
+    total_kept = total_skipped = 0
+    for name, (matrix, config_path) in results.items():
+        total_kept += len(matrix.variants)
+        total_skipped += len(matrix.skipped)
+        print(f"{name}: {len(matrix.variants)} variant(s) kept, {len(matrix.skipped)} skipped"
+              + (f" -> {config_path}" if config_path else ""))
+        # Only show the keys that differ between the variants
+        every = matrix.variants + [variant for variant, _ in matrix.skipped]
+        varying = [k for k in matrix.keys if len({variant.get(k) for variant in every}) > 1]
+        for variant in matrix.variants:
+            print(f"  + {describe(variant, varying)}")
+        for variant, condition in matrix.skipped:
+            print(f"  - {describe(variant, varying)}  (skip: {condition})")
+    print(f"\n{total_kept} variant(s) to build, {total_skipped} skipped on {args.subdir}")
+
+
+if __name__ == "__main__":
+    main()
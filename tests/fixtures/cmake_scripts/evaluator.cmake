@@ -0,0 +1,111 @@
+cmake_minimum_required(VERSION 3.25)
+set(L a b;c "d;e" "")
+message("1 ${L}")
+list(LENGTH L n)
+message("2 ${n}")
+set(E "")
+list(APPEND E x)
+list(APPEND E "" y)
+message("3 ${E}")
+list(REMOVE_ITEM E "")
+message("4 ${E}")
+set(S "Hello World")
+string(TOUPPER "${S}" U)
+string(REPLACE "o" "0" R ${S})
+string(REGEX REPLACE "([a-z]+)" "<\\1>" X "${S}")
+message("5 ${U} ${R} ${X}")
+string(REGEX MATCHALL "[A-Z]" M "${S}")
+message("6 ${M}")
+macro(m a)
+  message("7 ${a} ${ARGN} ${ARGC} ${ARGV1}")
+  if(a)
+    message("7b var a is true")
+  endif()
+endmacro()
+set(a "")
+m(x y z)
+function(f out)
+  set(${out} "v;${ARGN}" PARENT_SCOPE)
+  set(local 1)
+endfunction()
+f(res p q)
+message("8 ${res} [${local}]")
+set(V1 ON)
+set(NAME V)
+if(${NAME}1 AND NOT (V2 OR "V1"))
+  message("9 yes")
+else()
+  message("9 no")
+endif()
+if("abc" MATCHES "b(c)")
+  message("10 ${CMAKE_MATCH_0} ${CMAKE_MATCH_1}")
+endif()
+if(1.2.3 VERSION_LESS 1.10)
+  message("11 vless")
+endif()
+if(" " STREQUAL " ")
+  message("12 streq")
+endif()
+foreach(i RANGE 2 8 3)
+  message("13 ${i}")
+endforeach()
+foreach(i IN LISTS L ITEMS z)
+  if(i STREQUAL "c")
+    continue()
+  endif()
+  message("14 ${i}")
+endforeach()
+message("15 [${i}]")
+set(esc "a\;b")
+list(LENGTH esc n2)
+message("16 ${n2} ${esc}")
+set(nested_x "NX")
+set(k x)
+message("17 ${nested_${k}} \${notvar} $ENV{EXTRACT_DEPS_FIXTURE}")
+math(EXPR z "(7 + 3) / 3 * 2 - 1")
+message("18 ${z}")
+set(C "")
+if(C)
+ message("19 C true")
+elseif(DEFINED C)
+ message("19 C defined")
+endif()
+if(NOT_DEFINED_VAR)
+else()
+ message("20 undefined false")
+endif()
+if(TRUE AND OFF OR ON)
+ message("21 precedence")
+endif()
+list(FIND L d idx)
+list(GET L 0 -1 g)
+list(JOIN L "-" j)
+message("22 ${idx} ${g} ${j}")
+set(w 0)
+while(w LESS 3)
+  math(EXPR w "${w} + 1")
+endwhile()
+message("23 ${w}")
+string(SUBSTRING "abcdef" 2 -1 sub)
+string(FIND "abcabc" "c" pos REVERSE)
+message("24 ${sub} ${pos}")
+list(TRANSFORM L PREPEND "p_" OUTPUT_VARIABLE tl)
+list(FILTER tl INCLUDE REGEX "[ab]")
+message("25 ${tl}")
+set(q [=[raw ${x} "q"]=])
+message("26 ${q}")
+get_filename_component(fn "/a/b/c.tar.gz" NAME_WE)
+get_filename_component(fd "/a/b/c.tar.gz" DIRECTORY)
+get_filename_component(fe "/a/b/c.tar.gz" EXT)
+message("27 ${fn} ${fd} ${fe}")
+set_property(GLOBAL APPEND PROPERTY GP a)
+set_property(GLOBAL APPEND PROPERTY GP b)
+get_property(gp GLOBAL PROPERTY GP)
+message("28 ${gp}")
+if(DEFINED ENV{EXTRACT_DEPS_FIXTURE} AND COMMAND message AND NOT COMMAND nope)
+  message("29 env cmd")
+endif()
+set(lst "x;y")
+if(y IN_LIST lst)
+  message("30 inlist")
+endif()
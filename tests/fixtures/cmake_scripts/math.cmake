@@ -0,0 +1,8 @@
+cmake_minimum_required(VERSION 3.25)
+foreach(expression "(7 + 3) / 3 * 2 - 1" "010+1" "-7/2" "-7%2" "7/-2" "7%-2" "0x10 + 0X1f" "~5 & 0xff"
+                   "1 << 3 >> 1" "-(3+4)*2" "5 ^ 3 | 8" "9223372036854775807 + 1" "--3" "+-+2" " 12 "
+                   "-9223372036854775807-1" "1<<63" "1<<64" "-1>>1")
+  math(EXPR decimal "${expression}")
+  math(EXPR hexadecimal "${expression}" OUTPUT_FORMAT HEXADECIMAL)
+  message("[${expression}] ${decimal} ${hexadecimal}")
+endforeach()
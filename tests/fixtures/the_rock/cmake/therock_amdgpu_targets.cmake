@@ -0,0 +1,35 @@
+macro(therock_add_amdgpu_target target)
+  cmake_parse_arguments(_t "" "" "FAMILY;EXCLUDE_TARGET_PROJECTS" ${ARGN})
+  list(APPEND _therock_targets ${target})
+  foreach(_f ${_t_FAMILY} ${target})
+    list(APPEND _therock_family_${_f} ${target})
+  endforeach()
+  set(_therock_excludes_${target} ${_t_EXCLUDE_TARGET_PROJECTS})
+endmacro()
+
+therock_add_amdgpu_target(gfx1100 FAMILY dgpu-all gfx110X-all)
+therock_add_amdgpu_target(gfx1101 FAMILY dgpu-all gfx110X-all EXCLUDE_TARGET_PROJECTS hipBLASLt)
+therock_add_amdgpu_target(gfx942 FAMILY dcgpu-all gfx94X-dcgpu)
+therock_add_amdgpu_target(gfx90a FAMILY dcgpu-all gfx90X-dcgpu EXCLUDE_TARGET_PROJECTS hipBLASLt rocWMMA)
+
+function(therock_validate_amdgpu_targets)
+  set(_targets)
+  string(REPLACE "," ";" _families "${THEROCK_AMDGPU_FAMILIES}")
+  foreach(_family IN LISTS _families)
+    if(NOT DEFINED _therock_family_${_family})
+      message(FATAL_ERROR "Unknown AMDGPU family ${_family}")
+    endif()
+    list(APPEND _targets ${_therock_family_${_family}})
+  endforeach()
+  list(REMOVE_DUPLICATES _targets)
+  list(LENGTH _targets _count)
+  if(_count EQUAL 0)
+    message(FATAL_ERROR "No targets")
+  endif()
+  set(THEROCK_AMDGPU_TARGETS "${_targets}" PARENT_SCOPE)
+  set(_excluded)
+  foreach(_t ${_targets})
+    list(APPEND _excluded ${_therock_excludes_${_t}})
+  endforeach()
+  set(THEROCK_EXCLUDED_PROJECTS "${_excluded}" PARENT_SCOPE)
+endfunction()
@@ -0,0 +1,24 @@
+include_guard(GLOBAL)
+function(therock_add_feature feature_name)
+  cmake_parse_arguments(PARSE_ARGV 1 ARG "" "GROUP;DESCRIPTION" "REQUIRES")
+  string(TOUPPER "${ARG_GROUP}" _group)
+  set(_default "${THEROCK_ENABLE_${_group}}")
+  set(THEROCK_ENABLE_${feature_name} "${_default}" CACHE BOOL "${ARG_DESCRIPTION}")
+  set_property(GLOBAL APPEND PROPERTY THEROCK_ALL_FEATURES ${feature_name})
+  set_property(GLOBAL PROPERTY THEROCK_FEATURE_REQUIRES_${feature_name} ${ARG_REQUIRES})
+endfunction()
+
+function(therock_finalize_features)
+  get_property(_all GLOBAL PROPERTY THEROCK_ALL_FEATURES)
+  list(REVERSE _all)
+  foreach(_feature IN LISTS _all)
+    if(THEROCK_ENABLE_${_feature})
+      get_property(_requires GLOBAL PROPERTY THEROCK_FEATURE_REQUIRES_${_feature})
+      foreach(_r ${_requires})
+        if(NOT THEROCK_ENABLE_${_r})
+          set(THEROCK_ENABLE_${_r} ON CACHE BOOL "" FORCE)
+        endif()
+      endforeach()
+    endif()
+  endforeach()
+endfunction()
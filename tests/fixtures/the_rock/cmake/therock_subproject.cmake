@@ -0,0 +1,3 @@
+function(therock_cmake_subproject_declare name)
+  message(FATAL_ERROR "the real declare must be overridden")
+endfunction()
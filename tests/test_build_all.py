@@ -0,0 +1,189 @@
+"""
+Tests of the scheduling and rebuild decisions of recipes/build_all.py, with a
+stub builder instead of rattler-build.
+
+    python -m unittest discover -s tests
+"""
+
+import contextlib
+import io
+import os
+import stat
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "recipes"))
+
+from build_all import (RECIPES_DIR, BuildNode, compute_fingerprints, packages_exist,  # noqa: E402
+                       recipe_sources, recipe_status, schedule, topological_levels)
+from recipe_fingerprint import load_fingerprints, save_fingerprints  # noqa: E402
+
+BUILDER_ARGS = {"conda-build": [], "rattler-build": []}
+
+
+def make_nodes(deps):
+    """Return rattler-build nodes with the given recipe -> dependencies."""
+    return {name: BuildNode(name=name, recipe_dir=RECIPES_DIR / name, builder="rattler-build",
+                            deps=set(names), memory_gb=1.0, cpus=1)
+            for name, names in deps.items()}
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tmp_dir = Path(self.tmp.name)
+        self.record = self.tmp_dir / "builds.txt"
+
+    def stub_builder(self, failing=()):
+        """Write a builder that records the built recipes and fails for `failing`."""
+        path = self.tmp_dir / "rattler-build"
+        path.write_text(textwrap.dedent(f"""\
+            #!{sys.executable}
+            import sys
+            name = sys.argv[sys.argv.index("--recipe-dir") + 1].rsplit("/", 1)[-1]
+            with open({str(self.record)!r}, "a") as handle:
+                handle.write(name + "\\n")
+            sys.exit(1 if name in {sorted(failing)!r} else 0)
+            """))
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+        return {"conda-build": "conda-build", "rattler-build": str(path)}
+
+    def run_schedule(self, nodes, selected, jobs, failing=()):
+        executables = self.stub_builder(failing)
+        built_calls = []
+        result = schedule(nodes, selected, jobs, executables, BUILDER_ARGS, self.tmp_dir / "logs",
+                          memory_gb=64.0, cpus=8, on_built=built_calls.append)
+        order = self.record.read_text().split() if self.record.exists() else []
+        return result, order, built_calls
+
+    def test_dependencies_are_built_first(self):
+        nodes = make_nodes({"core": [], "hip": ["core"], "rocblas": ["hip"], "rocsolver": ["rocblas", "hip"],
+                            "rocrand": ["hip"]})
+        for jobs in (1, 3):
+            with self.subTest(jobs=jobs):
+                self.record.unlink(missing_ok=True)
+                (built, failed, skipped), order, built_calls = self.run_schedule(nodes, set(nodes), jobs)
+                self.assertEqual(sorted(built), sorted(nodes))
+                self.assertEqual((failed, skipped), ([], []))
+                self.assertEqual(sorted(order), sorted(nodes))
+                self.assertEqual(built_calls, built)
+                for name, node in nodes.items():
+                    for dep in node.deps:
+                        self.assertLess(order.index(dep), order.index(name), f"{dep} before {name}")
+
+    def test_dependents_of_failed_recipe_are_skipped(self):
+        nodes = make_nodes({"core": [], "hip": ["core"], "rocblas": ["hip"], "rocsolver": ["rocblas"],
+                            "hipblas": ["rocsolver", "rocblas"], "rocrand": ["hip"]})
+        (built, failed, skipped), order, built_calls = self.run_schedule(nodes, set(nodes), 2, failing={"rocblas"})
+        self.assertEqual(sorted(built), ["core", "hip", "rocrand"])
+        self.assertEqual(failed, ["rocblas"])
+        self.assertEqual(sorted(skipped), ["hipblas", "rocsolver"])
+        self.assertNotIn("rocsolver", order)
+        self.assertNotIn("hipblas", order)
+        self.assertNotIn("rocblas", built_calls)
+
+    def test_only_selected_dependencies_are_waited_for(self):
+        nodes = make_nodes({"core": [], "hip": ["core"]})
+        (built, failed, skipped), order, _ = self.run_schedule(nodes, {"hip"}, 1)
+        self.assertEqual((built, failed, skipped), (["hip"], [], []))
+        self.assertEqual(order, ["hip"])
+
+    def test_cycle_is_reported(self):
+        nodes = make_nodes({"a": ["b"], "b": ["a"]})
+        with self.assertRaises(SystemExit):
+            topological_levels(nodes, set(nodes))
+
+
+class RerunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tmp_dir = Path(self.tmp.name)
+        self.nodes = make_nodes({"core": [], "hip": ["core"], "rocblas": ["hip"], "rocrand": ["hip"]})
+        for name, node in self.nodes.items():
+            node.recipe_dir = self.tmp_dir / name
+            node.recipe_dir.mkdir()
+            (node.recipe_dir / "recipe.yaml").write_text(f"package:\n  name: {name}\n")
+        self.fingerprints_path = self.tmp_dir / "recipe_fingerprints.json"
+
+    def record_all(self):
+        compute_fingerprints(self.nodes, BUILDER_ARGS)
+        save_fingerprints(self.fingerprints_path, {name: node.fingerprint for name, node in self.nodes.items()})
+
+    def rerun_status(self, rebuild=False, built=None):
+        compute_fingerprints(self.nodes, BUILDER_ARGS)
+        return recipe_status(self.nodes, set(self.nodes), load_fingerprints(self.fingerprints_path), rebuild,
+                             built)
+
+    def test_new_recipes_are_built(self):
+        status = self.rerun_status()
+        self.assertEqual(set(status.values()), {"new"})
+        self.assertFalse(any(node.force for node in self.nodes.values()))
+
+    def test_rerun_does_nothing_when_up_to_date(self):
+        self.record_all()
+        status = self.rerun_status()
+        self.assertEqual(set(status.values()), {"up to date"})
+        up_to_date = {name for name, value in status.items() if value == "up to date"}
+        selected = set(self.nodes) - up_to_date
+        self.assertEqual(topological_levels(self.nodes, selected), [])
+        executables = {"conda-build": os.devnull, "rattler-build": os.devnull}
+        self.assertEqual(schedule(self.nodes, selected, 2, executables, BUILDER_ARGS, self.tmp_dir / "logs",
+                                  memory_gb=64.0, cpus=8), ([], [], []))
+        self.assertFalse((self.tmp_dir / "logs").exists())
+
+    def test_change_rebuilds_recipe_and_dependents(self):
+        self.record_all()
+        (self.nodes["hip"].recipe_dir / "build.sh").write_text("cmake --build build\n")
+        status = self.rerun_status()
+        self.assertEqual(status, {"core": "up to date", "hip": "changed", "rocblas": "changed",
+                                  "rocrand": "changed"})
+        self.assertTrue(self.nodes["rocblas"].force)
+        self.assertFalse(self.nodes["core"].force)
+
+    def test_deleted_packages_are_rebuilt(self):
+        variants = [{"target_platform": "linux-64"}]
+        records = []
+        for name, node in self.nodes.items():
+            node.packages, node.version, node.build_number = [name], "7.0.2", 0
+            records.append({"name": name, "version": "7.0.2", "build_number": 0, "variant": variants[0]})
+        self.record_all()
+        # The packages of hip were deleted from the channel, but not the fingerprints
+        records = [record for record in records if record["name"] != "hip"]
+        built = {name for name, node in self.nodes.items() if packages_exist(node, records, variants)}
+        status = self.rerun_status(built=built)
+        self.assertEqual(status, {"core": "up to date", "hip": "rebuild", "rocblas": "up to date",
+                                  "rocrand": "up to date"})
+        self.assertTrue(self.nodes["hip"].force)
+
+    def test_rebuild_forces_every_recipe(self):
+        self.record_all()
+        status = self.rerun_status(rebuild=True)
+        self.assertEqual(set(status.values()), {"rebuild"})
+        self.assertTrue(all(node.force for node in self.nodes.values()))
+
+
+class SourcesTest(unittest.TestCase):
+
+    def test_every_archive_source_renders(self):
+        for recipe_dir in sorted(p for p in RECIPES_DIR.iterdir() if p.is_dir()):
+            with self.subTest(recipe=recipe_dir.name):
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    recipe_sources(recipe_dir)
+                self.assertEqual(output.getvalue(), "")
+
+    def test_filters_are_rendered(self):
+        [(builder, url, _)] = recipe_sources(RECIPES_DIR / "llama.cpp")
+        self.assertEqual(builder, "rattler-build")
+        self.assertRegex(url, r"^https://github.com/ggml-org/llama.cpp/archive/b\d+.tar.gz$")
+
+
+if __name__ == "__main__":
+    unittest.main()
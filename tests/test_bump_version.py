@@ -0,0 +1,133 @@
+"""
+Tests of the resumable and conditional downloads of recipes/bump_version.py,
+against a local HTTP server with Range/If-Range and ETag support.
+
+    python -m unittest discover -s tests
+"""
+
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "recipes"))
+
+from bump_version import CHUNK_SIZE, download_and_hash, hash_urls  # noqa: E402
+from source_store import SourceStore  # noqa: E402
+
+PAYLOAD = os.urandom(3 * CHUNK_SIZE + 123)
+SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+ETAG = f'"{SHA256[:16]}"'
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Serve PAYLOAD, cutting the body of the next response in half if `server.truncate` is set."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == ETAG:
+            server.statuses.append(304)
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        start = 0
+        requested = self.headers.get("Range")
+        if requested and self.headers.get("If-Range") in (None, ETAG):
+            start = int(requested[len("bytes="):].rstrip("-"))
+        body = PAYLOAD[start:]
+        server.statuses.append(206 if start else 200)
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        self.end_headers()
+        if server.truncate:
+            server.truncate = False
+            body = body[:len(body) // 2]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+        self.server.requests, self.server.statuses, self.server.truncate = [], [], False
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/rocm-7.0.0.tar.gz"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tmp_dir = Path(self.tmp.name)
+        self.store = SourceStore(self.tmp_dir / "store")
+        # The progress messages of the downloads
+        self.output = io.StringIO()
+        stack = contextlib.ExitStack()
+        stack.enter_context(contextlib.redirect_stdout(self.output))
+        stack.enter_context(contextlib.redirect_stderr(self.output))
+        self.addCleanup(stack.close)
+
+    def test_interrupted_download_is_resumed(self):
+        partial_dir = self.tmp_dir / "partial"
+        self.server.truncate = True
+        with self.assertRaises(IOError):
+            download_and_hash(self.url, partial_dir, None, self.store)
+        [part] = partial_dir.glob("*.part")
+        offset = part.stat().st_size
+        self.assertGreater(offset, 0)
+
+        entry = download_and_hash(self.url, partial_dir, None, self.store)
+        self.assertEqual(entry["sha256"], SHA256)
+        self.assertEqual(entry["size"], len(PAYLOAD))
+        self.assertEqual(self.server.requests[-1]["Range"], f"bytes={offset}-")
+        self.assertEqual(self.server.requests[-1]["If-Range"], ETAG)
+        self.assertEqual(self.server.statuses, [200, 206])
+        self.assertEqual(list(partial_dir.iterdir()), [])
+        self.assertEqual(self.store.get(SHA256).read_bytes(), PAYLOAD)
+
+    def test_unchanged_source_is_revalidated(self):
+        cache_dir = self.tmp_dir / "cache"
+        cache = {}
+        self.assertEqual(hash_urls([self.url], cache, 1, cache_dir, source_store=self.store), [])
+        self.assertEqual(cache, {self.url: SHA256})
+
+        cache = {}
+        self.assertEqual(hash_urls([self.url], cache, 1, cache_dir, verify=True, source_store=self.store), [])
+        self.assertEqual(cache, {self.url: SHA256})
+        self.assertEqual(self.server.requests[-1]["If-None-Match"], ETAG)
+        self.assertEqual(self.server.statuses, [200, 304])
+        self.assertIn(f"Cached sha256 of {self.url} is still valid", self.output.getvalue())
+        self.assertEqual(self.store.get(SHA256).read_bytes(), PAYLOAD)
+
+    def test_cached_hash_is_used_without_request(self):
+        cache_dir = self.tmp_dir / "cache"
+        hash_urls([self.url], {}, 1, cache_dir)
+        cache = {}
+        self.assertEqual(hash_urls([self.url], cache, 1, cache_dir), [])
+        self.assertEqual(cache, {self.url: SHA256})
+        self.assertEqual(self.server.statuses, [200])
+
+    def test_downloads_are_kept_without_cache(self):
+        # As for the patch check of a bump with --no-cache, which reads the sources from the store
+        cache = {}
+        self.assertEqual(hash_urls([self.url], cache, 1, source_store=self.store), [])
+        self.assertEqual(cache, {self.url: SHA256})
+        self.assertEqual(self.store.get(SHA256).read_bytes(), PAYLOAD)
+        self.assertEqual(self.server.statuses, [200])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Regression tests of the CMake-free evaluator of extract_deps_fast.py, against
+outputs recorded with CMake: `cmake -P` on the scripts of fixtures/cmake_scripts
+and the CMake extraction of the TheRock-like tree fixtures/the_rock.
+
+    python -m unittest discover -s tests
+
+The outputs of the scripts were recorded with (evaluator.cmake reads
+EXTRACT_DEPS_FIXTURE):
+
+    EXTRACT_DEPS_FIXTURE=fixture cmake -P evaluator.cmake > evaluator.txt 2>&1
+"""
+
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+import extract_deps_fast as fast_engine  # noqa: E402
+from extract_the_rock_deps import diff_extractions, extract_deps_with_cmake  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+SCRIPTS_DIR = FIXTURES_DIR / "cmake_scripts"
+THE_ROCK_DIR = FIXTURES_DIR / "the_rock"
+# CMake extraction of THE_ROCK_DIR per AMDGPU family
+DEPS_DIR = FIXTURES_DIR / "the_rock_deps"
+# The fixture declares extra-proj after an execute_process(), which the evaluator skips
+KNOWN_DIFFERENCES = ["extra-proj: only declared by cmake"]
+
+
+def run_script(path):
+    """Run a CMake script with the evaluator, returning the lines of its message() calls."""
+    evaluator = fast_engine.Evaluator()
+    lines = []
+    evaluator.builtins['message'] = lambda command, scope: lines.append(''.join(evaluator.values(command, scope)))
+    with mock.patch.dict(os.environ, {"EXTRACT_DEPS_FIXTURE": "fixture"}):
+        evaluator.run(evaluator.parse_file(path), fast_engine.Scope({}))
+    return lines
+
+
+class ScriptTest(unittest.TestCase):
+
+    def test_scripts_match_cmake(self):
+        for path in sorted(SCRIPTS_DIR.glob("*.cmake")):
+            with self.subTest(script=path.name):
+                self.assertEqual(run_script(path), path.with_suffix(".txt").read_text().splitlines())
+
+    def test_bad_math_expressions_are_reported(self):
+        command = fast_engine.Command('math', [], Path("CMakeLists.txt"), 1)
+        for expression, reason in (("1/0", "divide by zero"), ("5 % (2 - 2)", "divide by zero"),
+                                   ("2**3", "syntax error"), ("1 +", "syntax error"),
+                                   ("(1", "syntax error"), ("1 2", "syntax error"),
+                                   ("0xFFFFFFFFFFFFFFFF", "out of range")):
+            with self.subTest(expression=expression):
+                pattern = f'math cannot .* "{re.escape(expression)}": .*{reason}'
+                with self.assertRaisesRegex(fast_engine.CMakeError, pattern):
+                    fast_engine.MathParser(expression, command).evaluate()
+
+
+class TheRockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.build_dir = Path(self.tmp.name)
+
+    def recorded(self):
+        for path in sorted(DEPS_DIR.glob("*.json")):
+            yield path.stem, [(name, deps) for name, deps in json.loads(path.read_text())]
+
+    def test_fast_engine_matches_recorded_cmake_extraction(self):
+        for family, expected in self.recorded():
+            with self.subTest(family=family):
+                pairs, evaluator = fast_engine.extract_declarations(THE_ROCK_DIR, family, binary_dir=self.build_dir)
+                self.assertEqual(diff_extractions(expected, pairs), KNOWN_DIFFERENCES)
+                self.assertEqual(list(evaluator.unsupported), ["execute_process()"])
+
+    @unittest.skipUnless(shutil.which("cmake"), "needs cmake")
+    def test_recorded_extraction_is_the_cmake_one(self):
+        for family, expected in self.recorded():
+            with self.subTest(family=family):
+                pairs = extract_deps_with_cmake(THE_ROCK_DIR, family, cache_dir=None,
+                                                build_dir=self.build_dir / family)
+                self.assertEqual(diff_extractions(expected, pairs), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Check that the pixi.lock files lock every conda dependency of their pixi.toml,
+since CI installs with `--locked` and rejects a lock file missing one of them.
+
+    python -m unittest discover -s tests
+"""
+
+import tomllib
+import unittest
+from pathlib import Path
+
+import yaml
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+WORKSPACES = [REPO_DIR, REPO_DIR / "examples" / "llama.cpp"]
+# Platforms of the pixi `target` selectors
+TARGET_PLATFORMS = {"unix": ("linux", "osx"), "linux": ("linux",), "osx": ("osx",), "win": ("win",)}
+
+
+def target_matches(selector, platform):
+    return selector == platform or platform.split("-")[0] in TARGET_PLATFORMS.get(selector, ())
+
+
+def feature_dependencies(feature, platform):
+    """Return the conda dependency names of a pixi.toml feature (or the workspace itself) on a platform."""
+    names = set(feature.get("dependencies", {}))
+    for selector, target in feature.get("target", {}).items():
+        if target_matches(selector, platform):
+            names.update(target.get("dependencies", {}))
+    return names
+
+
+def environment_dependencies(manifest, platform):
+    """Return environment name -> conda dependency names of a pixi.toml on a platform."""
+    features = manifest.get("feature", {})
+    environments = {"default": {"features": []}}
+    for name, environment in manifest.get("environments", {}).items():
+        environments[name] = environment if isinstance(environment, dict) else {"features": environment}
+    dependencies = {}
+    for name, environment in environments.items():
+        names = set()
+        if not environment.get("no-default-feature", False):
+            names |= feature_dependencies(manifest, platform)
+        for feature in environment.get("features", []):
+            names |= feature_dependencies(features.get(feature, {}), platform)
+        dependencies[name] = names
+    return dependencies
+
+
+def locked_packages(lock, environment, platform):
+    """Return the names of the conda packages of an environment of pixi.lock on a platform."""
+    names = set()
+    for entry in lock["environments"][environment]["packages"].get(platform, []):
+        if "conda" in entry:
+            names.add(entry["conda"].rsplit("/", 1)[-1].rsplit("-", 2)[0])
+    return names
+
+
+class PixiLockTest(unittest.TestCase):
+
+    def test_dependencies_are_locked(self):
+        for workspace in WORKSPACES:
+            with (workspace / "pixi.toml").open("rb") as handle:
+                manifest = tomllib.load(handle)
+            with (workspace / "pixi.lock").open("r", encoding="utf-8") as handle:
+                lock = yaml.safe_load(handle)
+            for platform in manifest["workspace"]["platforms"]:
+                for environment, names in environment_dependencies(manifest, platform).items():
+                    with self.subTest(workspace=workspace.name, environment=environment, platform=platform):
+                        missing = names - locked_packages(lock, environment, platform)
+                        self.assertFalse(missing, f"not in {workspace.name}/pixi.lock, run `pixi lock`")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Tests of the retries and of the manifest of recipes/upload_all.py, with a stub
+`pixi` instead of the real uploads.
+
+    python -m unittest discover -s tests
+"""
+
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+UPLOAD_SCRIPT = Path(__file__).resolve().parent.parent / "recipes" / "upload_all.py"
+# stderr of the stub `pixi upload` for each planned answer
+ANSWERS = {
+    "503": "Error: failed to upload: HTTP status server error (503 Service Unavailable)",
+    "401": "Error: failed to upload: HTTP status client error (401 Unauthorized)",
+    "exists": "Error: failed to upload: 409 Conflict, the package already exists",
+}
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tmp_dir = Path(self.tmp.name)
+        self.output_dir = self.tmp_dir / "output" / "linux-64"
+        self.output_dir.mkdir(parents=True)
+        self.manifest = self.tmp_dir / "output" / "upload_manifest.json"
+        self.calls = self.tmp_dir / "calls.txt"
+        self.plan = self.tmp_dir / "plan.json"
+        bin_dir = self.tmp_dir / "bin"
+        bin_dir.mkdir()
+        stub = bin_dir / "pixi"
+        stub.write_text(textwrap.dedent(f"""\
+            #!{sys.executable}
+            import json, sys
+            name = sys.argv[-1].rsplit("/", 1)[-1]
+            with open({str(self.calls)!r}, "a") as handle:
+                handle.write(name + "\\n")
+            with open({str(self.calls)!r}) as handle:
+                attempt = handle.read().split().count(name) - 1
+            with open({str(self.plan)!r}) as handle:
+                answers = json.load(handle).get(name, [])
+            answer = answers[attempt] if attempt < len(answers) else "ok"
+            if answer != "ok":
+                sys.exit({ANSWERS!r}[answer])
+            """))
+        stub.chmod(stub.stat().st_mode | stat.S_IXUSR)
+        self.env = {**os.environ, "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"}
+
+    def add_package(self, name):
+        (self.output_dir / name).write_bytes(name.encode())
+
+    def upload(self, plan):
+        """Run upload_all.py with the stub answers of `plan`, returning (exit status, calls by package)."""
+        self.plan.write_text(json.dumps(plan))
+        self.calls.write_text("")
+        result = subprocess.run([sys.executable, str(UPLOAD_SCRIPT), "--output-dir", str(self.output_dir),
+                                 "--retries", "3", "--backoff", "0"],
+                                env=self.env, capture_output=True, text=True)
+        calls = self.calls.read_text().split()
+        return result.returncode, {name: calls.count(name) for name in set(calls)}
+
+    def manifest_names(self):
+        return set(json.loads(self.manifest.read_text()).popitem()[1]) if self.manifest.exists() else set()
+
+    def test_transient_failure_is_retried(self):
+        self.add_package("rocblas-7.0.2-h0_0.conda")
+        status, calls = self.upload({"rocblas-7.0.2-h0_0.conda": ["503", "503", "ok"]})
+        self.assertEqual(status, 0)
+        self.assertEqual(calls, {"rocblas-7.0.2-h0_0.conda": 3})
+        self.assertEqual(self.manifest_names(), {"rocblas-7.0.2-h0_0.conda"})
+
+    def test_permanent_failure_is_not_retried(self):
+        self.add_package("rocblas-7.0.2-h0_0.conda")
+        self.add_package("rocfft-7.0.2-h0_0.conda")
+        status, calls = self.upload({"rocblas-7.0.2-h0_0.conda": ["401"]})
+        self.assertEqual(status, 1)
+        self.assertEqual(calls, {"rocblas-7.0.2-h0_0.conda": 1, "rocfft-7.0.2-h0_0.conda": 1})
+        self.assertEqual(self.manifest_names(), {"rocfft-7.0.2-h0_0.conda"})
+
+    def test_retries_are_bounded(self):
+        self.add_package("rocblas-7.0.2-h0_0.conda")
+        status, calls = self.upload({"rocblas-7.0.2-h0_0.conda": ["503"] * 10})
+        self.assertEqual(status, 1)
+        self.assertEqual(calls, {"rocblas-7.0.2-h0_0.conda": 4})
+        self.assertEqual(self.manifest_names(), set())
+
+    def test_existing_package_counts_as_uploaded(self):
+        self.add_package("rocblas-7.0.2-h0_0.conda")
+        status, calls = self.upload({"rocblas-7.0.2-h0_0.conda": ["exists"]})
+        self.assertEqual(status, 0)
+        self.assertEqual(calls, {"rocblas-7.0.2-h0_0.conda": 1})
+        self.assertEqual(self.manifest_names(), {"rocblas-7.0.2-h0_0.conda"})
+
+    def test_manifest_skips_uploaded_packages(self):
+        self.add_package("rocblas-7.0.2-h0_0.conda")
+        self.assertEqual(self.upload({})[0], 0)
+        self.add_package("rocfft-7.0.2-h0_0.conda")
+        status, calls = self.upload({})
+        self.assertEqual(status, 0)
+        self.assertEqual(calls, {"rocfft-7.0.2-h0_0.conda": 1})
+        # A rebuilt package has new content and is uploaded again
+        (self.output_dir / "rocblas-7.0.2-h0_0.conda").write_bytes(b"rebuilt")
+        self.assertEqual(self.upload({})[1], {"rocblas-7.0.2-h0_0.conda": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()